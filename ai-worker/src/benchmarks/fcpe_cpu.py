@@ -0,0 +1,94 @@
+"""Compare FCPE CPU backends (eager PyTorch, TorchScript, ONNX Runtime).
+
+Each backend runs the same fixed-shape synthetic chunks through
+``FcpeProcessor._infer_chunk``. Throughput is reported as frames/second
+and real-time factor; accuracy is the f0 difference from the first backend
+listed (eager PyTorch by default).
+
+    python -m src.benchmarks.fcpe_cpu --threads 1,4 --chunks 8
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+import torch
+from torchfcpe import spawn_bundled_infer_model
+
+from src.config import FCPE_CPU_CHUNK_SEC
+from src.processors.fcpe_cpu import FCPE_CPU_BACKENDS, apply_cpu_backend
+from src.processors.fcpe_processor import FcpeProcessor
+from src.utils.precision import synthetic_voice
+
+
+def _run_backend(backend: str, chunks: List[np.ndarray], warmup: int, threads: int) -> Dict:
+    processor = FcpeProcessor()
+    processor.device = "cpu"
+    model = spawn_bundled_infer_model(device="cpu")
+    # A fresh ONNX Runtime session per thread count; PyTorch's pool is set by the caller
+    compiled = apply_cpu_backend(model.model, lambda: processor._infer_chunk(model, chunks[0]), backend, threads=threads)
+    if backend != "torch" and compiled is None:
+        return {"backend": backend, "error": "not available"}
+
+    with torch.inference_mode():
+        for chunk in chunks[:warmup]:
+            processor._infer_chunk(model, chunk)
+        started = time.perf_counter()
+        outputs = [processor._infer_chunk(model, chunk) for chunk in chunks]
+        elapsed = time.perf_counter() - started
+
+    frames = sum(len(f0) for f0 in outputs)
+    audio_sec = sum(len(chunk) for chunk in chunks) / 16000
+    return {
+        "backend": backend,
+        "frames_per_sec": frames / elapsed,
+        "realtime_factor": audio_sec / elapsed,
+        "outputs": outputs,
+    }
+
+
+def _agreement(reference: List[np.ndarray], outputs: List[np.ndarray]) -> Dict:
+    reference, output = np.concatenate(reference), np.concatenate(outputs)
+    both = (reference > 0) & (output > 0)
+    cents = 1200 * np.abs(np.log2(output[both] / reference[both])) if both.any() else np.zeros(1)
+    return {
+        "voicing_agreement": float(np.mean((reference > 0) == (output > 0))),
+        "p95_cents": float(np.percentile(cents, 95)),
+        "max_cents": float(np.max(cents)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FCPE CPU backends on synthetic vocals.")
+    parser.add_argument("--backends", default=",".join(FCPE_CPU_BACKENDS), help="Comma-separated backends")
+    parser.add_argument("--threads", default="0", help="Comma-separated intra-op thread counts (0 = default)")
+    parser.add_argument("--chunks", type=int, default=8, help="Timed chunks per run")
+    parser.add_argument("--chunk-sec", type=float, default=FCPE_CPU_CHUNK_SEC, help="Fixed chunk length")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed chunks per run")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    chunks = [synthetic_voice(16000, args.chunk_sec, seed) for seed in range(args.chunks)]
+    default_threads = torch.get_num_threads()
+
+    print(f"{'threads':>7}  {'backend':<12} {'frames/s':>10} {'x realtime':>10} {'voicing':>8} {'p95 cents':>9} {'max cents':>9}")
+    for threads in (int(t) for t in args.threads.split(",")):
+        torch.set_num_threads(threads if threads > 0 else default_threads)
+        reference = None
+        for backend in backends:
+            result = _run_backend(backend, chunks, args.warmup, threads)
+            if "error" in result:
+                print(f"{threads:>7}  {backend:<12} {result['error']}")
+                continue
+            if reference is None:
+                reference = result["outputs"]
+            agreement = _agreement(reference, result["outputs"])
+            print(
+                f"{threads:>7}  {backend:<12} {result['frames_per_sec']:>10.0f} {result['realtime_factor']:>10.1f}"
+                f" {agreement['voicing_agreement']:>8.3f} {agreement['p95_cents']:>9.2f} {agreement['max_cents']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
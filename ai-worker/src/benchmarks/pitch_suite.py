@@ -0,0 +1,213 @@
+"""Pitch extraction benchmark and accuracy suite on synthetic vocals.
+
+Each signal is a band-limited harmonic tone with a known f0 per 10 ms FCPE
+frame: an octave glide, vibrato on sustained notes, a scale with silence
+gaps and a noisy mix of all three. They run through
+``FcpeProcessor.analyze_pitch`` end to end (VAD gating, batched chunks,
+post-processing and encoding) with S3 uploads stubbed out.
+
+Reported per signal:
+
+- frames/s and real-time factor of the whole ``analyze_pitch`` call
+- peak traced memory (NumPy/Python heap) and peak CUDA memory when on GPU
+- median / p95 absolute error in cents on frames voiced in both tracks
+- raw pitch accuracy (share of voiced truth frames within 50 cents)
+- voicing recall and false-alarm rate
+
+Frames within ``--boundary-ms`` of a voicing change in the truth are not
+scored. With ``--max-p95-cents`` / ``--min-accuracy`` the suite exits
+non-zero on a regression, so it can gate pitch-path performance changes::
+
+    python -m src.benchmarks.pitch_suite --minutes 5 --json before.json
+"""
+
+import argparse
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Dict, Tuple
+from unittest import mock
+
+import numpy as np
+import torch
+
+from src.processors.fcpe_processor import fcpe_processor
+from src.services.s3_service import s3_service
+from src.utils.audio import AudioBuffer
+
+SAMPLE_RATE = 16000
+HOP = 160
+# Harmonics above this are dropped so nothing aliases at 16 kHz
+MAX_HARMONIC_HZ = 7500
+
+
+def _render(f0: np.ndarray, rng: np.random.Generator, noise_db: float = -50) -> np.ndarray:
+    """Harmonic tone following per-sample ``f0`` (0 = silence), with a -6 dB/octave tilt."""
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    voice = np.zeros(len(f0))
+    for k in range(1, 16):
+        voice += np.where(k * f0 < MAX_HARMONIC_HZ, np.sin(k * phase) / k, 0.0)
+    # 5 ms fades at voicing edges instead of clicks
+    envelope = np.convolve((f0 > 0).astype(float), np.ones(80) / 80, mode="same")
+    voice *= 0.3 * envelope / max(np.abs(voice).max(), 1e-9)
+    voice += 10 ** (noise_db / 20) * rng.standard_normal(len(f0))
+    return voice.astype(np.float32)
+
+
+def _truth(f0: np.ndarray) -> np.ndarray:
+    """f0 at FCPE frame centres (frame ``i`` at sample ``i * HOP``)."""
+    return f0[::HOP].copy()
+
+
+def synthetic_f0(seconds: float = 20.0) -> Dict[str, np.ndarray]:
+    """Per-sample f0 (Hz, 0 = silence) of each synthetic signal at 16 kHz."""
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+
+    # Exponential glide 110 -> 880 Hz and back
+    glide = 110 * 2 ** (3 * (1 - np.abs(2 * t / seconds - 1)))
+
+    # Sustained notes with 5.5 Hz, +-60 cent vibrato
+    notes = np.array([220.0, 330.0, 440.0, 261.63])
+    base = notes[np.minimum((t / seconds * len(notes)).astype(int), len(notes) - 1)]
+    vibrato = base * 2 ** (0.6 * np.sin(2 * np.pi * 5.5 * t) / 12)
+
+    # C major scale, 0.4 s notes with 0.2 s gaps and a 3 s rest in the middle
+    scale = 261.63 * 2 ** (np.array([0, 2, 4, 5, 7, 9, 11, 12]) / 12)
+    gaps = scale[(t / 0.6).astype(int) % len(scale)] * ((t % 0.6) < 0.4)
+    gaps[(t > seconds / 2 - 1.5) & (t < seconds / 2 + 1.5)] = 0
+
+    # All three in sequence (rendered at a lower SNR)
+    third = n // 3
+    mixed = np.concatenate([glide[:third], vibrato[third:2 * third], gaps[2 * third:]])
+
+    return {"glide": glide, "vibrato": vibrato, "gaps": gaps, "mixed": mixed}
+
+
+def synthetic_signals(seconds: float = 20.0, minutes: float = 0.0, seed: int = 0) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """``{name: (audio, f0 per frame)}``; ``minutes`` adds a ``long`` track of all signals tiled."""
+    rng = np.random.default_rng(seed)
+    contours = synthetic_f0(seconds)
+    if minutes > 0:
+        repeats = int(np.ceil(minutes * 60 / (seconds * len(contours))))
+        contours["long"] = np.tile(np.concatenate(list(contours.values())), repeats)
+    return {
+        name: (_render(f0, rng, noise_db=-30 if name == "mixed" else -50), _truth(f0))
+        for name, f0 in contours.items()
+    }
+
+
+def _frames(pitch_data, count: int) -> np.ndarray:
+    f0 = np.zeros(count)
+    for point in pitch_data:
+        frame = int(round(point["time"] / 0.01))
+        if frame < count:
+            f0[frame] = point["frequency"]
+    return f0
+
+
+def score(truth: np.ndarray, estimate: np.ndarray, boundary_frames: int) -> Dict[str, float]:
+    truth_voiced = truth > 0
+    # Ignore frames next to voicing changes, where onset smearing is expected
+    change = np.flatnonzero(np.diff(truth_voiced.astype(int))) + 1
+    scored = np.ones(len(truth), dtype=bool)
+    for index in change:
+        scored[max(0, index - boundary_frames):index + boundary_frames] = False
+
+    estimate_voiced = estimate > 0
+    both = truth_voiced & estimate_voiced & scored
+    cents = 1200 * np.abs(np.log2(estimate[both] / truth[both])) if both.any() else np.zeros(0)
+    voiced_truth = (truth_voiced & scored).sum()
+    unvoiced_truth = (~truth_voiced & scored).sum()
+    return {
+        "median_cents": float(np.median(cents)) if len(cents) else float("nan"),
+        "p95_cents": float(np.percentile(cents, 95)) if len(cents) else float("nan"),
+        "raw_pitch_accuracy": float((cents <= 50).sum() / voiced_truth) if voiced_truth else float("nan"),
+        "voicing_recall": float((estimate_voiced & truth_voiced & scored).sum() / voiced_truth) if voiced_truth else float("nan"),
+        "voicing_false_alarm": float((estimate_voiced & ~truth_voiced & scored).sum() / unvoiced_truth) if unvoiced_truth else 0.0,
+    }
+
+
+def _analyze(audio: np.ndarray) -> Tuple[dict, float]:
+    # A fresh buffer per run, so the per-job pitch memo never short-circuits inference
+    buffer = AudioBuffer(audio, SAMPLE_RATE)
+    with mock.patch.object(s3_service, "upload_file", lambda path, key: f"stub://{key}"):
+        started = time.perf_counter()
+        result = fcpe_processor.analyze_pitch(buffer, "benchmark", "benchmark")
+        elapsed = time.perf_counter() - started
+    return result, elapsed
+
+
+def run_signal(audio: np.ndarray, truth: np.ndarray, boundary_frames: int, trace_memory: bool) -> Dict[str, float]:
+    result, elapsed = _analyze(audio)
+    estimate = _frames(result["pitch_data"], len(truth))
+    report = {
+        "seconds": len(audio) / SAMPLE_RATE,
+        "frames_per_sec": len(truth) / elapsed,
+        "realtime_factor": len(audio) / SAMPLE_RATE / elapsed,
+        **score(truth, estimate, boundary_frames),
+    }
+
+    if trace_memory:
+        # Separate pass: tracing slows allocation-heavy code and would skew the timing
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        tracemalloc.start()
+        _analyze(audio)
+        report["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        if torch.cuda.is_available():
+            report["peak_cuda_mb"] = torch.cuda.max_memory_allocated() / 2**20
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FCPE pitch benchmark and accuracy suite on synthetic vocals.")
+    parser.add_argument("--seconds", type=float, default=20.0, help="Length of each synthetic signal")
+    parser.add_argument("--minutes", type=float, default=0.0, help="Also time a track of this length (tiled signals)")
+    parser.add_argument("--boundary-ms", type=float, default=30.0, help="Unscored margin around voicing changes")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced-memory pass")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--max-p95-cents", type=float, default=0.0, help="Fail if any signal's p95 error exceeds this")
+    parser.add_argument("--min-accuracy", type=float, default=0.0, help="Fail if any signal's raw pitch accuracy is lower")
+    args = parser.parse_args()
+
+    boundary_frames = int(round(args.boundary_ms / 10))
+    signals = synthetic_signals(args.seconds, args.minutes)
+
+    # Load the model (and any precision/CPU backend calibration) outside the timed runs
+    _analyze(signals["glide"][0][:SAMPLE_RATE])
+
+    report = {}
+    print(f"{'signal':<8} {'sec':>6} {'frames/s':>9} {'x rt':>6} {'med c':>6} {'p95 c':>6} {'RPA':>6} {'recall':>6} {'FA':>6} {'peak MB':>8}")
+    for name, (audio, truth) in signals.items():
+        result = run_signal(audio, truth, boundary_frames, trace_memory=not args.no_memory)
+        report[name] = result
+        print(
+            f"{name:<8} {result['seconds']:>6.0f} {result['frames_per_sec']:>9.0f} {result['realtime_factor']:>6.1f}"
+            f" {result['median_cents']:>6.1f} {result['p95_cents']:>6.1f} {result['raw_pitch_accuracy']:>6.3f}"
+            f" {result['voicing_recall']:>6.3f} {result['voicing_false_alarm']:>6.3f}"
+            f" {result.get('peak_traced_mb', float('nan')):>8.1f}"
+        )
+    report["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"max RSS {report['max_rss_mb']:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = [
+        name for name, result in report.items() if isinstance(result, dict) and (
+            (args.max_p95_cents > 0 and not result["p95_cents"] <= args.max_p95_cents)
+            or (args.min_accuracy > 0 and not result["raw_pitch_accuracy"] >= args.min_accuracy)
+        )
+    ]
+    if failures:
+        print(f"Regression on: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
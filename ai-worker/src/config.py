@@ -25,6 +25,15 @@ LYRICS_API_URL = os.getenv("LYRICS_API_URL", "https://lyrics.lewdhutao.my.eu.org
 TEMP_DIR = os.getenv("TEMP_DIR", "/tmp/kero-ai")
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Local lyrics index consulted before the lyrics API
+LYRICS_INDEX_PATH = os.getenv("LYRICS_INDEX_PATH", os.path.join(TEMP_DIR, "lyrics_index.json"))
+LYRICS_INDEX_MIN_SCORE = float(os.getenv("LYRICS_INDEX_MIN_SCORE", "0.8"))
+# Artist alias table shared with the backend (Japanese/English -> Korean names)
+ARTIST_ALIASES_PATH = os.getenv(
+    "ARTIST_ALIASES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend", "src", "data", "artist_aliases.tsv"),
+)
+
 QUEUE_NAMES = {
     "audio_process": "kero.audio.process",
     "lyrics_extract": "kero.lyrics.extract",
@@ -33,3 +42,97 @@ QUEUE_NAMES = {
 
 # SOFA (Singing-Oriented Forced Aligner) settings
 SOFA_MODEL_PATH = os.getenv("SOFA_MODEL_PATH", "")
+
+# Model residency budget shared by all processors (0 = unlimited)
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+
+# Streaming separation: fixed windows crossfaded with overlap-add
+SEPARATION_STREAMING = os.getenv("SEPARATION_STREAMING", "false").lower() == "true"
+SEPARATION_STREAM_WINDOW_SEC = float(os.getenv("SEPARATION_STREAM_WINDOW_SEC", "30"))
+SEPARATION_STREAM_OVERLAP_SEC = float(os.getenv("SEPARATION_STREAM_OVERLAP_SEC", "1"))
+
+# In-memory stems: separation returns float32 buffers; encoding runs in the background
+SEPARATION_IN_MEMORY = os.getenv("SEPARATION_IN_MEMORY", "false").lower() == "true"
+STEM_ENCODER_WORKERS = int(os.getenv("STEM_ENCODER_WORKERS", "2"))
+STEM_DELIVERY_FORMAT = os.getenv("STEM_DELIVERY_FORMAT", "opus")  # "" disables the delivery rendition
+STEM_DELIVERY_BITRATE = os.getenv("STEM_DELIVERY_BITRATE", "128k")
+# Segmented low-bitrate Opus (fMP4 + HLS playlist) for fast-start playback
+STEM_HLS_ENABLED = os.getenv("STEM_HLS_ENABLED", "true").lower() == "true"
+STEM_HLS_BITRATE = os.getenv("STEM_HLS_BITRATE", "64k")
+STEM_HLS_SEGMENT_SEC = float(os.getenv("STEM_HLS_SEGMENT_SEC", "4"))
+# Waveform min/max peaks per stem (samples per pixel, one entry per zoom level)
+STEM_PEAKS_ENABLED = os.getenv("STEM_PEAKS_ENABLED", "true").lower() == "true"
+STEM_PEAKS_LEVELS = [int(v) for v in os.getenv("STEM_PEAKS_LEVELS", "2048,8192,32768").split(",") if v.strip()]
+
+# Separation backend: "torch" or "onnx" (CPU ONNX Runtime); "auto" is "torch" until the
+# ONNX export is validated on the production checkpoint
+SEPARATOR_BACKEND = os.getenv("SEPARATOR_BACKEND", "torch")
+ONNX_SEPARATOR_PRESET = os.getenv("ONNX_SEPARATOR_PRESET", "balanced")  # quality | balanced | fast
+ONNX_SEPARATOR_DIR = os.getenv("ONNX_SEPARATOR_DIR", os.path.join(TEMP_DIR, "onnx"))
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # 0 = ONNX Runtime default
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+
+# Cross-song batched separation (segments from concurrent jobs share model calls)
+SEPARATION_BATCHING = os.getenv("SEPARATION_BATCHING", "false").lower() == "true"
+SEPARATION_BATCH_MAX_SIZE = int(os.getenv("SEPARATION_BATCH_MAX_SIZE", "8"))
+SEPARATION_BATCH_MAX_WAIT_MS = float(os.getenv("SEPARATION_BATCH_MAX_WAIT_MS", "50"))
+SEPARATION_BATCH_LATENCY_BUDGET_MS = float(os.getenv("SEPARATION_BATCH_LATENCY_BUDGET_MS", "2000"))
+SEPARATION_BATCH_HOP_FRACTION = float(os.getenv("SEPARATION_BATCH_HOP_FRACTION", "0.5"))
+# Jobs processed concurrently by one worker (needed for cross-song batching)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+
+# Bypass separation inference on silent (and optionally VAD-confirmed vocal-free) spans
+SEPARATION_SKIP_SILENCE = os.getenv("SEPARATION_SKIP_SILENCE", "true").lower() == "true"
+SEPARATION_SKIP_NONVOCAL = os.getenv("SEPARATION_SKIP_NONVOCAL", "false").lower() == "true"
+SEPARATION_SILENCE_DB = float(os.getenv("SEPARATION_SILENCE_DB", "-60"))
+SEPARATION_SKIP_MIN_SEC = float(os.getenv("SEPARATION_SKIP_MIN_SEC", "2"))
+SEPARATION_SKIP_MARGIN_SEC = float(os.getenv("SEPARATION_SKIP_MARGIN_SEC", "0.25"))
+SEPARATION_VAD_THRESHOLD = float(os.getenv("SEPARATION_VAD_THRESHOLD", "0.2"))
+
+# Perceptual fingerprint index: reuse stems/analysis for re-uploads of the same recording
+FINGERPRINT_ENABLED = os.getenv("FINGERPRINT_ENABLED", "false").lower() == "true"
+FINGERPRINT_BACKEND = os.getenv("FINGERPRINT_BACKEND", "redis")  # redis | local
+FINGERPRINT_INDEX_PATH = os.getenv("FINGERPRINT_INDEX_PATH", os.path.join(TEMP_DIR, "fingerprint_index.json"))
+FINGERPRINT_MAX_BER = float(os.getenv("FINGERPRINT_MAX_BER", "0.25"))
+FINGERPRINT_MIN_OVERLAP = float(os.getenv("FINGERPRINT_MIN_OVERLAP", "0.9"))
+
+# Key change: semitone offsets the worker renders on request (instrumental + pitch)
+TRANSPOSE_SEMITONES = [int(v) for v in os.getenv("TRANSPOSE_SEMITONES", "-6,-5,-4,-3,-2,-1,1,2,3,4,5,6").split(",") if v.strip()]
+
+# Highlight preview clip (chorus pick from lyric repetition + word energy);
+# always runs for the "highlight" task, for every lyrics job when enabled
+HIGHLIGHT_ENABLED = os.getenv("HIGHLIGHT_ENABLED", "false").lower() == "true"
+HIGHLIGHT_SOURCE = os.getenv("HIGHLIGHT_SOURCE", "mixture")  # mixture | instrumental
+HIGHLIGHT_CLIP_SEC = float(os.getenv("HIGHLIGHT_CLIP_SEC", "30"))
+HIGHLIGHT_BITRATE = os.getenv("HIGHLIGHT_BITRATE", "96k")
+
+# Inference precision for separation and FCPE: fp32 | bf16 | fp16 | auto
+# (reduced precision is only kept if a float32 calibration check passes)
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32")
+PRECISION_MIN_SNR_DB = float(os.getenv("PRECISION_MIN_SNR_DB", "25"))
+PRECISION_MAX_CENTS = float(os.getenv("PRECISION_MAX_CENTS", "20"))
+
+# Also upload the legacy verbose pitch.json next to the compact pitch.bin.gz
+PITCH_JSON_ENABLED = os.getenv("PITCH_JSON_ENABLED", "true").lower() == "true"
+# Coarser pitch levels of detail, in 10 ms frames per level frame (5 = 50 ms)
+PITCH_LOD_FACTORS = [int(v) for v in os.getenv("PITCH_LOD_FACTORS", "5,10,25").split(",") if v.strip()]
+
+# FCPE pitch inference: overlapping chunks batched into one model call
+FCPE_CHUNK_SEC = float(os.getenv("FCPE_CHUNK_SEC", "30"))
+FCPE_OVERLAP_SEC = float(os.getenv("FCPE_OVERLAP_SEC", "1"))
+FCPE_BATCH_SIZE = int(os.getenv("FCPE_BATCH_SIZE", "0"))  # 0 = sized to free GPU memory (1 on CPU)
+# Release cached CUDA blocks only when reserved memory exceeds this fraction of the device
+FCPE_CACHE_FLUSH_FRACTION = float(os.getenv("FCPE_CACHE_FLUSH_FRACTION", "0.85"))
+
+# Run FCPE only on VAD-detected vocal spans of the vocals stem; the rest is unvoiced
+FCPE_VAD_GATING = os.getenv("FCPE_VAD_GATING", "true").lower() == "true"
+FCPE_VAD_THRESHOLD = float(os.getenv("FCPE_VAD_THRESHOLD", "0.3"))
+FCPE_VAD_PAD_SEC = float(os.getenv("FCPE_VAD_PAD_SEC", "0.25"))
+FCPE_VAD_MIN_GAP_SEC = float(os.getenv("FCPE_VAD_MIN_GAP_SEC", "1"))
+
+# FCPE on CPU-only nodes: compiled network backend (torch | torchscript | onnx),
+# intra-op threads (0 = library default; sets PyTorch's process-wide pool) and fixed chunk length
+FCPE_CPU_BACKEND = os.getenv("FCPE_CPU_BACKEND", "torch")
+FCPE_CPU_THREADS = int(os.getenv("FCPE_CPU_THREADS", "0"))
+FCPE_CPU_CHUNK_SEC = float(os.getenv("FCPE_CPU_CHUNK_SEC", "10"))
+FCPE_ONNX_DIR = os.getenv("FCPE_ONNX_DIR", os.path.join(TEMP_DIR, "onnx-fcpe"))  # exported FCPE graphs
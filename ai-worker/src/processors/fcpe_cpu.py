@@ -0,0 +1,147 @@
+"""Compiled CPU backends for the FCPE network.
+
+On CPU-only nodes the FCPE network (mel -> pitch salience) is replaced by
+a graph compiled for one fixed input shape; mel extraction and decoding
+stay in torchfcpe, so ``model.infer`` keeps its signature and output.
+
+    ============  =================================================================
+    backend       notes
+    ============  =================================================================
+    torch         Eager PyTorch, same as the GPU configuration.
+    torchscript   Traced, frozen and ``optimize_for_inference``-d (conv/bn folding,
+                  oneDNN layouts). No extra files.
+    onnx          Exported once to ``FCPE_ONNX_DIR/fcpe_{frames}.onnx`` and run
+                  on ONNX Runtime ``CPUExecutionProvider`` with full graph
+                  optimization.
+    ============  =================================================================
+
+``FcpeProcessor`` feeds the CPU path chunks of exactly ``FCPE_CPU_CHUNK_SEC``
+so every call hits the compiled shape and reuses its buffers; any other
+shape falls back to the eager network. A compiled graph is only kept if it
+reproduces the eager output on a calibration chunk; if the calibration run
+never reaches the network (e.g. a torchfcpe release that bypasses
+``forward``) the eager network is kept.
+
+Run ``python -m src.benchmarks.fcpe_cpu`` on the target CPU to compare the
+backends before rolling out.
+"""
+
+import functools
+import os
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import torch
+
+from src.config import FCPE_ONNX_DIR, FCPE_CPU_THREADS
+
+FCPE_CPU_BACKENDS = ("torch", "torchscript", "onnx")
+
+# Largest salience difference (sigmoid outputs, 0-1) a compiled graph may show vs eager
+MAX_SALIENCE_ERROR = 1e-3
+
+
+def configure_threads():
+    """Apply ``FCPE_CPU_THREADS`` to PyTorch's intra-op pool (process-wide)."""
+    if FCPE_CPU_THREADS > 0:
+        torch.set_num_threads(FCPE_CPU_THREADS)
+
+
+def _compile_torchscript(network: torch.nn.Module, example: torch.Tensor) -> Callable[[torch.Tensor], torch.Tensor]:
+    with torch.no_grad():
+        traced = torch.jit.trace(network.eval(), example, check_trace=False)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+def _compile_onnx(network: torch.nn.Module, example: torch.Tensor, threads: int) -> Callable[[torch.Tensor], torch.Tensor]:
+    import onnxruntime as ort
+
+    # Keyed by the fixed input shape; delete the file to re-export after a model update
+    onnx_path = os.path.join(FCPE_ONNX_DIR, f"fcpe_{example.shape[1]}.onnx")
+    if not os.path.exists(onnx_path):
+        os.makedirs(FCPE_ONNX_DIR, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                network.eval(), example, onnx_path,
+                input_names=["mel"], output_names=["salience"], opset_version=17,
+            )
+        print(f"[FCPE CPU] Exported {onnx_path}")
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def run(mel: torch.Tensor) -> torch.Tensor:
+        return torch.from_numpy(session.run(None, {"mel": mel.numpy()})[0])
+
+    return run
+
+
+def capture_network_input(network: torch.nn.Module, run: Callable[[], object]) -> torch.Tensor:
+    """The tensor ``network`` receives while ``run()`` performs one inference.
+
+    Raises RuntimeError if ``run()`` never calls ``network.forward``.
+    """
+    original = network.forward
+    captured = []
+
+    def forward(mel, *args, **kwargs):
+        captured.append(mel.detach().clone())
+        return original(mel, *args, **kwargs)
+
+    network.forward = forward
+    try:
+        run()
+    finally:
+        network.forward = original
+    if not captured:
+        raise RuntimeError("the calibration run never called the network")
+    return captured[0]
+
+
+def apply_cpu_backend(network: torch.nn.Module, run: Callable[[], object], backend: str,
+                      threads: int = FCPE_CPU_THREADS) -> Optional[Tuple[int, ...]]:
+    """Route ``network`` calls with the input shape seen during ``run()`` through a compiled graph.
+
+    ``run`` performs one inference at the fixed shape (``capture_network_input``).
+    ``threads`` sizes the ONNX Runtime intra-op pool (0 = its default);
+    TorchScript runs on PyTorch's pool (``configure_threads``).
+
+    Returns the compiled input shape, or None when the eager network is kept
+    (``backend == "torch"``, no input was captured, compilation failed, or
+    the outputs disagree).
+    """
+    if backend not in FCPE_CPU_BACKENDS:
+        raise ValueError(f"Unknown FCPE CPU backend: {backend}")
+    if backend == "torch":
+        return None
+
+    try:
+        example = capture_network_input(network, run)
+        shape = tuple(example.shape)
+        if backend == "onnx":
+            compiled = _compile_onnx(network, example, threads)
+        else:
+            compiled = _compile_torchscript(network, example)
+        with torch.no_grad():
+            error = float(np.max(np.abs(network(example).numpy() - compiled(example).numpy())))
+    except Exception as e:
+        print(f"[FCPE CPU] {backend} unavailable, keeping eager PyTorch: {e}")
+        return None
+    if error > MAX_SALIENCE_ERROR:
+        print(f"[FCPE CPU] {backend} rejected (max salience error {error:.2e}), keeping eager PyTorch")
+        return None
+
+    original = network.forward
+
+    @functools.wraps(original)
+    def forward(mel, *args, **kwargs):
+        if args or kwargs or tuple(mel.shape) != shape:
+            return original(mel, *args, **kwargs)
+        return compiled(mel)
+
+    network.forward = forward
+    print(f"[FCPE CPU] Running {backend} graph for input {shape} (max salience error {error:.2e})")
+    return shape
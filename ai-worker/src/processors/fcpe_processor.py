@@ -3,105 +3,359 @@ import json
 import numpy as np
 import torch
 from torchfcpe import spawn_bundled_infer_model
-import librosa
-from typing import Dict, List, Callable, Optional
-from src.config import TEMP_DIR
+from typing import Dict, List, Callable, Optional, Tuple
+from src.config import (
+    TEMP_DIR, PRECISION_MAX_CENTS, PITCH_JSON_ENABLED, PITCH_LOD_FACTORS,
+    FCPE_CHUNK_SEC, FCPE_OVERLAP_SEC, FCPE_BATCH_SIZE, FCPE_CACHE_FLUSH_FRACTION,
+    FCPE_VAD_GATING, FCPE_VAD_THRESHOLD, FCPE_VAD_PAD_SEC, FCPE_VAD_MIN_GAP_SEC,
+    FCPE_CPU_BACKEND, FCPE_CPU_CHUNK_SEC,
+)
 from src.services.s3_service import s3_service
+from src.services.model_registry import model_registry
+from src.processors.vad_processor import vad_processor
+from src.processors.fcpe_cpu import apply_cpu_backend, configure_threads
+from src.utils.audio import AudioBuffer, AudioSource, MonoStream
+from src.utils.precision import apply_precision, synthetic_voice
+from src.utils.pitch_format import encode_pitch_track, reduce_pitch
+from src.utils.pitch_chunks import chunk_starts, fit_frames, stitch, voiced_regions
+from src.utils.note_events import segment_notes, align_to_words, notes_document
+
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+
+class PitchTrack:
+    """FCPE f0 at 10 ms frames for one job's vocals.
+
+    FCPE has no confidence output, so confidence is synthesized from
+    voicing. ``view(step)`` gives the decimated track other stages use
+    (e.g. the 20 ms frames of the per-word pitch annotation), cached.
+    ``voiced_spans`` is the VAD timeline that gated inference, if any.
+    """
+
+    def __init__(self, f0: np.ndarray, frame_period: float,
+                 voiced_spans: Optional[List[Tuple[float, float]]] = None):
+        self.f0 = np.atleast_1d(f0)
+        self.confidence = np.where(self.f0 > 0, 1.0, 0.0).astype(np.float32)
+        self.frame_period = frame_period
+        self.voiced_spans = voiced_spans
+        self._views: Dict[int, tuple] = {}
+
+    @property
+    def time(self) -> np.ndarray:
+        return np.arange(len(self.f0)) * self.frame_period
+
+    def view(self, step: int) -> tuple:
+        """``(time, f0, confidence)`` keeping every ``step``-th frame."""
+        if step not in self._views:
+            f0 = self.f0[::step]
+            self._views[step] = (np.arange(len(f0)) * self.frame_period * step, f0, self.confidence[::step])
+        return self._views[step]
 
 
 class FcpeProcessor:
+    """FCPE pitch extraction.
+
+    Audio is cut into equal-length chunks that overlap by
+    ``FCPE_OVERLAP_SEC``; several chunks run as one batched model call and
+    each overlap is split at its midpoint, so every frame comes from the
+    chunk where it has the most context and chunk edges leave no seams.
+    With ``FCPE_VAD_GATING`` only the (padded) silero-vad spans of the
+    vocals are inferred; frames outside them are unvoiced. Regions shorter
+    than a chunk are widened into the surrounding audio, so every call has
+    the same shape. On CPU that shape is fixed (``FCPE_CPU_CHUNK_SEC``) and
+    runs through a compiled graph, see ``fcpe_cpu``.
+    """
+
+    HOP = 160  # samples per frame at 16 kHz (10 ms)
+    MB_PER_CHUNK_SEC = 8  # rough peak activation memory per second of chunk
+    MAX_BATCH = 16
+
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.chunk_duration = 60  # seconds - larger chunks since small model uses less VRAM
-        self.model = spawn_bundled_infer_model(device=self.device)
+        self._fixed_shape = False  # set once a compiled CPU graph is installed
 
-    def analyze_pitch(self, audio_path: str, song_id: str, folder_name: str = None, progress_callback: Optional[Callable[[int], None]] = None) -> Dict:
-        if folder_name is None:
-            folder_name = song_id
-            
-        audio, sr = librosa.load(audio_path, sr=16000, mono=True)
-        
-        # 청크 단위 처리로 CUDA OOM 방지
-        chunk_samples = self.chunk_duration * sr
-        total_chunks = max(1, (len(audio) + chunk_samples - 1) // chunk_samples)
-        
-        all_pitch = []
-        all_periodicity = []
-        
-        for i, start in enumerate(range(0, len(audio), chunk_samples)):
-            chunk = audio[start:start + chunk_samples]
-            # FCPE requires [batch, samples, 1] shape
-            audio_tensor = torch.from_numpy(chunk).float().unsqueeze(0).unsqueeze(-1).to(self.device)
-            
-            f0_chunk = self.model.infer(
-                audio_tensor,
-                sr=sr,
-                decoder_mode="local_argmax",
-                threshold=0.006,
-                f0_min=65,
-                f0_max=987.77,
-                interp_uv=False,
-            )
-            
-            f0_values = f0_chunk.squeeze().cpu().numpy()
-            # FCPE doesn't return confidence; synthesize from voicing
-            confidence_values = np.where(f0_values > 0, 1.0, 0.0).astype(np.float32)
-            
-            all_pitch.append(f0_values)
-            all_periodicity.append(confidence_values)
-            
-            # GPU 메모리 해제
-            del audio_tensor, f0_chunk
-            if torch.cuda.is_available():
+    def _lease_model(self):
+        # Shared with LyricsProcessor through the registry; loaded on first use
+        return model_registry.lease("fcpe", self._load_model)
+
+    def _load_model(self):
+        model = spawn_bundled_infer_model(device=self.device)
+        # Only the network runs in reduced precision; mel extraction and decoding stay float32
+        dtype = apply_precision(
+            "fcpe", model.model, self.device,
+            run=lambda audio: self._infer_chunk(model, audio),
+            calibration=[synthetic_voice(16000, 4.0, seed) for seed in range(3)],
+            accept=self._accept_precision,
+        )
+        if self.device == "cpu" and dtype is None:
+            self._load_cpu_backend(model)
+        return model
+
+    def _load_cpu_backend(self, model):
+        configure_threads()
+        chunk = synthetic_voice(16000, self._chunk_samples(cpu=True) / 16000, 0)
+        compiled = apply_cpu_backend(model.model, lambda: self._infer_chunk(model, chunk), FCPE_CPU_BACKEND)
+        self._fixed_shape = compiled is not None
+
+    def _chunk_samples(self, cpu: bool = False) -> int:
+        seconds = FCPE_CPU_CHUNK_SEC if cpu or self._fixed_shape else FCPE_CHUNK_SEC
+        return int(seconds * 16000) // self.HOP * self.HOP
+
+    def _accept_precision(self, references: List[np.ndarray], outputs: List[np.ndarray]):
+        reference, output = np.concatenate(references), np.concatenate(outputs)
+        voicing_agreement = float(np.mean((reference > 0) == (output > 0)))
+        both = (reference > 0) & (output > 0)
+        cents = 1200 * np.abs(np.log2(output[both] / reference[both])) if both.any() else np.zeros(1)
+        p95 = float(np.percentile(cents, 95))
+        ok = voicing_agreement >= 0.97 and p95 <= PRECISION_MAX_CENTS
+        return ok, f"voicing agreement {voicing_agreement:.3f}, p95 error {p95:.1f} cents"
+
+    def _infer_chunk(self, model, chunk: np.ndarray) -> np.ndarray:
+        return self._infer_batch(model, chunk[np.newaxis])[0]
+
+    def _infer_batch(self, model, batch: np.ndarray) -> np.ndarray:
+        """f0 of equal-length chunks ``(batch, samples)`` -> ``(batch, frames)``."""
+        # FCPE requires [batch, samples, 1] shape; float32 on CPU is used without a copy
+        audio_tensor = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32)).unsqueeze(-1).to(self.device)
+        f0 = model.infer(
+            audio_tensor,
+            sr=16000,
+            decoder_mode="local_argmax",
+            threshold=0.006,
+            f0_min=65,
+            f0_max=987.77,
+            interp_uv=False,
+        )
+        # Frame i is centred on sample i * HOP; stitching relies on this count
+        return fit_frames(f0.squeeze(-1).cpu().numpy(), batch.shape[1] // self.HOP + 1)
+
+    def pitch_track(self, source: AudioSource, progress_callback: Optional[Callable[[int], None]] = None) -> "PitchTrack":
+        """FCPE pitch of ``source``; computed once per ``AudioBuffer`` and shared by all stages."""
+        if not isinstance(source, AudioBuffer):
+            return self._extract_pitch(source, progress_callback)
+        if source.has_memo("fcpe_pitch"):
+            print("[FCPE] Reusing this job's pitch track")
+            if progress_callback:
+                progress_callback(100)
+        return source.memo("fcpe_pitch", lambda: self._extract_pitch(source, progress_callback))
+
+    def _batch_size(self, chunk_sec: float) -> int:
+        if FCPE_BATCH_SIZE > 0:
+            return FCPE_BATCH_SIZE
+        if self.device != "cuda":
+            return 1
+        free, _ = torch.cuda.mem_get_info()
+        fits = int(free / 2**20 * 0.5 / (self.MB_PER_CHUNK_SEC * chunk_sec))
+        return max(1, min(self.MAX_BATCH, fits))
+
+    def _release_cache_if_needed(self):
+        if self.device != "cuda":
+            return
+        _, total = torch.cuda.mem_get_info()
+        if torch.cuda.memory_reserved() > FCPE_CACHE_FLUSH_FRACTION * total:
+            torch.cuda.empty_cache()
+
+    def _run_chunks(self, model, audio: MonoStream, jobs: List[Tuple[int, int]],
+                    progress_callback: Optional[Callable[[int], None]] = None) -> List[np.ndarray]:
+        """f0 of each ``(start, length)`` chunk; runs of equal-length chunks share a model call.
+
+        ``jobs`` are in ascending order, so only the current batch's audio is held in memory.
+        """
+        outputs: List[np.ndarray] = []
+        batch_size = self._batch_size(max(length for _, length in jobs) / 16000)
+        while len(outputs) < len(jobs):
+            length = jobs[len(outputs)][1]
+            batch_jobs = []
+            for start, job_length in jobs[len(outputs):len(outputs) + batch_size]:
+                if job_length != length:
+                    break
+                batch_jobs.append(start)
+            batch = np.stack([audio.read(start, length) for start in batch_jobs])
+            try:
+                with torch.no_grad():
+                    outputs.extend(self._infer_batch(model, batch))
+            except torch.cuda.OutOfMemoryError:
+                if batch_size == 1:
+                    raise
                 torch.cuda.empty_cache()
-            
+                batch_size = max(1, batch_size // 2)
+                print(f"[FCPE] Out of memory, retrying with batch size {batch_size}")
+                continue
+            self._release_cache_if_needed()
+            if len(outputs) < len(jobs):
+                audio.release(jobs[len(outputs)][0])
+
             # 진행률 보고
             if progress_callback:
-                progress_callback(int((i + 1) / total_chunks * 100))
-        
-        # 결과 병합
-        pitch = np.concatenate(all_pitch)
-        periodicity = np.concatenate(all_periodicity)
-        
-        time = np.arange(len(pitch)) * 160 / sr
+                progress_callback(int(len(outputs) / len(jobs) * 100))
+        return outputs
+
+    def _extract_pitch(self, source: AudioSource, progress_callback: Optional[Callable[[int], None]] = None) -> "PitchTrack":
+        sr = 16000
+        # Decoded and resampled block by block as chunks are consumed
+        audio = MonoStream(source, sr)
+        # Whole frames only (reads past the end are zero-padded), so the last chunk ends at the end
+        total = audio.total + (-audio.total % self.HOP)
+
+        voiced_spans = None
+        regions = [(0, total)]
+        if FCPE_VAD_GATING and total:
+            voiced_spans = vad_processor.timeline(source, threshold=FCPE_VAD_THRESHOLD)
+            regions = voiced_regions(voiced_spans, total, self.HOP, sr, FCPE_VAD_PAD_SEC, FCPE_VAD_MIN_GAP_SEC)
+            voiced = sum(end - start for start, end in regions) / total
+            print(f"[FCPE] Inferring {len(regions)} voiced regions ({voiced:.0%} of the audio)")
+
+        # Loads first: a compiled CPU graph fixes the chunk length
+        with self._lease_model() as model:
+            chunk = self._chunk_samples()
+            overlap = int(FCPE_OVERLAP_SEC * sr) // self.HOP * self.HOP
+            # A fixed-shape graph gets full chunks even for short audio (zero-padded by the stream)
+            length = chunk if self._fixed_shape else min(chunk, total)
+            region_starts = []
+            for start, end in regions:
+                if end - start >= length:
+                    region_starts.append([start + offset for offset in chunk_starts(end - start, length, overlap)])
+                else:
+                    # Widened into the neighbouring audio rather than padded, to keep one shape
+                    region_starts.append([max(0, min(start, total - length))])
+            jobs = [(start, length) for starts in region_starts for start in starts]
+            outputs = self._run_chunks(model, audio, jobs, progress_callback) if jobs else []
+
+        f0 = np.zeros(total // self.HOP + 1, dtype=np.float32)
+        for (start, end), starts in zip(regions, region_starts):
+            stitched = stitch(starts, outputs[:len(starts)], self.HOP)
+            outputs = outputs[len(starts):]
+            first, last = start // self.HOP, min(end // self.HOP + 1, len(f0))
+            offset = starts[0] // self.HOP
+            f0[first:last] = stitched[first - offset:last - offset]
+        if not jobs and progress_callback:
+            progress_callback(100)
+
+        return PitchTrack(f0, self.HOP / sr, voiced_spans)
+
+    def analyze_pitch(self, audio_path: AudioSource, song_id: str, folder_name: str = None, progress_callback: Optional[Callable[[int], None]] = None,
+                      lyrics_lines: Optional[List[Dict]] = None) -> Dict:
+        """Upload the pitch track, note events (aligned to ``lyrics_lines`` if given) and VAD timeline."""
+        if folder_name is None:
+            folder_name = song_id
 
-        pitch_data = self._process_pitch_data(time, pitch, periodicity)
+        track = self.pitch_track(audio_path, progress_callback)
+        pitch, periodicity = track.f0, track.confidence
+        frame_period = track.frame_period
+        time = track.time
+
+        columns = self._pitch_columns(time, pitch, periodicity)
+        pitch_data = self._process_pitch_data(columns)
 
         output_dir = os.path.join(TEMP_DIR, song_id)
         os.makedirs(output_dir, exist_ok=True)
 
-        pitch_path = os.path.join(output_dir, "pitch.json")
-        with open(pitch_path, "w", encoding="utf-8") as f:
-            json.dump(pitch_data, f, indent=2)
+        pitch_bin_path = os.path.join(output_dir, "pitch.bin.gz")
+        with open(pitch_bin_path, "wb") as f:
+            f.write(encode_pitch_track(columns["frame"], columns["frequency"], columns["confidence"], frame_period))
+        pitch_bin_url = s3_service.upload_file(pitch_bin_path, f"songs/{folder_name}/pitch.bin.gz")
+        os.remove(pitch_bin_path)
+        pitch_lod_urls = self._upload_pitch_levels(pitch, frame_period, output_dir, folder_name)
+
+        # Note events for scoring: a few hundred entries instead of a point per 10 ms frame
+        notes = align_to_words(segment_notes(pitch, frame_period), lyrics_lines)
+        notes_path = os.path.join(output_dir, "notes.json")
+        with open(notes_path, "w", encoding="utf-8") as f:
+            json.dump(notes_document(notes, frame_period), f)
+        notes_url = s3_service.upload_file(notes_path, f"songs/{folder_name}/notes.json")
+        os.remove(notes_path)
+
+        vad_url = ""
+        if track.voiced_spans is not None:
+            # Reusable by clients and later stages without running the VAD again
+            vad_path = os.path.join(output_dir, "vad.json")
+            with open(vad_path, "w", encoding="utf-8") as f:
+                json.dump(self._vad_timeline(track), f)
+            vad_url = s3_service.upload_file(vad_path, f"songs/{folder_name}/vad.json")
+            os.remove(vad_path)
 
-        s3_key = f"songs/{folder_name}/pitch.json"
-        pitch_url = s3_service.upload_file(pitch_path, s3_key)
+        pitch_url = ""
+        if PITCH_JSON_ENABLED:
+            # Legacy verbose format, for clients that do not read pitch.bin.gz yet
+            pitch_path = os.path.join(output_dir, "pitch.json")
+            with open(pitch_path, "w", encoding="utf-8") as f:
+                json.dump(pitch_data, f, indent=2)
+
+            s3_key = f"songs/{folder_name}/pitch.json"
+            pitch_url = s3_service.upload_file(pitch_path, s3_key)
+            os.remove(pitch_path)
 
-        os.remove(pitch_path)
         os.rmdir(output_dir)
 
         return {
             "pitch_url": pitch_url,
+            "pitch_bin_url": pitch_bin_url,
+            "pitch_lod_urls": pitch_lod_urls,
+            "notes_url": notes_url,
+            "note_count": len(notes),
+            "vad_url": vad_url,
             "pitch_data": pitch_data,
-            "stats": self._calculate_stats(pitch, periodicity),
+            "stats": self._calculate_stats(columns),
         }
 
-    def _process_pitch_data(
+    def _upload_pitch_levels(self, pitch: np.ndarray, frame_period: float, output_dir: str, folder_name: str) -> Dict[str, str]:
+        """Coarser copies of pitch.bin.gz, keyed by frame length in ms, each fetchable on its own."""
+        urls = {}
+        for factor in PITCH_LOD_FACTORS:
+            frequency, confidence = reduce_pitch(pitch, factor)
+            frames = np.flatnonzero(frequency > 0)
+            ms = int(round(frame_period * factor * 1000))
+            level_path = os.path.join(output_dir, f"pitch_{ms}ms.bin.gz")
+            with open(level_path, "wb") as f:
+                f.write(encode_pitch_track(frames, frequency[frames], confidence[frames], frame_period * factor))
+            urls[str(ms)] = s3_service.upload_file(level_path, f"songs/{folder_name}/pitch/{ms}ms.bin.gz")
+            os.remove(level_path)
+        return urls
+
+    def _vad_timeline(self, track: "PitchTrack") -> Dict:
+        duration = len(track.f0) * track.frame_period
+        segments = [{"start": round(start, 3), "end": round(end, 3)} for start, end in track.voiced_spans]
+        voiced = sum(end - start for start, end in track.voiced_spans)
+        return {
+            "duration": round(duration, 3),
+            "threshold": FCPE_VAD_THRESHOLD,
+            "voiced_ratio": round(voiced / duration, 3) if duration else 0,
+            "segments": segments,
+        }
+
+    def _pitch_columns(
         self, time: np.ndarray, frequency: np.ndarray, confidence: np.ndarray
-    ) -> List[Dict]:
-        pitch_points = []
+    ) -> Dict[str, np.ndarray]:
+        """Voiced frames as parallel arrays: frame index, time, frequency, confidence, midi."""
+        voiced = (confidence > 0.5) & ~np.isnan(frequency) & (frequency > 0)
+        voiced_frequency = frequency[voiced]
+        return {
+            "frame": np.nonzero(voiced)[0],
+            "time": time[voiced],
+            "frequency": voiced_frequency,
+            "confidence": confidence[voiced],
+            "midi": np.rint(69 + 12 * np.log2(voiced_frequency / 440.0)).astype(np.int64),
+        }
 
-        for i in range(len(time)):
-            if confidence[i] > 0.5 and not np.isnan(frequency[i]):
-                pitch_points.append({
-                    "time": round(float(time[i]), 3),
-                    "frequency": round(float(frequency[i]), 2),
-                    "confidence": round(float(confidence[i]), 3),
-                    "note": self._frequency_to_note(frequency[i]),
-                    "midi": self._frequency_to_midi(frequency[i]),
-                })
+    def _midi_to_notes(self, midi: np.ndarray) -> np.ndarray:
+        names = np.array(NOTE_NAMES)[midi % 12]
+        return np.char.add(names, (midi // 12 - 1).astype(str))
 
-        return pitch_points
+    def _process_pitch_data(self, columns: Dict[str, np.ndarray]) -> List[Dict]:
+        """Legacy one-dict-per-frame shape, built only for JSON serialization."""
+        # Round in float64 so float32 model output serializes as e.g. 296.8, not 296.79998779296875
+        columns = {key: value.astype(np.float64) if value.dtype.kind == "f" else value for key, value in columns.items()}
+        return [
+            {"time": t, "frequency": f, "confidence": c, "note": note, "midi": midi}
+            for t, f, c, note, midi in zip(
+                np.round(columns["time"], 3).tolist(),
+                np.round(columns["frequency"], 2).tolist(),
+                np.round(columns["confidence"], 3).tolist(),
+                self._midi_to_notes(columns["midi"]).tolist(),
+                columns["midi"].tolist(),
+            )
+        ]
 
     def _frequency_to_midi(self, frequency: float) -> int:
         if frequency <= 0 or np.isnan(frequency):
@@ -111,15 +365,13 @@ class FcpeProcessor:
     def _frequency_to_note(self, frequency: float) -> str:
         if frequency <= 0 or np.isnan(frequency):
             return ""
-        notes = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
         midi = self._frequency_to_midi(frequency)
         note_index = midi % 12
         octave = (midi // 12) - 1
-        return f"{notes[note_index]}{octave}"
+        return f"{NOTE_NAMES[note_index]}{octave}"
 
-    def _calculate_stats(self, frequency: np.ndarray, confidence: np.ndarray) -> Dict:
-        valid_mask = (confidence > 0.5) & ~np.isnan(frequency)
-        valid_frequencies = frequency[valid_mask]
+    def _calculate_stats(self, columns: Dict[str, np.ndarray]) -> Dict:
+        valid_frequencies = columns["frequency"]
 
         if len(valid_frequencies) == 0:
             return {"min_freq": 0, "max_freq": 0, "avg_freq": 0, "range_semitones": 0}
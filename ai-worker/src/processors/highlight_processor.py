@@ -0,0 +1,116 @@
+import os
+import subprocess
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+import soundfile as sf
+from src.config import TEMP_DIR, HIGHLIGHT_CLIP_SEC, HIGHLIGHT_BITRATE
+from src.services.s3_service import s3_service
+from src.processors.lyrics_processor import lyrics_processor
+from src.utils.audio import AudioBuffer, AudioSource, load_mono, audio_duration
+
+
+class HighlightProcessor:
+    """Picks a representative clip (usually the chorus) and uploads it as a short Opus preview.
+
+    Each candidate window starts at a lyric line. Lines score by how often
+    their text repeats in the song (choruses repeat, verses mostly don't)
+    and by the mean word energy from the lyrics pipeline; a window scores
+    the overlap-weighted sum of its lines. Without lyrics the loudest window
+    of the audio is used.
+    """
+
+    REPETITION_WEIGHT = 0.6
+    ENERGY_WEIGHT = 0.4
+    LEAD_IN_SEC = 0.5
+    FADE_SEC = 1.0
+
+    def pick_window(self, lines: List[Dict], duration: float, clip_sec: float = HIGHLIGHT_CLIP_SEC) -> Optional[float]:
+        """Start time of the best ``clip_sec`` window, or None without usable lines."""
+        lines = [line for line in lines if line.get("text") and line.get("end_time", 0) > line.get("start_time", 0)]
+        if not lines or duration <= clip_sec:
+            return 0.0 if lines else None
+
+        # Same normalization the aligner uses when matching lyric text
+        keys = [lyrics_processor._strip_for_match(line["text"]).casefold() for line in lines]
+        counts = Counter(keys)
+        max_repeats = max(counts.values())
+        line_scores = []
+        for line, key in zip(lines, keys):
+            repetition = (counts[key] - 1) / (max_repeats - 1) if max_repeats > 1 else 0.0
+            energies = [word.get("energy", 0.5) for word in line.get("words", [])]
+            energy = float(np.mean(energies)) if energies else 0.5
+            line_scores.append(self.REPETITION_WEIGHT * repetition + self.ENERGY_WEIGHT * energy)
+
+        best_start, best_score = None, -1.0
+        for line in lines:
+            start = min(max(0.0, line["start_time"] - self.LEAD_IN_SEC), duration - clip_sec)
+            end = start + clip_sec
+            score = 0.0
+            for other, line_score in zip(lines, line_scores):
+                overlap = min(end, other["end_time"]) - max(start, other["start_time"])
+                if overlap > 0:
+                    score += line_score * overlap / clip_sec
+            # Strictly greater: ties keep the earliest window (first chorus)
+            if score > best_score:
+                best_start, best_score = start, score
+        return best_start
+
+    def loudest_window(self, source: AudioSource, clip_sec: float = HIGHLIGHT_CLIP_SEC) -> float:
+        sr = 8000
+        audio = load_mono(source, sr)
+        seconds = len(audio) // sr
+        if seconds <= clip_sec:
+            return 0.0
+        energy = (audio[:seconds * sr].reshape(seconds, sr) ** 2).mean(axis=1)
+        window = int(clip_sec)
+        sums = np.convolve(energy, np.ones(window), mode="valid")
+        return float(np.argmax(sums))
+
+    def _read_clip(self, source: AudioSource, start: float, clip_sec: float) -> AudioBuffer:
+        if isinstance(source, AudioBuffer):
+            first = int(start * source.sample_rate)
+            return AudioBuffer(source.samples[:, first:first + int(clip_sec * source.sample_rate)], source.sample_rate)
+        sample_rate = sf.info(source).samplerate
+        first = int(start * sample_rate)
+        clip, _ = sf.read(source, start=first, stop=first + int(clip_sec * sample_rate), dtype="float32", always_2d=True)
+        return AudioBuffer(clip.T, sample_rate)
+
+    def extract(self, source: AudioSource, song_id: str, folder_name: str,
+                lines: Optional[List[Dict]] = None, clip_sec: float = HIGHLIGHT_CLIP_SEC) -> Dict:
+        """Encode and upload ``songs/{folder}/preview.opus``; returns its URL and time span."""
+        duration = audio_duration(source)
+        start = self.pick_window(lines or [], duration, clip_sec)
+        if start is None:
+            start = self.loudest_window(source, clip_sec)
+        clip = self._read_clip(source, start, clip_sec)
+        length = clip.duration
+        print(f"[Highlight] Preview {start:.1f}s-{start + length:.1f}s of {duration:.1f}s")
+
+        output_path = os.path.join(TEMP_DIR, f"{song_id}_preview.opus")
+        fade = min(self.FADE_SEC, length / 4)
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "f32le", "-ar", str(clip.sample_rate), "-ac", str(clip.channels),
+            "-i", "pipe:0",
+            "-af", f"afade=t=in:d={fade:.2f},afade=t=out:st={max(0.0, length - fade):.2f}:d={fade:.2f}",
+            "-c:a", "libopus", "-b:a", HIGHLIGHT_BITRATE,
+            output_path,
+        ]
+        try:
+            result = subprocess.run(cmd, input=clip.interleaved().tobytes(), capture_output=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed for {output_path}: {result.stderr.decode(errors='replace')}")
+            preview_url = s3_service.upload_file(output_path, f"songs/{folder_name}/preview.opus")
+        finally:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+        return {
+            "preview_url": preview_url,
+            "start_time": round(start, 3),
+            "end_time": round(start + length, 3),
+        }
+
+
+highlight_processor = HighlightProcessor()
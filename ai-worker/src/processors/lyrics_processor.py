@@ -5,12 +5,14 @@ import unicodedata
 
 import numpy as np
 import librosa
-from torchfcpe import spawn_bundled_infer_model
 import requests
-import soundfile as sf
 
 from typing import List, Dict, Callable, Optional
 from src.config import LYRICS_API_URL, SOFA_MODEL_PATH
+from src.services.lyrics_index import lyrics_index
+from src.services.model_registry import model_registry
+from src.processors.fcpe_processor import fcpe_processor
+from src.utils.audio import AudioSource, load_mono, audio_duration
 
 
 class LyricsProcessor:
@@ -50,6 +52,19 @@ class LyricsProcessor:
             print(f"[Lyrics API] Failed: {e}")
             return None
 
+    def _get_lyrics_text(self, title: Optional[str], artist: Optional[str]) -> Optional[str]:
+        """Look up lyrics in the local index first, then fall back to the API."""
+        cached = lyrics_index.lookup(title, artist)
+        if cached:
+            lyrics_text, score = cached
+            print(f"[Lyrics Index] Hit for: {title} - {artist} (score={score:.2f}, {len(lyrics_text)} chars)")
+            return lyrics_text
+
+        lyrics_text = self._fetch_lyrics_from_api(title, artist)
+        if lyrics_text:
+            lyrics_index.add(title, artist, lyrics_text)
+        return lyrics_text
+
     def _detect_language(self, text: str, language: Optional[str], title: Optional[str], artist: Optional[str]) -> str:
         """Detect language from lyrics text and metadata"""
         if language:
@@ -126,11 +141,12 @@ class LyricsProcessor:
         
         return cleaned
 
-    def _add_energy_to_words(self, vocals_path: str, segments: List[Dict]) -> List[Dict]:
+    def _add_energy_to_words(self, vocals_path: AudioSource, segments: List[Dict]) -> List[Dict]:
         """Add RMS energy values (0.0-1.0) to each word based on vocal intensity"""
         try:
-            print(f"[Energy] Loading vocals from {vocals_path}...")
-            y, sr = librosa.load(vocals_path, sr=16000)
+            print("[Energy] Loading vocals...")
+            sr = 16000
+            y = load_mono(vocals_path, sr)
             
             # Calculate RMS energy with small hop length for precision
             rms = librosa.feature.rms(y=y, frame_length=2048, hop_length=512)[0]
@@ -196,53 +212,11 @@ class LyricsProcessor:
                     word["energy_curve"] = [0.5]
             return segments
 
-    def _add_pitch_to_words(self, vocals_path: str, segments: List[Dict]) -> List[Dict]:
+    def _add_pitch_to_words(self, vocals_path: AudioSource, segments: List[Dict]) -> List[Dict]:
         """Add pitch data (frequency, note, midi) to each word based on vocal analysis"""
         try:
-            print(f"[Pitch] Loading vocals from {vocals_path}...")
-            audio, sr = librosa.load(vocals_path, sr=16000, mono=True)
-            
-            # Process in chunks to avoid CUDA OOM
-            chunk_duration = 60  # Larger chunks since tiny model uses less VRAM
-            chunk_samples = chunk_duration * sr
-            
-            all_pitch = []
-            all_periodicity = []
-            
-            # Lazy-load FCPE model
-            if not hasattr(self, '_fcpe_model'):
-                self._fcpe_model = spawn_bundled_infer_model(device=self.device)
-            
-            for start in range(0, len(audio), chunk_samples):
-                chunk = audio[start:start + chunk_samples]
-                # FCPE requires [batch, samples, 1] shape
-                audio_tensor = torch.from_numpy(chunk).float().unsqueeze(0).unsqueeze(-1).to(self.device)
-                
-                f0_chunk = self._fcpe_model.infer(
-                    audio_tensor,
-                    sr=sr,
-                    decoder_mode="local_argmax",
-                    threshold=0.006,
-                    f0_min=65,
-                    f0_max=987.77,
-                    interp_uv=False,
-                )
-                
-                f0_values = f0_chunk.squeeze().cpu().numpy()
-                # FCPE doesn't return confidence; synthesize from voicing
-                confidence_values = np.where(f0_values > 0, 1.0, 0.0).astype(np.float32)
-                
-                # Downsample from 10ms (FCPE default) to 20ms to match original hop_length=320
-                all_pitch.append(f0_values[::2])
-                all_periodicity.append(confidence_values[::2])
-                
-                del audio_tensor, f0_chunk
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-            
-            pitch = np.concatenate(all_pitch)
-            periodicity = np.concatenate(all_periodicity)
-            time = np.arange(len(pitch)) * 320 / sr  # 20ms per frame (matches hop_length)
+            # Same track as the pitch stage; whichever runs first computes it
+            time, pitch, periodicity = fcpe_processor.pitch_track(vocals_path).view(2)  # 20ms frames
             
              # Helper functions (same as fcpe_processor.py, now using FCPE)
             def freq_to_midi(freq):
@@ -424,11 +398,12 @@ class LyricsProcessor:
 
         return None
 
-    def _refine_with_energy_onsets(self, segments: List[Dict], vocals_path: str) -> List[Dict]:
+    def _refine_with_energy_onsets(self, segments: List[Dict], vocals_path: AudioSource) -> List[Dict]:
         """Post-process: snap word start times to actual vocal energy onsets."""
         try:
             print(f"[Refine] Loading vocals for energy onset detection...")
-            y, sr = librosa.load(vocals_path, sr=16000)
+            sr = 16000
+            y = load_mono(vocals_path, sr)
 
             # Compute onset times using librosa (for general words)
             onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=256)
@@ -643,11 +618,21 @@ class LyricsProcessor:
 
         return lyrics_lines
 
+    def _load_sofa_aligner(self):
+        from src.processors.sofa_aligner import SOFAAligner
+
+        sofa = SOFAAligner(
+            model_path=SOFA_MODEL_PATH or None,
+            device=self.device,
+        )
+        sofa.load_model()
+        return sofa
+
     # ------------------------------------------------------------------
     # Main entry point
     # ------------------------------------------------------------------
 
-    def extract_lyrics(self, audio_path: str, song_id: str, language: Optional[str] = None,
+    def extract_lyrics(self, audio_path: AudioSource, song_id: str, language: Optional[str] = None,
                        folder_name: Optional[str] = None,
                        title: Optional[str] = None,
                        artist: Optional[str] = None,
@@ -657,8 +642,7 @@ class LyricsProcessor:
 
         # Get audio duration
         try:
-            info = sf.info(audio_path)
-            duration = info.duration
+            duration = audio_duration(audio_path)
         except Exception:
             duration = 0
 
@@ -669,7 +653,7 @@ class LyricsProcessor:
         print("[Stage 1: API Lyrics] Fetching lyrics text (primary source)...")
         print("=" * 60)
 
-        lyrics_text = self._fetch_lyrics_from_api(title, artist)
+        lyrics_text = self._get_lyrics_text(title, artist)
 
         if not lyrics_text:
             print("[Pipeline] No API lyrics available — cannot process without lyrics")
@@ -698,15 +682,9 @@ class LyricsProcessor:
 
         lyrics_lines = []
         try:
-            from src.processors.sofa_aligner import SOFAAligner
-
-            sofa = SOFAAligner(
-                model_path=SOFA_MODEL_PATH or None,
-                device=self.device,
-            )
-
-            all_words = sofa.align_words(audio_path, lyrics_text, language=detected_language)
-            sofa.release_model()
+            sofa_lease = model_registry.lease("sofa", self._load_sofa_aligner, release=lambda aligner: aligner.release_model())
+            with sofa_lease as sofa:
+                all_words = sofa.align_words(audio_path, lyrics_text, language=detected_language)
 
             print(f"[SOFA] Aligned {len(all_words)} words from full audio")
 
@@ -0,0 +1,281 @@
+"""ONNX Runtime CPU backend for the Mel-Band RoFormer separation model.
+
+Only the network between STFT and iSTFT (band split, transformer stack,
+mask estimators) is exported to ONNX, once (fixed segment length, dynamic
+batch) and, for the int8 presets, dynamically quantized; the ONNX exporter
+has no complex STFT/iSTFT. The backend computes the STFT in PyTorch, runs
+the mask network on ``CPUExecutionProvider`` and applies the masks and
+iSTFT itself, mirroring ``MelBandRoformer.forward``. An export is only kept
+if it reproduces the PyTorch output on a test segment.
+
+Presets trade quality for speed through weight precision and segment
+overlap (``hop`` as a fraction of the model segment):
+
+    ========  ======  =====  ==================================================
+    preset    dtype   hop    trade-off
+    ========  ======  =====  ==================================================
+    quality   fp32    1/4    Matches the PyTorch output up to float rounding;
+                             slowest (4 model passes per sample).
+    balanced  int8    1/2    Half the passes of ``quality`` and int8 matmuls;
+                             int8 weights cost a small amount of SDR, mostly
+                             audible as slightly more bleed in the vocals.
+    fast      int8    1      Fastest (one pass per sample, no overlap); segment
+                             seams are only crossfaded by the outer streaming
+                             window, so expect occasional artifacts at seams.
+    ========  ======  =====  ==================================================
+
+Measure on the target CPU with ``SEPARATOR_BACKEND=onnx`` before rolling out;
+int8 gains depend heavily on VNNI/AMX support.
+"""
+
+import os
+import json
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from src.config import ONNX_SEPARATOR_DIR, ONNX_INTRA_OP_THREADS, ONNX_INTER_OP_THREADS
+from src.processors.stem_stream import demix_segments
+
+
+ONNX_SEPARATION_PRESETS: Dict[str, Dict[str, Any]] = {
+    "quality": {"quantize": False, "hop_fraction": 0.25, "batch_size": 1},
+    "balanced": {"quantize": True, "hop_fraction": 0.5, "batch_size": 2},
+    "fast": {"quantize": True, "hop_fraction": 1.0, "batch_size": 4},
+}
+
+# Fallback when the checkpoint config does not state its segment length
+DEFAULT_SEGMENT_SAMPLES = 352800
+
+# Bumped when the exported graph changes; older exports are re-exported
+EXPORT_VERSION = 2
+# Minimum SNR of the float32 export against PyTorch before it is used
+MIN_EXPORT_SNR_DB = 40.0
+
+
+def model_segment_samples(separator: Any) -> int:
+    """Segment length (samples) the checkpoint was trained on."""
+    try:
+        return int(separator.model_instance.model_data_cfgdict.audio.chunk_size)
+    except AttributeError:
+        return DEFAULT_SEGMENT_SAMPLES
+
+
+def model_stem_names(separator: Any) -> List[str]:
+    """Stem order of the model output, normalized to ``vocals``/``instrumental``."""
+    try:
+        training = separator.model_instance.model_data_cfgdict.training
+        names = [training.target_instrument] if training.target_instrument else list(training.instruments)
+    except AttributeError:
+        names = ["vocals"]
+    return ["vocals" if "vocal" in name.lower() else "instrumental" for name in names]
+
+
+def spectral_config(separator: Any) -> Dict[str, Any]:
+    """STFT settings and band layout around the exported network (JSON-serializable)."""
+    model = separator.model_instance.model_run
+    return {
+        "n_fft": int(model.stft_kwargs["n_fft"]),
+        "hop_length": int(model.stft_kwargs["hop_length"]),
+        "win_length": int(model.stft_kwargs["win_length"]),
+        "normalized": bool(model.stft_kwargs.get("normalized", False)),
+        "audio_channels": int(model.audio_channels),
+        "freq_indices": model.freq_indices.cpu().tolist(),
+        "num_bands_per_freq": model.num_bands_per_freq.cpu().tolist(),
+    }
+
+
+def _mask_network(model: Any) -> Any:
+    """``(batch, freq * channels, frames, 2)`` STFT -> ``(batch, stems, frames, bands * 2)`` masks."""
+    import torch
+
+    class MaskNetwork(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, spec):
+            batch = spec.shape[0]
+            x = spec[:, model.freq_indices]
+            x = x.permute(0, 2, 1, 3).reshape(batch, x.shape[2], -1)
+            x = model.band_split(x)
+
+            skip_connection = getattr(model, "skip_connection", False)
+            store = []
+            for block in model.layers:
+                if len(block) == 3:
+                    linear_transformer, time_transformer, freq_transformer = block
+                    b, t, f, d = x.shape
+                    x = linear_transformer(x.reshape(b, t * f, d)).reshape(b, t, f, d)
+                else:
+                    time_transformer, freq_transformer = block
+                for previous in store:
+                    x = x + previous
+                b, t, f, d = x.shape
+                x = time_transformer(x.transpose(1, 2).reshape(b * f, t, d)).reshape(b, f, t, d).transpose(1, 2)
+                x = freq_transformer(x.reshape(b * t, f, d)).reshape(b, t, f, d)
+                if skip_connection:
+                    store.append(x)
+
+            return torch.stack([estimator(x) for estimator in model.mask_estimators], dim=1)
+
+    return MaskNetwork().eval()
+
+
+def export_onnx(separator: Any, onnx_path: str, segment_samples: int):
+    """Export the mask network of the loaded PyTorch model to ``onnx_path``."""
+    import torch
+
+    model = separator.model_instance.model_run
+    model.eval()
+    config = spectral_config(separator)
+    frames = segment_samples // config["hop_length"] + 1
+    bins = (config["n_fft"] // 2 + 1) * config["audio_channels"]
+    dummy = torch.zeros(1, bins, frames, 2, dtype=torch.float32, device=next(model.parameters()).device)
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            _mask_network(model),
+            dummy,
+            onnx_path,
+            input_names=["spec"],
+            output_names=["masks"],
+            dynamic_axes={"spec": {0: "batch"}, "masks": {0: "batch"}},
+            opset_version=17,
+        )
+    print(f"[ONNX Separator] Exported {onnx_path}")
+
+
+def verify_export(separator: Any, backend: "OnnxSeparatorBackend") -> float:
+    """SNR (dB) of the backend's stems against the PyTorch model on a noise segment."""
+    import torch
+
+    model = separator.model_instance.model_run
+    device = next(model.parameters()).device
+    mix = 0.1 * np.random.default_rng(0).standard_normal((1, 2, backend.segment_samples)).astype(np.float32)
+    with torch.no_grad():
+        reference = model(torch.from_numpy(mix).to(device)).float().cpu().numpy()
+    if reference.ndim == 3:
+        reference = reference[:, None]
+    output = backend.run_batch(mix)
+    error = np.sum((reference - output) ** 2)
+    return float(10 * np.log10(np.sum(reference ** 2) / max(error, 1e-20)))
+
+
+def quantize_onnx(fp32_path: str, int8_path: str):
+    """Dynamic int8 quantization of weights (activations stay float)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"[ONNX Separator] Quantized {fp32_path} -> {int8_path}")
+
+
+class OnnxSeparatorBackend:
+    """Runs the exported mask network on CPU with overlap-added segments."""
+
+    def __init__(self, onnx_path: str, segment_samples: int, stem_names: List[str], preset: str,
+                 spectral: Dict[str, Any]):
+        import onnxruntime as ort
+        import torch
+
+        config = ONNX_SEPARATION_PRESETS[preset]
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_INTRA_OP_THREADS > 0:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        if ONNX_INTER_OP_THREADS > 0:
+            options.inter_op_num_threads = ONNX_INTER_OP_THREADS
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.onnx_path = onnx_path
+        self.segment_samples = segment_samples
+        self.hop_samples = max(1, int(segment_samples * config["hop_fraction"]))
+        self.batch_size = config["batch_size"]
+        self.stem_names = stem_names
+
+        self._stft = {key: spectral[key] for key in ("n_fft", "hop_length", "win_length", "normalized")}
+        self._window = torch.hann_window(spectral["win_length"])
+        self._freq_indices = torch.tensor(spectral["freq_indices"], dtype=torch.long)
+        # Bands overlap; masks are averaged over the bands covering each bin
+        counts = np.repeat(np.asarray(spectral["num_bands_per_freq"], dtype=np.float32), spectral["audio_channels"])
+        self._band_counts = torch.from_numpy(np.maximum(counts, 1e-8))[:, None, None]
+
+    def run_batch(self, segments: np.ndarray) -> np.ndarray:
+        """``(batch, channels, samples)`` -> ``(batch, stems, channels, samples)``."""
+        import torch
+
+        mix = torch.from_numpy(np.ascontiguousarray(segments, dtype=np.float32))
+        batch, channels, length = mix.shape
+        spec = torch.stft(mix.reshape(batch * channels, length), window=self._window, return_complex=True, **self._stft)
+        bins, frames = spec.shape[1], spec.shape[2]
+        # (batch channels) freq frames -> batch (freq channels) frames, the model's bin order
+        spec = torch.view_as_real(spec).reshape(batch, channels, bins, frames, 2).transpose(1, 2).reshape(batch, -1, frames, 2)
+
+        masks = torch.from_numpy(self.session.run(None, {"spec": spec.numpy()})[0])
+        stems = masks.shape[1]
+        masks = masks.reshape(batch, stems, frames, -1, 2).transpose(2, 3)
+        summed = torch.zeros(batch, stems, spec.shape[1], frames, 2).index_add_(2, self._freq_indices, masks)
+        masks = torch.view_as_complex((summed / self._band_counts).contiguous())
+
+        separated = torch.view_as_complex(spec.contiguous())[:, None] * masks
+        separated = separated.reshape(batch, stems, bins, channels, frames).transpose(2, 3).reshape(-1, bins, frames)
+        audio = torch.istft(separated, window=self._window, length=length, **self._stft)
+        return audio.reshape(batch, stems, channels, length).numpy()
+
+    def demix(self, mix: np.ndarray) -> Dict[str, np.ndarray]:
+        return demix_segments(
+            mix, self.run_batch, self.stem_names,
+            self.segment_samples, self.hop_samples, self.batch_size,
+        )
+
+
+def load_onnx_backend(model_name: str, preset: str, load_separator: Callable[[], Any]) -> OnnxSeparatorBackend:
+    """Export and verify (once), optionally quantize (once) and open the ONNX backend.
+
+    ``load_separator`` is only called when no verified export exists yet;
+    segment length, stem order and STFT layout are kept in a JSON sidecar
+    next to it. Raises when the export fails or does not match PyTorch.
+    """
+    if preset not in ONNX_SEPARATION_PRESETS:
+        raise ValueError(f"Unknown ONNX separation preset: {preset}")
+
+    base = os.path.join(ONNX_SEPARATOR_DIR, os.path.splitext(model_name)[0])
+    fp32_path = f"{base}.onnx"
+    int8_path = f"{base}.int8.onnx"
+    meta_path = f"{base}.json"
+    meta = None
+    if os.path.exists(fp32_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != EXPORT_VERSION:
+            meta = None
+
+    if meta is None:
+        for path in (fp32_path, int8_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        separator = load_separator()
+        meta = {
+            "version": EXPORT_VERSION,
+            "segment_samples": model_segment_samples(separator),
+            "stem_names": model_stem_names(separator),
+            "spectral": spectral_config(separator),
+        }
+        export_onnx(separator, fp32_path, meta["segment_samples"])
+        snr = verify_export(separator, OnnxSeparatorBackend(
+            fp32_path, meta["segment_samples"], meta["stem_names"], "quality", meta["spectral"]))
+        if snr < MIN_EXPORT_SNR_DB:
+            os.remove(fp32_path)
+            raise RuntimeError(f"ONNX export does not match PyTorch (SNR {snr:.1f} dB < {MIN_EXPORT_SNR_DB} dB)")
+        print(f"[ONNX Separator] Export verified (SNR vs PyTorch {snr:.1f} dB)")
+        # Written last: the sidecar marks a verified export
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    onnx_path = fp32_path
+    if ONNX_SEPARATION_PRESETS[preset]["quantize"]:
+        onnx_path = int8_path
+        if not os.path.exists(onnx_path):
+            quantize_onnx(fp32_path, onnx_path)
+
+    return OnnxSeparatorBackend(onnx_path, meta["segment_samples"], meta["stem_names"], preset, meta["spectral"])
@@ -1,14 +1,56 @@
 # type: ignore
 import os
+import threading
+from concurrent.futures import Future
 from typing import Callable, Any
 
+import numpy as np
+import soundfile as sf
+import torch
 from audio_separator.separator import Separator  # type: ignore
 
-from src.config import TEMP_DIR  # type: ignore
+from src.config import (  # type: ignore
+    TEMP_DIR,
+    SEPARATION_STREAMING,
+    SEPARATION_STREAM_WINDOW_SEC,
+    SEPARATION_STREAM_OVERLAP_SEC,
+    SEPARATION_IN_MEMORY,
+    STEM_DELIVERY_FORMAT,
+    SEPARATOR_BACKEND,
+    ONNX_SEPARATOR_PRESET,
+    SEPARATION_BATCHING,
+    SEPARATION_BATCH_HOP_FRACTION,
+    SEPARATION_SKIP_SILENCE,
+    SEPARATION_SKIP_NONVOCAL,
+    SEPARATION_SILENCE_DB,
+    SEPARATION_SKIP_MIN_SEC,
+    SEPARATION_SKIP_MARGIN_SEC,
+    SEPARATION_VAD_THRESHOLD,
+    PRECISION_MIN_SNR_DB,
+)
+from src.processors.onnx_separator import load_onnx_backend, model_segment_samples, model_stem_names  # type: ignore
+from src.processors.stem_stream import (  # type: ignore
+    StemSink,
+    FileStemSink,
+    MemoryStemSink,
+    read_windows,
+    stream_windows,
+    overlap_add_stream,
+    demix_segments,
+    find_skip_spans,
+)
+from src.processors.vad_processor import vad_processor  # type: ignore
 from src.services.s3_service import s3_service  # type: ignore
+from src.services.model_registry import model_registry  # type: ignore
+from src.services.stem_encoder import stem_encoder  # type: ignore
+from src.services.separation_batcher import SeparationBatcher  # type: ignore
+from src.utils.audio import AudioBuffer, AudioSource, ensure_soundfile, load_mono, stream_channels, stream_length  # type: ignore
+from src.utils.precision import apply_precision, snr_db, synthetic_voice  # type: ignore
 
 
 MODEL_NAME = "mel_band_roformer_kim_ft3_unwa.ckpt"
+MODEL_SAMPLE_RATE = 44100
+ALL_STEMS = ("vocals", "instrumental")
 
 
 class SeparatorProcessor:
@@ -16,6 +58,226 @@ class SeparatorProcessor:
 
     def __init__(self):
         self.model_name: str = MODEL_NAME
+        self._batcher: SeparationBatcher | None = None
+        # Consumer threads race to create the one shared batcher
+        self._batcher_lock = threading.Lock()
+        # Set once an ONNX export or load fails; separation stays on PyTorch
+        self._onnx_unavailable = False
+        # Whole-file separation mutates the shared Separator's output settings
+        self._whole_file_lock = threading.Lock()
+
+    def _load_separator(self, for_export: bool = False) -> Any:
+        separator: Any = Separator(output_dir=TEMP_DIR, output_format="FLAC")
+        separator.load_model(self.model_name)  # type: ignore
+        if not for_export:
+            # The ONNX export must trace the float32 graph
+            self._apply_precision(separator)
+        return separator
+
+    def _apply_precision(self, separator: Any):
+        model = separator.model_instance.model_run
+        device = next(model.parameters()).device
+        segment = model_segment_samples(separator)
+
+        def run(mix: np.ndarray) -> np.ndarray:
+            return model(torch.from_numpy(mix[None]).to(device)).float().cpu().numpy()
+
+        def accept(references: list[np.ndarray], outputs: list[np.ndarray]) -> tuple[bool, str]:
+            worst = min(snr_db(ref, out) for ref, out in zip(references, outputs))
+            return worst >= PRECISION_MIN_SNR_DB, f"worst SNR vs float32 {worst:.1f} dB"
+
+        calibration = []
+        for seed in range(2):
+            # Voice over a sustained chord, panned differently per channel
+            voice = synthetic_voice(MODEL_SAMPLE_RATE, segment / MODEL_SAMPLE_RATE, seed)
+            t = np.arange(segment) / MODEL_SAMPLE_RATE
+            chord = sum(0.05 * np.sin(2 * np.pi * f * t) for f in (110.0, 138.6, 164.8, 220.0)).astype(np.float32)
+            calibration.append(np.stack([voice + chord, 0.7 * voice + chord]))
+
+        apply_precision(f"separator:{self.model_name}", model, device.type, run, calibration, accept)
+
+    def _get_loaded_separator(self) -> Any:
+        return model_registry.get(f"separator:{self.model_name}", self._load_separator)
+
+    def _lease_separator(self):
+        return model_registry.lease(f"separator:{self.model_name}", self._load_separator)
+
+    def _set_output(self, separator: Any, output_dir: str, single_stem: str | None = None):
+        # The loaded model is shared across jobs; only output settings are per job
+        separator.output_dir = output_dir
+        separator.model_instance.output_dir = output_dir
+        separator.output_single_stem = single_stem
+        separator.model_instance.output_single_stem = single_stem
+
+    def _demix(self, separator: Any, mix: np.ndarray) -> dict[str, np.ndarray]:
+        sources: dict[str, np.ndarray] = separator.model_instance.demix(mix)  # type: ignore
+        stems: dict[str, np.ndarray] = {}
+        for name, source in sources.items():
+            key = name.lower()
+            if "instrumental" in key or "other" in key:
+                stems["instrumental"] = source
+            elif "vocal" in key:
+                stems["vocals"] = source
+        # Single-target checkpoints only return vocals; the rest is the residual
+        if "vocals" in stems and "instrumental" not in stems:
+            stems["instrumental"] = mix - stems["vocals"]
+        return stems
+
+    def use_onnx(self) -> bool:
+        """Whether separation runs on ONNX Runtime; loads the backend on first use.
+
+        Only ``SEPARATOR_BACKEND=onnx`` selects it (``auto`` stays on PyTorch
+        until the export is validated per checkpoint). A failed export or
+        load falls back to PyTorch for the rest of the process.
+        """
+        if SEPARATOR_BACKEND != "onnx" or self._onnx_unavailable:
+            return False
+        try:
+            self._get_onnx_backend()
+        except Exception as e:
+            self._onnx_unavailable = True
+            print(f"[Separator] ONNX backend unavailable, falling back to PyTorch: {e}")
+            return False
+        return True
+
+    def _load_onnx_backend(self) -> Any:
+        export_key = f"separator-export:{self.model_name}"
+        try:
+            return load_onnx_backend(
+                self.model_name,
+                ONNX_SEPARATOR_PRESET,
+                lambda: model_registry.get(export_key, lambda: self._load_separator(for_export=True)),
+            )
+        finally:
+            # The float32 PyTorch model is only needed for the one-time export
+            model_registry.release(export_key)
+
+    def _get_onnx_backend(self) -> Any:
+        return model_registry.get(f"separator-onnx:{self.model_name}:{ONNX_SEPARATOR_PRESET}", self._load_onnx_backend)
+
+    def _lease_onnx_backend(self):
+        return model_registry.lease(f"separator-onnx:{self.model_name}:{ONNX_SEPARATOR_PRESET}", self._load_onnx_backend)
+
+    def _torch_run_batch(self, segments: np.ndarray) -> np.ndarray:
+        """``(batch, channels, samples)`` -> ``(batch, stems, channels, samples)`` on the PyTorch model."""
+        with self._lease_separator() as separator, torch.no_grad():
+            model = separator.model_instance.model_run
+            device = next(model.parameters()).device
+            output = model(torch.from_numpy(segments).to(device)).float().cpu().numpy()
+        if output.ndim == 3:
+            output = output[:, None]
+        return output
+
+    def _run_batch(self, segments: np.ndarray) -> np.ndarray:
+        # Leased per batch so registry eviction is never pinned by an idle batcher
+        if self.use_onnx():
+            with self._lease_onnx_backend() as backend:
+                return backend.run_batch(segments)
+        return self._torch_run_batch(segments)
+
+    def _get_batched_demixer(self) -> Callable[[np.ndarray], dict[str, np.ndarray]]:
+        with self._batcher_lock:
+            if self._batcher is None:
+                self._batcher = SeparationBatcher(self._run_batch)
+        if self.use_onnx():
+            backend = self._get_onnx_backend()
+            segment, stem_names = backend.segment_samples, backend.stem_names
+        else:
+            separator = self._get_loaded_separator()
+            segment, stem_names = model_segment_samples(separator), model_stem_names(separator)
+        hop = max(1, int(segment * SEPARATION_BATCH_HOP_FRACTION))
+        batcher = self._batcher
+
+        # Every segment of a window goes to the batcher at once; it merges them
+        # with other jobs' segments into model-sized batches
+        return lambda block: demix_segments(block, batcher.run, stem_names, segment, hop, batch_size=None)
+
+    def _get_demixer(self) -> Callable[[np.ndarray], dict[str, np.ndarray]]:
+        if SEPARATION_BATCHING:
+            return self._get_batched_demixer()
+        use_onnx = self.use_onnx()
+
+        def demix(block: np.ndarray) -> dict[str, np.ndarray]:
+            # Leased per window so a concurrent job cannot evict the model mid-window
+            if use_onnx:
+                with self._lease_onnx_backend() as backend:
+                    return backend.demix(block)
+            with self._lease_separator() as separator:
+                return self._demix(separator, block)
+
+        return demix
+
+    def _find_skip_spans(self, audio_path: str) -> list[tuple[int, int]]:
+        """Cheap pre-pass: sample spans (at the model rate) that can bypass inference."""
+        if not SEPARATION_SKIP_SILENCE:
+            return []
+
+        blocks = stream_channels(audio_path, MODEL_SAMPLE_RATE, MODEL_SAMPLE_RATE * 10)
+
+        voiced_spans = None
+        if SEPARATION_SKIP_NONVOCAL:
+            # Low threshold: only spans the VAD is confident are vocal-free get skipped
+            mixture_16k = load_mono(audio_path, vad_processor.SAMPLE_RATE)
+            voiced_spans = vad_processor.speech_spans(mixture_16k, threshold=SEPARATION_VAD_THRESHOLD)
+
+        spans = find_skip_spans(
+            blocks, MODEL_SAMPLE_RATE, SEPARATION_SILENCE_DB,
+            SEPARATION_SKIP_MIN_SEC, SEPARATION_SKIP_MARGIN_SEC, voiced_spans,
+        )
+        if spans:
+            skipped = sum(end - start for start, end in spans) / MODEL_SAMPLE_RATE
+            print(f"[Separator] Bypassing inference on {len(spans)} spans ({skipped:.1f}s)")
+        return spans
+
+    def separate_stream(
+        self,
+        audio_path: str,
+        sink: StemSink,
+        progress_callback: Callable[[int], None] | None = None,
+    ) -> int:
+        """Separate ``audio_path`` window by window, emitting stem blocks to ``sink``.
+
+        Windows of ``SEPARATION_STREAM_WINDOW_SEC`` are crossfaded over
+        ``SEPARATION_STREAM_OVERLAP_SEC`` so peak memory is bounded by the
+        window length rather than the song length. Returns samples emitted.
+        """
+        window = int(SEPARATION_STREAM_WINDOW_SEC * MODEL_SAMPLE_RATE)
+        overlap = int(SEPARATION_STREAM_OVERLAP_SEC * MODEL_SAMPLE_RATE)
+        if overlap <= 0 or overlap >= window:
+            raise ValueError("SEPARATION_STREAM_OVERLAP_SEC must be between 0 and the window length")
+
+        skip_spans = self._find_skip_spans(audio_path)
+        if sf.info(audio_path).samplerate == MODEL_SAMPLE_RATE:
+            windows = read_windows(audio_path, window, overlap)
+        else:
+            # Resampled block by block as windows are consumed
+            windows = stream_windows(stream_channels(audio_path, MODEL_SAMPLE_RATE), window, overlap)
+        total = max(1, stream_length(audio_path, MODEL_SAMPLE_RATE))
+        demix = self._get_demixer()
+
+        def on_window(position: int):
+            if progress_callback:
+                progress_callback(min(99, int(position / total * 100)))
+
+        return overlap_add_stream(
+            windows,
+            demix,
+            overlap,
+            sink,
+            on_window=on_window,
+            skip_spans=skip_spans,
+        )
+
+    def separate_to_memory(
+        self,
+        audio_path: str,
+        stems: tuple[str, ...] = ALL_STEMS,
+        progress_callback: Callable[[int], None] | None = None,
+    ) -> dict[str, AudioBuffer]:
+        """Separate ``audio_path`` into float32 ``AudioBuffer`` stems without touching disk."""
+        sink = MemoryStemSink(MODEL_SAMPLE_RATE, stems=stems, total_samples=stream_length(audio_path, MODEL_SAMPLE_RATE))
+        self.separate_stream(audio_path, sink, progress_callback)
+        return sink.buffers
 
     def separate(
         self,
@@ -23,7 +285,20 @@ class SeparatorProcessor:
         song_id: str,
         folder_name: str | None = None,
         progress_callback: Callable[[int], None] | None = None,
+        stems: tuple[str, ...] = ALL_STEMS,
     ) -> dict[str, object]:
+        """Separate ``audio_path`` and upload the requested ``stems``.
+
+        Stems that are not requested are neither written, encoded nor
+        uploaded; a missing instrumental can be produced later with
+        ``materialize_instrumental``.
+
+        With ``SEPARATION_IN_MEMORY`` the result also carries ``stems`` (the
+        ``AudioBuffer`` per stem, for downstream stages) and ``pending``
+        (encode/upload futures the caller must wait on before publishing).
+        ``frame_tables`` maps each uploaded stem to a future of its FLAC
+        frame table, for the lyric-line seek index.
+        """
         if folder_name is None:
             folder_name = song_id
 
@@ -35,32 +310,71 @@ class SeparatorProcessor:
 
         output_files: list[str] = []
         results: dict[str, str] = {}
+        delivery: dict[str, str] = {}
+        streaming: dict[str, str] = {}
+        peaks: dict[str, str] = {}
+        frame_tables: dict[str, Future] = {}
+        stem_files: dict[str, str] = {}
+        stem_buffers: dict[str, AudioBuffer] = {}
+        pending: list = []
         success = False
 
         try:
-            separator: Any = Separator(output_dir=output_dir, output_format="FLAC")
-            separator.load_model(self.model_name)  # type: ignore
-            output_files = separator.separate(audio_path)  # type: ignore
+            # The streaming readers need a libsndfile format (m4a/aac uploads are transcoded)
+            audio_path = ensure_soundfile(audio_path, output_dir)
+            windowed = SEPARATION_STREAMING or SEPARATION_BATCHING or self.use_onnx()
+            if windowed and SEPARATION_IN_MEMORY:
+                stem_buffers = self.separate_to_memory(audio_path, stems, progress_callback)
+            else:
+                if windowed:
+                    sink = FileStemSink(output_dir, MODEL_SAMPLE_RATE, stems=stems)
+                    self.separate_stream(audio_path, sink, progress_callback)
+                    output_files = list(sink.paths.values())
+                else:
+                    single_stem = "Vocals" if tuple(stems) == ("vocals",) else None
+                    with self._whole_file_lock, self._lease_separator() as separator:
+                        self._set_output(separator, output_dir, single_stem)
+                        output_files = separator.separate(audio_path)  # type: ignore
 
-            # audio-separator may return relative filenames; ensure absolute paths
-            output_files = [
-                f if os.path.isabs(f) else os.path.join(output_dir, os.path.basename(f))
-                for f in output_files
-            ]
+                # audio-separator may return relative filenames; ensure absolute paths
+                output_files = [
+                    f if os.path.isabs(f) else os.path.join(output_dir, os.path.basename(f))
+                    for f in output_files
+                ]
+                for output_file in output_files:
+                    filename = os.path.basename(output_file).lower()
+                    if "vocal" in filename:
+                        stem_files["vocals"] = output_file
+                    elif "instrumental" in filename or "other" in filename:
+                        stem_files["instrumental"] = output_file
+                if SEPARATION_IN_MEMORY:
+                    # Whole-file outputs are read back so downstream stages skip the disk
+                    stem_buffers = {
+                        key: AudioBuffer.from_file(path)
+                        for key, path in stem_files.items() if key in stems
+                    }
 
-            for output_file in output_files:
-                filename = os.path.basename(output_file).lower()
-                if "vocal" in filename:
-                    source_key = "vocals"
-                elif "instrumental" in filename or "other" in filename:
-                    source_key = "instrumental"
-                else:
-                    continue
+            stem_sources: dict[str, AudioSource] = dict(stem_buffers) if SEPARATION_IN_MEMORY else dict(stem_files)
 
-                s3_key = f"songs/{folder_name}/{source_key}.flac"
-                url = s3_service.upload_file(output_file, s3_key)
-                results[source_key] = url
+            # Every path gets the same renditions (FLAC, delivery, HLS, peaks)
+            for source_key, source in stem_sources.items():
+                if source_key not in stems:
+                    continue
+                urls, futures = stem_encoder.submit(source, song_id, folder_name, source_key)
+                results[source_key] = urls["flac"]
+                frame_tables[source_key] = futures[0]
+                if STEM_DELIVERY_FORMAT in urls:
+                    delivery[source_key] = urls[STEM_DELIVERY_FORMAT]
+                if "hls" in urls:
+                    streaming[source_key] = urls["hls"]
+                if "peaks" in urls:
+                    peaks[source_key] = urls["peaks"]
+                pending.extend(futures)
 
+            if not SEPARATION_IN_MEMORY:
+                # Encoders read the stem files, which are removed below
+                stem_encoder.wait(pending)
+                pending = []
             success = True
         finally:
             for output_file in output_files:
@@ -85,11 +399,91 @@ class SeparatorProcessor:
             if progress_callback and success:
                 progress_callback(100)
 
-        return {
+        result: dict[str, object] = {
             "vocals_url": results.get("vocals", ""),
             "instrumental_url": results.get("instrumental", ""),
             "all_sources": results,
         }
+        if delivery:
+            result["delivery_urls"] = delivery
+        if streaming:
+            result["streaming_urls"] = streaming
+        if peaks:
+            result["peaks_urls"] = peaks
+        result["frame_tables"] = frame_tables
+        if SEPARATION_IN_MEMORY:
+            result["stems"] = stem_buffers
+            result["pending"] = pending
+        return result
+
+    def derive_instrumental(self, mixture_path: str, vocals: str | AudioBuffer, output_path: str) -> str:
+        """Write ``mixture - vocals`` to ``output_path`` block by block.
+
+        ``vocals`` is a stem file or the job's in-memory vocals stem.
+        """
+        if isinstance(vocals, AudioBuffer):
+            sample_rate, channels = vocals.sample_rate, vocals.channels
+            vocals_file = None
+        else:
+            vocals_file = sf.SoundFile(vocals)
+            sample_rate, channels = vocals_file.samplerate, vocals_file.channels
+        block_size = MODEL_SAMPLE_RATE * 10
+
+        # audio-separator resamples its input; bring the mixture onto the stem rate
+        mixture_blocks = (block.T for block in stream_channels(mixture_path, sample_rate, block_size))
 
+        position = 0
+        try:
+            with sf.SoundFile(output_path, "w", samplerate=sample_rate, channels=channels, format="FLAC") as out:
+                for mixture_block in mixture_blocks:
+                    if vocals_file is None:
+                        vocals_block = vocals.samples[:, position:position + len(mixture_block)].T
+                    else:
+                        vocals_block = vocals_file.read(len(mixture_block), dtype="float32", always_2d=True)
+                    if len(vocals_block) == 0:
+                        break
+                    position += len(vocals_block)
+                    mixture_block = mixture_block[:len(vocals_block)]
+                    if mixture_block.shape[1] != vocals_block.shape[1]:
+                        mixture_block = np.repeat(mixture_block.mean(axis=1, keepdims=True), vocals_block.shape[1], axis=1)
+                    out.write(np.clip(mixture_block - vocals_block, -1.0, 1.0))
+        finally:
+            if vocals_file is not None:
+                vocals_file.close()
+
+        return output_path
+
+    def materialize_instrumental(
+        self,
+        mixture_path: str,
+        song_id: str,
+        folder_name: str | None = None,
+        vocals: AudioBuffer | None = None,
+    ) -> str:
+        """Produce the instrumental for a song separated in vocals-only mode.
+
+        Subtracts the vocals from the mixture and uploads the result next to
+        the stored vocals stem. Returns the instrumental URL. ``vocals`` is the
+        job's in-memory stem; without it the stored stem is downloaded, so its
+        upload must have finished.
+        """
+        if folder_name is None:
+            folder_name = song_id
+
+        output_dir = os.path.join(TEMP_DIR, song_id)
+        os.makedirs(output_dir, exist_ok=True)
+        vocals_path = os.path.join(output_dir, "stored_vocals.flac")
+        instrumental_path = os.path.join(output_dir, "instrumental.flac")
+
+        try:
+            if vocals is None:
+                s3_service.download_file(f"songs/{folder_name}/vocals.flac", vocals_path)
+                vocals = vocals_path
+            self.derive_instrumental(mixture_path, vocals, instrumental_path)
+            return s3_service.upload_file(instrumental_path, f"songs/{folder_name}/instrumental.flac")
+        finally:
+            for path in (vocals_path, instrumental_path):
+                if os.path.exists(path):
+                    os.remove(path)
 
 separator_processor = SeparatorProcessor()
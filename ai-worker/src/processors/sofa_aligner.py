@@ -19,6 +19,7 @@ from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 if TYPE_CHECKING:
     import numpy as np
+    from src.utils.audio import AudioSource
 
 from pathlib import Path
 
@@ -189,40 +190,27 @@ class SOFAAligner:
     # ------------------------------------------------------------------
 
     @staticmethod
-    def _load_audio(audio_path: str) -> "np.ndarray":
+    def _load_audio(audio_path: "AudioSource") -> "np.ndarray":
         """Load audio file and resample to 44100 Hz mono float32.
 
-        Uses soundfile for reading and librosa for resampling when needed.
+        Files are decoded and resampled block by block (see
+        ``src.utils.audio.stream_mono``), so only the 44.1 kHz mono result is
+        held in memory. In-memory ``AudioBuffer`` stems are downmixed and
+        resampled directly.
 
         Args:
-            audio_path: Path to any audio file supported by soundfile.
+            audio_path: Path to any audio file supported by soundfile, or an
+                ``AudioBuffer``.
 
         Returns:
             1-D numpy float32 array at 44100 Hz.
         """
-        import numpy as np
-        import soundfile as sf
+        from src.utils.audio import AudioBuffer, load_mono
 
-        if not Path(audio_path).exists():
+        if not isinstance(audio_path, AudioBuffer) and not Path(audio_path).exists():
             raise FileNotFoundError(f"Audio file not found: {audio_path}")
 
-        data, sr = sf.read(audio_path, dtype="float32", always_2d=True)
-
-        # Downmix to mono
-        if data.shape[1] > 1:
-            waveform = np.mean(data, axis=1)
-        else:
-            waveform = data[:, 0]
-
-        # Resample to SOFA sample rate if needed
-        if sr != _SOFA_SAMPLE_RATE:
-            import librosa
-
-            waveform = librosa.resample(
-                waveform, orig_sr=sr, target_sr=_SOFA_SAMPLE_RATE
-            )
-
-        return waveform.astype(np.float32)
+        return load_mono(audio_path, _SOFA_SAMPLE_RATE)
 
     # ------------------------------------------------------------------
     # Core alignment
@@ -469,7 +457,7 @@ class SOFAAligner:
 
     def align_words(
         self,
-        audio_path: str,
+        audio_path: "AudioSource",
         text: str,
         language: str = "ko",
     ) -> List[Dict]:
@@ -479,7 +467,8 @@ class SOFAAligner:
         into overlapping chunks, each aligned independently, then merged.
 
         Args:
-            audio_path: Path to audio file (WAV recommended, any sample rate).
+            audio_path: Path to audio file (WAV recommended, any sample rate)
+                or an in-memory ``AudioBuffer``.
             text: Lyrics text. Words separated by spaces, lines by newlines.
             language: Language code. Currently only ``"ko"`` is supported.
 
@@ -670,6 +659,16 @@ class SOFAAligner:
     # Resource management
     # ------------------------------------------------------------------
 
+    def load_model(self) -> None:
+        """Eagerly load the ONNX engine, G2P and vocabulary.
+
+        Lets callers that cache the aligner (see ``ModelRegistry``) pay the
+        load cost up front and measure the resulting memory footprint.
+        """
+        self._get_infer_engine()
+        self._get_g2p()
+        self._get_ph_to_idx()
+
     def release_model(self) -> None:
         """Release ONNX model and G2P to free GPU/CPU memory."""
         if self._infer_engine is not None:
@@ -0,0 +1,344 @@
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from src.utils.audio import AudioBuffer
+
+
+class StemSink:
+    """Receives separated stem blocks in timeline order.
+
+    ``write`` is called with a dict of ``stem -> (channels, samples)`` float32
+    arrays and the sample offset of the block; ``close`` once the stream ends.
+    """
+
+    def write(self, stems: Dict[str, np.ndarray], start: int) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class FileStemSink(StemSink):
+    """Appends each stem to its own audio file as blocks arrive.
+
+    Only stems listed in ``stems`` are written when it is given.
+    """
+
+    def __init__(self, output_dir: str, sample_rate: int, channels: int = 2, ext: str = "flac",
+                 stems: Optional[Iterable[str]] = None):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.ext = ext
+        self.stems = set(stems) if stems is not None else None
+        self.paths: Dict[str, str] = {}
+        self._files: Dict[str, sf.SoundFile] = {}
+
+    def write(self, stems: Dict[str, np.ndarray], start: int) -> None:
+        for name, block in stems.items():
+            if self.stems is not None and name not in self.stems:
+                continue
+            if name not in self._files:
+                path = os.path.join(self.output_dir, f"{name}.{self.ext}")
+                self._files[name] = sf.SoundFile(path, "w", samplerate=self.sample_rate, channels=self.channels)
+                self.paths[name] = path
+            self._files[name].write(block.T)
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+class MemoryStemSink(StemSink):
+    """Collects stems into float32 ``AudioBuffer`` objects.
+
+    With ``total_samples`` the output arrays are preallocated, so the stream
+    never holds more than the final buffers plus one window.
+    """
+
+    def __init__(self, sample_rate: int, channels: int = 2, stems: Optional[Iterable[str]] = None,
+                 total_samples: Optional[int] = None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.stems = set(stems) if stems is not None else None
+        self.total_samples = total_samples
+        self.buffers: Dict[str, AudioBuffer] = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._blocks: Dict[str, list] = {}
+
+    def write(self, stems: Dict[str, np.ndarray], start: int) -> None:
+        for name, block in stems.items():
+            if self.stems is not None and name not in self.stems:
+                continue
+            if self.total_samples is None:
+                self._blocks.setdefault(name, []).append(block)
+                continue
+            if name not in self._arrays:
+                self._arrays[name] = np.zeros((self.channels, self.total_samples), dtype=np.float32)
+            end = min(start + block.shape[1], self.total_samples)
+            self._arrays[name][:, start:end] = block[:, :end - start]
+
+    def close(self) -> None:
+        for name, blocks in self._blocks.items():
+            self._arrays[name] = np.concatenate(blocks, axis=1)
+        self._blocks.clear()
+        self.buffers = {name: AudioBuffer(array, self.sample_rate) for name, array in self._arrays.items()}
+
+
+class TeeSink(StemSink):
+    """Fans blocks out to several sinks (e.g. an encoder and a downstream stage)."""
+
+    def __init__(self, *sinks: StemSink):
+        self.sinks = sinks
+
+    def write(self, stems: Dict[str, np.ndarray], start: int) -> None:
+        for sink in self.sinks:
+            sink.write(stems, start)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+def _crossfade_ramps(length: int):
+    # Raised-cosine ramps that sum to exactly 1 across the overlap
+    fade_in = (0.5 - 0.5 * np.cos(np.pi * (np.arange(length) + 0.5) / length)).astype(np.float32)
+    return fade_in, (1.0 - fade_in).astype(np.float32)
+
+
+def _as_stereo(block: np.ndarray) -> np.ndarray:
+    # The separation models expect exactly two channels
+    if block.shape[0] == 1:
+        return np.repeat(block, 2, axis=0)
+    return block[:2]
+
+
+def read_windows(audio_path: str, window: int, overlap: int) -> Iterable[tuple]:
+    """Yield ``(start, (channels, samples) block, is_last)`` windows of a file.
+
+    Consecutive windows share ``overlap`` samples.
+    """
+    hop = window - overlap
+    with sf.SoundFile(audio_path) as f:
+        total = f.frames
+        start = 0
+        while True:
+            f.seek(start)
+            block = _as_stereo(f.read(window, dtype="float32", always_2d=True).T)
+            is_last = start + window >= total
+            yield start, block, is_last
+            if is_last:
+                break
+            start += hop
+
+
+def stream_windows(blocks: Iterable[np.ndarray], window: int, overlap: int) -> Iterable[tuple]:
+    """Same as ``read_windows`` for ``(channels, samples)`` blocks arriving in order.
+
+    Only the current window and the next incoming block are held, so e.g.
+    resampled input streams in bounded memory.
+    """
+    blocks = iter(blocks)
+    buffer = np.zeros((2, 0), dtype=np.float32)
+    start = 0
+    exhausted = False
+    while True:
+        # Reading one sample past the window tells whether this window is the last
+        parts = [buffer]
+        available = buffer.shape[1]
+        while not exhausted and available <= window:
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+            else:
+                parts.append(_as_stereo(np.atleast_2d(block)))
+                available += parts[-1].shape[1]
+        if len(parts) > 1:
+            buffer = np.concatenate(parts, axis=1)
+        is_last = buffer.shape[1] <= window
+        yield start, buffer[:, :window], is_last
+        if is_last:
+            break
+        buffer = buffer[:, window - overlap:].copy()
+        start += window - overlap
+
+
+def find_skip_spans(
+    blocks: Iterable[np.ndarray],
+    sample_rate: int,
+    silence_db: float,
+    min_span_sec: float,
+    margin_sec: float,
+    voiced_spans: Optional[Sequence[Tuple[float, float]]] = None,
+    frame: int = 1024,
+) -> List[Tuple[int, int]]:
+    """Find sample ranges of the mixture that need no model inference.
+
+    A frame is skippable when its RMS is below ``silence_db`` dBFS, or, when
+    ``voiced_spans`` (seconds) are given, when it lies outside all of them.
+    Runs shorter than ``min_span_sec`` are ignored and each span is shrunk
+    by ``margin_sec`` on both sides so the model still sees every onset.
+    ``blocks`` are ``(channels, samples)`` chunks in order; only frame RMS
+    values are kept, so the pass runs in constant memory.
+    """
+    rms_values = []
+    carry = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        mono = np.concatenate([carry, np.atleast_2d(block).mean(axis=0)])
+        usable = len(mono) // frame * frame
+        if usable:
+            rms_values.append(np.sqrt(np.mean(mono[:usable].reshape(-1, frame) ** 2, axis=1)))
+        carry = mono[usable:]
+    if len(carry):
+        rms_values.append(np.array([np.sqrt(np.mean(carry ** 2))]))
+    if not rms_values:
+        return []
+
+    rms = np.concatenate(rms_values)
+    skippable = 20 * np.log10(np.maximum(rms, 1e-10)) < silence_db
+    if voiced_spans is not None:
+        frame_times = np.arange(len(rms)) * frame / sample_rate
+        voiced = np.zeros(len(rms), dtype=bool)
+        for span_start, span_end in voiced_spans:
+            voiced |= (frame_times + frame / sample_rate > span_start) & (frame_times < span_end)
+        skippable |= ~voiced
+
+    # Runs of skippable frames -> sample spans
+    edges = np.diff(np.concatenate([[0], skippable.astype(np.int8), [0]]))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    margin = int(margin_sec * sample_rate)
+    min_span = int(min_span_sec * sample_rate)
+    spans = []
+    for run_start, run_end in zip(run_starts, run_ends):
+        start = run_start * frame + (margin if run_start > 0 else 0)
+        end = run_end * frame - (margin if run_end < len(rms) else 0)
+        if end - start >= min_span:
+            spans.append((int(start), int(end)))
+    return spans
+
+
+def _demix_with_skips(
+    block: np.ndarray,
+    start: int,
+    demix: Callable[[np.ndarray], Dict[str, np.ndarray]],
+    skip_spans: Sequence[Tuple[int, int]],
+) -> Dict[str, np.ndarray]:
+    """Demix only the parts of ``block`` outside ``skip_spans``.
+
+    Skipped samples get silent vocals and the mixture passed through as the
+    instrumental, which is what the model would produce there anyway.
+    """
+    length = block.shape[1]
+    local = [
+        (max(span_start, start) - start, min(span_end, start + length) - start)
+        for span_start, span_end in skip_spans
+        if span_start < start + length and span_end > start
+    ]
+    if not local:
+        return demix(block)
+
+    stems = {"vocals": np.zeros_like(block), "instrumental": block.copy()}
+    cursor = 0
+    for skip_start, skip_end in local + [(length, length)]:
+        if skip_start > cursor:
+            for name, stem in demix(block[:, cursor:skip_start]).items():
+                stems[name][:, cursor:skip_start] = stem[:, :skip_start - cursor]
+        cursor = max(cursor, skip_end)
+    return stems
+
+
+def overlap_add_stream(
+    windows: Iterable[tuple],
+    demix: Callable[[np.ndarray], Dict[str, np.ndarray]],
+    overlap: int,
+    sink: StemSink,
+    on_window: Callable[[int], None] | None = None,
+    skip_spans: Optional[Sequence[Tuple[int, int]]] = None,
+) -> int:
+    """Separate overlapping windows and emit crossfaded stem blocks to ``sink``.
+
+    Each window's first ``overlap`` samples are blended with the previous
+    window's tail; everything before the tail is final and is emitted
+    immediately, so at most one window of output is held at a time.
+    Samples inside ``skip_spans`` bypass the model entirely.
+    Returns the number of samples emitted.
+    """
+    fade_in, fade_out = _crossfade_ramps(overlap)
+    tail: Dict[str, np.ndarray] = {}
+    emitted = 0
+
+    for start, block, is_last in windows:
+        if skip_spans:
+            stems = _demix_with_skips(block, start, demix, skip_spans)
+        else:
+            stems = demix(block)
+        length = block.shape[1]
+        out: Dict[str, np.ndarray] = {}
+
+        for name, stem in stems.items():
+            stem = stem[:, :length].astype(np.float32, copy=True)
+            if name in tail:
+                blend = min(overlap, length)
+                stem[:, :blend] = stem[:, :blend] * fade_in[:blend] + tail[name][:, :blend]
+            if is_last:
+                out[name] = stem
+            else:
+                out[name] = stem[:, :length - overlap]
+                tail[name] = stem[:, length - overlap:] * fade_out
+        sink.write(out, emitted)
+        emitted += next(iter(out.values())).shape[1] if out else 0
+
+        if on_window:
+            on_window(start + length)
+
+    sink.close()
+    return emitted
+
+
+def demix_segments(
+    mix: np.ndarray,
+    run_batch: Callable[[np.ndarray], np.ndarray],
+    stem_names: List[str],
+    segment: int,
+    hop: int,
+    batch_size: Optional[int] = 1,
+) -> Dict[str, np.ndarray]:
+    """Run a fixed-length separation network over ``mix`` with weighted overlap-add.
+
+    ``run_batch`` maps ``(batch, channels, segment)`` to
+    ``(batch, stems, channels, segment)``; ``batch_size=None`` passes all
+    segments in one call. Both ends are padded so every real
+    sample sits under full window coverage. A single-target network's
+    missing instrumental is returned as the residual.
+    """
+    channels, length = mix.shape
+    pad = segment - hop
+    padded = np.pad(mix, ((0, 0), (pad, pad + segment)))
+    starts = list(range(0, length + pad, hop))
+
+    if hop >= segment:
+        window = np.ones(segment, dtype=np.float32)
+    else:
+        window = np.maximum(np.hanning(segment), 1e-3).astype(np.float32)
+
+    out = np.zeros((len(stem_names), channels, padded.shape[1]), dtype=np.float32)
+    weight = np.zeros(padded.shape[1], dtype=np.float32)
+    step = batch_size or len(starts)
+    for i in range(0, len(starts), step):
+        batch_starts = starts[i:i + step]
+        batch = np.stack([padded[:, s:s + segment] for s in batch_starts])
+        result = run_batch(batch)
+        for s, stems in zip(batch_starts, result):
+            out[:, :, s:s + segment] += stems * window
+            weight[s:s + segment] += window
+
+    out = out[:, :, pad:pad + length] / np.maximum(weight[pad:pad + length], 1e-8)
+    separated = dict(zip(stem_names, out))
+    if "instrumental" not in separated and "vocals" in separated:
+        separated["instrumental"] = mix - separated["vocals"]
+    return separated
@@ -0,0 +1,161 @@
+import os
+import json
+import subprocess
+from typing import Dict, List
+from src.config import TEMP_DIR, TRANSPOSE_SEMITONES, STEM_DELIVERY_FORMAT, STEM_DELIVERY_BITRATE, PITCH_LOD_FACTORS
+from src.services.s3_service import s3_service
+from src.processors.fcpe_processor import fcpe_processor
+from src.utils.pitch_format import transpose_pitch_track
+
+
+class TransposeProcessor:
+    """Key-shifted instrumentals and pitch tracks, rendered on first request.
+
+    Renditions live at ``songs/{folder}/keys/{+n|-n}/`` next to the original
+    stems. A request for a key that is already in S3 only returns the URLs,
+    so the backend can ask for a key every time a room switches to it.
+    """
+
+    def key_prefix(self, folder_name: str, semitones: int) -> str:
+        return f"songs/{folder_name}/keys/{semitones:+d}"
+
+    def _instrumental_ext(self) -> str:
+        return "opus" if STEM_DELIVERY_FORMAT == "opus" else "flac"
+
+    def render(self, song_id: str, folder_name: str, semitones: int) -> Dict[str, str]:
+        """Return ``{instrumental_url, pitch_url, ...}`` for ``semitones``, rendering if missing."""
+        if semitones not in TRANSPOSE_SEMITONES:
+            raise ValueError(f"Unsupported transposition: {semitones:+d} semitones")
+
+        prefix = self.key_prefix(folder_name, semitones)
+        instrumental_key = f"{prefix}/instrumental.{self._instrumental_ext()}"
+        pitch_key = f"{prefix}/pitch.json"
+
+        if not s3_service.exists(instrumental_key):
+            self._render_instrumental(song_id, folder_name, semitones, instrumental_key)
+        else:
+            print(f"[Transpose] {instrumental_key} already rendered")
+
+        pitch_url = ""
+        if s3_service.exists(pitch_key):
+            pitch_url = s3_service.get_url(pitch_key)
+        elif s3_service.exists(f"songs/{folder_name}/pitch.json"):
+            pitch_url = self._transpose_pitch_file(song_id, folder_name, semitones, pitch_key)
+
+        pitch_bin_url = self._transposed_track_url(song_id, folder_name, semitones, "pitch.bin.gz")
+        pitch_lod_urls = {}
+        for factor in PITCH_LOD_FACTORS:
+            # Levels of detail use 10 ms FCPE frames as their unit, see FcpeProcessor._upload_pitch_levels
+            url = self._transposed_track_url(song_id, folder_name, semitones, f"pitch/{factor * 10}ms.bin.gz")
+            if url:
+                pitch_lod_urls[str(factor * 10)] = url
+
+        notes_key = f"{prefix}/notes.json"
+        notes_url = ""
+        if s3_service.exists(notes_key):
+            notes_url = s3_service.get_url(notes_key)
+        elif s3_service.exists(f"songs/{folder_name}/notes.json"):
+            notes_url = self._transpose_notes_file(song_id, folder_name, semitones, notes_key)
+
+        return {
+            "semitones": semitones,
+            "instrumental_url": s3_service.get_url(instrumental_key),
+            "pitch_url": pitch_url,
+            "pitch_bin_url": pitch_bin_url,
+            "pitch_lod_urls": pitch_lod_urls,
+            "notes_url": notes_url,
+        }
+
+    def _render_instrumental(self, song_id: str, folder_name: str, semitones: int, s3_key: str):
+        source_path = os.path.join(TEMP_DIR, f"{song_id}_transpose_source.flac")
+        output_path = os.path.join(TEMP_DIR, f"{song_id}_transpose{semitones:+d}.{self._instrumental_ext()}")
+        if self._instrumental_ext() == "opus":
+            codec_args = ["-c:a", "libopus", "-b:a", STEM_DELIVERY_BITRATE, "-vbr", "on"]
+        else:
+            codec_args = ["-c:a", "flac"]
+
+        try:
+            s3_service.download_file(f"songs/{folder_name}/instrumental.flac", source_path)
+            # Rubber Band keeps tempo and transients while shifting pitch
+            cmd = [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-i", source_path,
+                "-af", f"rubberband=pitch={2 ** (semitones / 12):.6f}:pitchq=quality",
+                *codec_args,
+                output_path,
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed for {output_path}: {result.stderr}")
+            s3_service.upload_file(output_path, s3_key)
+            print(f"[Transpose] Rendered {s3_key}")
+        finally:
+            for path in (source_path, output_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _transpose_pitch_file(self, song_id: str, folder_name: str, semitones: int, s3_key: str) -> str:
+        local_path = os.path.join(TEMP_DIR, f"{song_id}_transpose_pitch.json")
+        try:
+            s3_service.download_file(f"songs/{folder_name}/pitch.json", local_path)
+            with open(local_path, "r", encoding="utf-8") as f:
+                pitch_data = json.load(f)
+            with open(local_path, "w", encoding="utf-8") as f:
+                json.dump(self.transpose_pitch_data(pitch_data, semitones), f, indent=2)
+            return s3_service.upload_file(local_path, s3_key)
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    def _transposed_track_url(self, song_id: str, folder_name: str, semitones: int, name: str) -> str:
+        """URL of the key-shifted copy of ``songs/{folder}/{name}``; "" if the original is missing."""
+        s3_key = f"{self.key_prefix(folder_name, semitones)}/{name}"
+        if s3_service.exists(s3_key):
+            return s3_service.get_url(s3_key)
+        if s3_service.exists(f"songs/{folder_name}/{name}"):
+            return self._transpose_pitch_track_file(song_id, folder_name, semitones, name, s3_key)
+        return ""
+
+    def _transpose_pitch_track_file(self, song_id: str, folder_name: str, semitones: int, name: str, s3_key: str) -> str:
+        local_path = os.path.join(TEMP_DIR, f"{song_id}_transpose_{name.replace('/', '_')}")
+        try:
+            s3_service.download_file(f"songs/{folder_name}/{name}", local_path)
+            with open(local_path, "rb") as f:
+                data = f.read()
+            with open(local_path, "wb") as f:
+                f.write(transpose_pitch_track(data, semitones))
+            return s3_service.upload_file(local_path, s3_key)
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    def _transpose_notes_file(self, song_id: str, folder_name: str, semitones: int, s3_key: str) -> str:
+        local_path = os.path.join(TEMP_DIR, f"{song_id}_transpose_notes.json")
+        try:
+            s3_service.download_file(f"songs/{folder_name}/notes.json", local_path)
+            with open(local_path, "r", encoding="utf-8") as f:
+                document = json.load(f)
+            # Cents deviation is relative to the note, so only the MIDI number moves
+            document["notes"] = [{**note, "midi": note["midi"] + semitones} for note in document["notes"]]
+            with open(local_path, "w", encoding="utf-8") as f:
+                json.dump(document, f)
+            return s3_service.upload_file(local_path, s3_key)
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    def transpose_pitch_data(self, pitch_data: List[Dict], semitones: int) -> List[Dict]:
+        ratio = 2 ** (semitones / 12)
+        transposed = []
+        for point in pitch_data:
+            frequency = point["frequency"] * ratio
+            transposed.append({
+                **point,
+                "frequency": round(frequency, 2),
+                "note": fcpe_processor._frequency_to_note(frequency),
+                "midi": fcpe_processor._frequency_to_midi(frequency),
+            })
+        return transposed
+
+
+transpose_processor = TransposeProcessor()
@@ -0,0 +1,61 @@
+import threading
+from typing import List, Tuple
+import numpy as np
+import torch
+from silero_vad import load_silero_vad, get_speech_timestamps
+from src.services.model_registry import model_registry
+from src.utils.audio import AudioBuffer, AudioSource, stream_mono
+
+
+class VadProcessor:
+    """Voice activity detection with silero-vad on 16 kHz mono audio."""
+
+    SAMPLE_RATE = 16000
+    MIN_SILENCE_MS = 300
+    TIMELINE_BLOCK_SEC = 600
+
+    def __init__(self):
+        # silero-vad keeps recurrent state inside the model; one caller at a time
+        self._lock = threading.Lock()
+
+    def speech_spans(self, audio: np.ndarray, threshold: float = 0.5,
+                     min_silence_ms: int = MIN_SILENCE_MS, speech_pad_ms: int = 100) -> List[Tuple[float, float]]:
+        """Return ``(start, end)`` seconds of detected voice in ``audio`` (16 kHz mono)."""
+        with self._lock, model_registry.lease("silero-vad", load_silero_vad) as model:
+            timestamps = get_speech_timestamps(
+                torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32)),
+                model,
+                threshold=threshold,
+                sampling_rate=self.SAMPLE_RATE,
+                min_silence_duration_ms=min_silence_ms,
+                speech_pad_ms=speech_pad_ms,
+                return_seconds=True,
+            )
+        return [(float(t["start"]), float(t["end"])) for t in timestamps]
+
+    def timeline(self, source: AudioSource, threshold: float = 0.5) -> List[Tuple[float, float]]:
+        """``speech_spans`` of ``source``; one VAD pass per ``AudioBuffer`` and threshold.
+
+        The audio is streamed in ``TIMELINE_BLOCK_SEC`` blocks, so long files
+        never need to be decoded in full.
+        """
+        def compute():
+            spans: List[Tuple[float, float]] = []
+            offset = 0.0
+            for block in stream_mono(source, self.SAMPLE_RATE, self.SAMPLE_RATE * self.TIMELINE_BLOCK_SEC):
+                for start, end in self.speech_spans(block, threshold=threshold):
+                    start, end = start + offset, end + offset
+                    # Rejoin spans cut by a block boundary
+                    if spans and start - spans[-1][1] < self.MIN_SILENCE_MS / 1000:
+                        spans[-1] = (spans[-1][0], end)
+                    else:
+                        spans.append((start, end))
+                offset += len(block) / self.SAMPLE_RATE
+            return spans
+
+        if isinstance(source, AudioBuffer):
+            return source.memo(f"vad_spans:{threshold}", compute)
+        return compute()
+
+
+vad_processor = VadProcessor()
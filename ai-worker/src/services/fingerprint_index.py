@@ -0,0 +1,261 @@
+import os
+import json
+import base64
+import threading
+import time
+from typing import Any, Dict, Optional
+import numpy as np
+from src.config import (
+    REDIS_HOST,
+    REDIS_PORT,
+    FINGERPRINT_BACKEND,
+    FINGERPRINT_INDEX_PATH,
+    FINGERPRINT_MAX_BER,
+    FINGERPRINT_MIN_OVERLAP,
+)
+from src.utils.audio import AudioSource, load_mono
+
+try:
+    import redis as redis_lib
+except ImportError:
+    redis_lib = None
+
+
+class FingerprintIndex:
+    """Perceptual fingerprints of processed songs, for reusing stems across re-uploads.
+
+    Fingerprints follow Haitsma & Kalker: one 32-bit sub-fingerprint per
+    frame, each bit the sign of the time/frequency difference of energies in
+    33 log-spaced bands between 300 and 2000 Hz. Re-encodes and different
+    uploads of the same recording keep most bits, so candidates are found by
+    exact sub-fingerprint hits voting for a time offset and then verified by
+    the bit error rate over the aligned overlap.
+
+    Entries (fingerprint, folder and the job results) live in a Redis hash
+    shared by all workers, or in a local JSON file. Only every
+    ``POSTING_STRIDE``-th frame is posted to the in-memory lookup table; the
+    query uses every frame, so any alignment still finds hits.
+    """
+
+    SAMPLE_RATE = 5512
+    FRAME_SIZE = 2048
+    HOP_SIZE = 64
+    BAND_EDGES = np.geomspace(300, 2000, 34)
+    POSTING_STRIDE = 4
+    MIN_VOTES = 8
+    CANDIDATES = 3
+    REDIS_KEY = "kero:fingerprints"
+
+    def __init__(self, backend: str = FINGERPRINT_BACKEND, index_path: str = FINGERPRINT_INDEX_PATH,
+                 max_ber: float = FINGERPRINT_MAX_BER, min_overlap: float = FINGERPRINT_MIN_OVERLAP):
+        self.index_path = index_path
+        self.max_ber = max_ber
+        self.min_overlap = min_overlap
+        self.redis_client = None
+        if backend == "redis" and redis_lib:
+            self.redis_client = redis_lib.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._fingerprints: Dict[str, np.ndarray] = {}
+        self._postings: Optional[tuple] = None
+        if self.redis_client is None:
+            self._load_local()
+
+    @property
+    def frame_seconds(self) -> float:
+        return self.HOP_SIZE / self.SAMPLE_RATE
+
+    def fingerprint(self, source: AudioSource) -> np.ndarray:
+        """32-bit sub-fingerprints, one per ``HOP_SIZE`` samples at 5512 Hz."""
+        audio = load_mono(source, self.SAMPLE_RATE)
+        if len(audio) < self.FRAME_SIZE + self.HOP_SIZE:
+            return np.zeros(0, dtype=np.uint32)
+
+        count = 1 + (len(audio) - self.FRAME_SIZE) // self.HOP_SIZE
+        frames = np.lib.stride_tricks.as_strided(
+            audio,
+            shape=(count, self.FRAME_SIZE),
+            strides=(audio.strides[0] * self.HOP_SIZE, audio.strides[0]),
+        )
+        power = np.abs(np.fft.rfft(frames * np.hanning(self.FRAME_SIZE), axis=1)) ** 2
+
+        freqs = np.fft.rfftfreq(self.FRAME_SIZE, 1 / self.SAMPLE_RATE)
+        band_index = np.digitize(freqs, self.BAND_EDGES) - 1
+        valid = (band_index >= 0) & (band_index < len(self.BAND_EDGES) - 1)
+        energies = np.zeros((count, len(self.BAND_EDGES) - 1))
+        np.add.at(energies.T, band_index[valid], power[:, valid].T)
+
+        band_diff = energies[:, :-1] - energies[:, 1:]
+        bits = (band_diff[1:] - band_diff[:-1]) > 0
+        return np.packbits(bits, axis=1, bitorder="little").view("<u4").ravel().astype(np.uint32)
+
+    def lookup(self, fingerprint: np.ndarray, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Best verified match as ``{song_id, folder_name, offset_sec, ber, results}``.
+
+        ``offset_sec`` is where the stored song starts on the query timeline
+        (positive when the query has extra audio in front). The entry of
+        ``exclude`` (the querying song itself, when reprocessed) never matches.
+        """
+        if len(fingerprint) == 0:
+            return None
+
+        with self._lock:
+            self._sync()
+            if not self._fingerprints:
+                return None
+            values, owners, frames, owner_ids = self._posting_table()
+
+            lo = np.searchsorted(values, fingerprint, side="left")
+            hi = np.searchsorted(values, fingerprint, side="right")
+            # Digital silence and clipping produce all-0 / all-1 words; they carry no identity
+            informative = (fingerprint != 0) & (fingerprint != 0xFFFFFFFF)
+            hits = np.nonzero((hi > lo) & informative)[0]
+            if len(hits) == 0:
+                return None
+            query_frames = np.repeat(hits, (hi - lo)[hits])
+            rows = np.concatenate([np.arange(lo[i], hi[i]) for i in hits])
+            if exclude in owner_ids:
+                kept = owners[rows] != owner_ids.index(exclude)
+                query_frames, rows = query_frames[kept], rows[kept]
+
+            # Each hit votes for (entry, offset); one key per pair packs both into an int64
+            offsets = frames[rows] - query_frames
+            keys = owners[rows].astype(np.int64) * (1 << 32) + (offsets + (1 << 31))
+            unique_keys, counts = np.unique(keys, return_counts=True)
+
+            best = None
+            for i in np.argsort(-counts, kind="stable")[:self.CANDIDATES]:
+                if counts[i] < self.MIN_VOTES:
+                    break
+                owner, offset = int(unique_keys[i] >> 32), int(unique_keys[i] & 0xFFFFFFFF) - (1 << 31)
+                entry_id = owner_ids[owner]
+                # Votes are sparse (strided postings); the true alignment may be a frame away
+                for candidate in (offset - 1, offset, offset + 1):
+                    ber = self._verify(fingerprint, self._fingerprints[entry_id], candidate)
+                    if ber is not None and (best is None or ber < best[2]):
+                        best = (entry_id, candidate, ber)
+
+        if best is None:
+            return None
+        entry_id, offset, ber = best
+        entry = self._read_entry(entry_id) or self._entries[entry_id]
+        print(f"[Fingerprint] Matched {entry_id} (BER {ber:.3f}, offset {-offset * self.frame_seconds:+.2f}s)")
+        return {
+            "song_id": entry_id,
+            "folder_name": entry["folder_name"],
+            "offset_sec": round(-offset * self.frame_seconds, 3),
+            "ber": round(ber, 4),
+            "results": entry.get("results", {}),
+        }
+
+    def add(self, song_id: str, folder_name: str, fingerprint: Optional[np.ndarray], results: Dict[str, Any]):
+        """Store (or merge results into) the entry for ``song_id``.
+
+        ``fingerprint`` may be ``None`` when updating an existing entry.
+        Storage errors are logged, never raised: indexing is best-effort.
+        """
+        with self._lock:
+            try:
+                entry = self._read_entry(song_id) or {}
+            except Exception as e:
+                # Merging into a stale copy could drop another worker's results
+                print(f"[Fingerprint] Failed to read entry {song_id}, not indexing: {e}")
+                return
+            if fingerprint is None and "fingerprint" not in entry:
+                return
+            merged = {**entry.get("results", {}), **self._reusable_results(results)}
+            entry.update({"folder_name": folder_name, "results": merged, "updated_at": int(time.time())})
+            if fingerprint is not None:
+                entry["fingerprint"] = base64.b64encode(fingerprint.astype("<u4").tobytes()).decode("ascii")
+            self._entries[song_id] = entry
+            self._fingerprints[song_id] = self._decode(entry["fingerprint"])
+            self._postings = None
+            try:
+                self._write_entry(song_id, entry)
+            except Exception as e:
+                print(f"[Fingerprint] Failed to persist entry {song_id}: {e}")
+
+    def _reusable_results(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        reusable = {key: results[key] for key in ("separation", "lyrics") if results.get(key)}
+        if results.get("pitch"):
+            # Frame-level pitch data is already in S3; keep the index compact
+            reusable["pitch"] = {k: v for k, v in results["pitch"].items() if k != "pitch_data"}
+        return reusable
+
+    def _verify(self, query: np.ndarray, reference: np.ndarray, offset: int) -> Optional[float]:
+        """Bit error rate with ``reference[i + offset]`` aligned to ``query[i]``, or None."""
+        start = max(0, -offset)
+        end = min(len(query), len(reference) - offset)
+        overlap = end - start
+        if overlap <= 0 or overlap < self.min_overlap * max(len(query), len(reference)):
+            return None
+        diff = np.bitwise_xor(query[start:end], reference[start + offset:end + offset])
+        errors = np.unpackbits(diff.view(np.uint8)).sum()
+        ber = float(errors) / (overlap * 32)
+        return ber if ber <= self.max_ber else None
+
+    def _posting_table(self):
+        if self._postings is None:
+            owner_ids = list(self._fingerprints)
+            values, owners, frames = [], [], []
+            for owner, entry_id in enumerate(owner_ids):
+                posted = np.arange(0, len(self._fingerprints[entry_id]), self.POSTING_STRIDE)
+                values.append(self._fingerprints[entry_id][posted])
+                owners.append(np.full(len(posted), owner, dtype=np.int32))
+                frames.append(posted.astype(np.int64))
+            values = np.concatenate(values)
+            order = np.argsort(values, kind="stable")
+            self._postings = (values[order], np.concatenate(owners)[order], np.concatenate(frames)[order], owner_ids)
+        return self._postings
+
+    def _decode(self, encoded: str) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(encoded), dtype="<u4").astype(np.uint32)
+
+    def _sync(self):
+        """Pick up entries other workers added to the shared Redis index."""
+        if self.redis_client is None:
+            return
+        missing = [entry_id for entry_id in self.redis_client.hkeys(self.REDIS_KEY) if entry_id not in self._entries]
+        if not missing:
+            return
+        for entry_id, raw in zip(missing, self.redis_client.hmget(self.REDIS_KEY, missing)):
+            if raw:
+                entry = json.loads(raw)
+                self._entries[entry_id] = entry
+                self._fingerprints[entry_id] = self._decode(entry["fingerprint"])
+        self._postings = None
+
+    def _read_entry(self, entry_id: str) -> Optional[Dict]:
+        if self.redis_client is None:
+            return self._entries.get(entry_id)
+        raw = self.redis_client.hget(self.REDIS_KEY, entry_id)
+        return json.loads(raw) if raw else None
+
+    def _write_entry(self, entry_id: str, entry: Dict):
+        if self.redis_client is not None:
+            self.redis_client.hset(self.REDIS_KEY, entry_id, json.dumps(entry, ensure_ascii=False))
+            return
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _load_local(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Fingerprint] Failed to load {self.index_path}: {e}")
+            return
+        for entry_id, entry in entries.items():
+            self._entries[entry_id] = entry
+            self._fingerprints[entry_id] = self._decode(entry["fingerprint"])
+        print(f"[Fingerprint] Loaded {len(self._entries)} entries from {self.index_path}")
+
+
+fingerprint_index = FingerprintIndex()
@@ -0,0 +1,167 @@
+import os
+import json
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional, Set, Tuple
+from src.config import LYRICS_INDEX_PATH, ARTIST_ALIASES_PATH, LYRICS_INDEX_MIN_SCORE
+
+
+class LyricsIndex:
+    """Local index of previously fetched lyrics, matched by fuzzy title/artist.
+
+    Titles and artists are normalized (NFKC, casefold, bracketed suffixes and
+    punctuation removed) and artists are mapped onto a canonical name through
+    the backend's ``artist_aliases.tsv`` so that e.g. ``ヨルシカ`` and ``요루시카``
+    resolve to the same key. Candidates are found through a character-bigram
+    inverted index and scored with the Dice coefficient.
+
+    Lyrics are only reused when both title and artist match: common titles
+    are shared by many songs, so a title-only hit is never trusted.
+    """
+
+    NGRAM_SIZE = 2
+    TITLE_WEIGHT = 0.7
+    ARTIST_WEIGHT = 0.3
+    MIN_TITLE_SCORE = 0.6
+    MIN_ARTIST_SCORE = 0.6
+
+    def __init__(self, index_path: str = LYRICS_INDEX_PATH, aliases_path: str = ARTIST_ALIASES_PATH,
+                 min_score: float = LYRICS_INDEX_MIN_SCORE):
+        self.index_path = index_path
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._aliases = self._load_aliases(aliases_path)
+        self._entries: Dict[str, Dict] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._load()
+
+    def _load_aliases(self, aliases_path: str) -> Dict[str, str]:
+        aliases: Dict[str, str] = {}
+        try:
+            with open(aliases_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.strip().split("\t")
+                    if len(parts) != 2:
+                        continue
+                    canonical = self._normalize(parts[1])
+                    if not canonical:
+                        continue
+                    for name in parts:
+                        key = self._normalize(name)
+                        if key:
+                            aliases[key] = canonical
+            print(f"[Lyrics Index] Loaded {len(aliases)} artist aliases")
+        except OSError as e:
+            print(f"[Lyrics Index] Artist aliases unavailable ({aliases_path}): {e}")
+        return aliases
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Lyrics Index] Failed to load {self.index_path}: {e}")
+            return
+
+        for entry_id, entry in entries.items():
+            self._add_entry(entry_id, entry)
+        print(f"[Lyrics Index] Loaded {len(self._entries)} entries from {self.index_path}")
+
+    def _save(self):
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _normalize(self, text: Optional[str]) -> str:
+        text = unicodedata.normalize("NFKC", text or "").casefold()
+        # Drop "(Official MV)", "[Lyrics]", "feat. X" style decorations
+        text = re.sub(r'\(.*?\)|\[.*?\]|【.*?】|「|」', '', text)
+        text = re.sub(r'\b(feat|ft)\..*$', '', text)
+        return "".join(
+            char for char in text
+            if not char.isspace() and unicodedata.category(char)[0] not in ("P", "S")
+        )
+
+    def _canonical_artist(self, artist: Optional[str]) -> str:
+        key = self._normalize(artist)
+        return self._aliases.get(key, key)
+
+    def _ngrams(self, text: str) -> Set[str]:
+        if len(text) <= self.NGRAM_SIZE:
+            return {text} if text else set()
+        return {text[i:i + self.NGRAM_SIZE] for i in range(len(text) - self.NGRAM_SIZE + 1)}
+
+    def _similarity(self, a: Set[str], b: Set[str]) -> float:
+        if not a or not b:
+            return 0.0
+        return 2 * len(a & b) / (len(a) + len(b))
+
+    def _add_entry(self, entry_id: str, entry: Dict):
+        title_key = self._normalize(entry.get("title"))
+        if not title_key:
+            return
+        entry["title_key"] = title_key
+        entry["artist_key"] = self._canonical_artist(entry.get("artist"))
+        self._entries[entry_id] = entry
+        for gram in self._ngrams(title_key):
+            self._postings.setdefault(gram, set()).add(entry_id)
+
+    def lookup(self, title: Optional[str], artist: Optional[str]) -> Optional[Tuple[str, float]]:
+        """Return ``(lyrics_text, score)`` for the best match above ``min_score``."""
+        title_key = self._normalize(title)
+        artist_key = self._canonical_artist(artist)
+        if not title_key or not artist_key:
+            return None
+        title_grams = self._ngrams(title_key)
+        artist_grams = self._ngrams(artist_key)
+
+        with self._lock:
+            candidate_ids: Set[str] = set()
+            for gram in title_grams:
+                candidate_ids.update(self._postings.get(gram, ()))
+
+            best: Optional[Tuple[str, float]] = None
+            for entry_id in candidate_ids:
+                entry = self._entries[entry_id]
+                title_score = self._similarity(title_grams, self._ngrams(entry["title_key"]))
+                if title_score < self.MIN_TITLE_SCORE:
+                    continue
+                artist_score = self._similarity(artist_grams, self._ngrams(entry["artist_key"]))
+                if artist_score < self.MIN_ARTIST_SCORE:
+                    continue
+                score = self.TITLE_WEIGHT * title_score + self.ARTIST_WEIGHT * artist_score
+                if score >= self.min_score and (best is None or score > best[1]):
+                    best = (entry["lyrics"], score)
+
+        return best
+
+    def add(self, title: Optional[str], artist: Optional[str], lyrics_text: str):
+        title_key = self._normalize(title)
+        artist_key = self._canonical_artist(artist)
+        # Entries without an artist could never be matched by ``lookup``
+        if not title_key or not artist_key or not lyrics_text:
+            return
+        entry_id = f"{title_key}\t{artist_key}"
+        entry = {
+            "title": title,
+            "artist": artist,
+            "lyrics": lyrics_text,
+            "fetched_at": int(time.time()),
+        }
+        with self._lock:
+            self._add_entry(entry_id, entry)
+            try:
+                self._save()
+            except OSError as e:
+                print(f"[Lyrics Index] Failed to persist index: {e}")
+
+
+lyrics_index = LyricsIndex()
@@ -0,0 +1,165 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+import torch
+from src.config import MODEL_MEMORY_BUDGET_MB
+
+
+class _ModelEntry:
+    def __init__(self, model: Any, footprint: int, release: Optional[Callable[[Any], None]]):
+        self.model = model
+        self.footprint = footprint
+        self.release = release
+        self.last_used = time.time()
+        self.users = 0  # active leases
+        self.retired = False  # released while leased; disposed by the last lease
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models shared by all processors.
+
+    Each model is loaded once under a string key and kept resident until the
+    configured memory budget would be exceeded, at which point the least
+    recently used models are released. Footprints are measured as the change
+    in CUDA allocated memory (or process RSS on CPU) across the loader call;
+    ``size_hint_mb`` covers allocations torch cannot see, e.g. ONNX Runtime.
+
+    Jobs run concurrently, so code that uses a model across a whole call
+    takes it through ``lease``: leased models are never evicted, and an
+    explicit ``release`` of a leased model is deferred until the last lease
+    ends, so release hooks never run under a job still using the model.
+    """
+
+    def __init__(self, budget_mb: int = MODEL_MEMORY_BUDGET_MB):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self._entries: "OrderedDict[str, _ModelEntry]" = OrderedDict()
+        # Guards the cache only; loaders run outside it under a per-name lock
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def _memory_in_use(self) -> int:
+        if torch.cuda.is_available():
+            return torch.cuda.memory_allocated()
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return 0
+
+    def _resident_bytes(self) -> int:
+        return sum(entry.footprint for entry in self._entries.values())
+
+    def _evict_until(self, required_bytes: int, keep: Optional[str] = None):
+        if self.budget_bytes <= 0:
+            return
+        for name in list(self._entries.keys()):
+            if self._resident_bytes() + required_bytes <= self.budget_bytes:
+                break
+            if name == keep or self._entries[name].users:
+                continue
+            self.release(name)
+
+    def _acquire(self, name: str, loader: Callable[[], Any], release: Optional[Callable[[Any], None]],
+                 size_hint_mb: float, lease: bool) -> _ModelEntry:
+        with self._lock:
+            entry = self._touch(name, lease)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Loads of one name are serialized; other models stay available meanwhile
+        with load_lock:
+            with self._lock:
+                entry = self._touch(name, lease)
+                if entry is not None:
+                    return entry
+                size_hint = int(size_hint_mb * 1024 * 1024)
+                self._evict_until(size_hint)
+
+            # Concurrent loads of other models can inflate this delta; it only steers eviction
+            before = self._memory_in_use()
+            started = time.time()
+            model = loader()
+            footprint = max(self._memory_in_use() - before, size_hint, 0)
+
+            with self._lock:
+                entry = _ModelEntry(model, footprint, release)
+                if lease:
+                    entry.users += 1
+                self._entries[name] = entry
+                print(f"[Models] Loaded {name} in {time.time() - started:.1f}s "
+                      f"({footprint / 1024 / 1024:.0f} MB, resident {self._resident_bytes() / 1024 / 1024:.0f} MB)")
+                self._evict_until(0, keep=name)
+                return entry
+
+    def _touch(self, name: str, lease: bool) -> Optional[_ModelEntry]:
+        entry = self._entries.get(name)
+        if entry is not None:
+            self._entries.move_to_end(name)
+            entry.last_used = time.time()
+            if lease:
+                entry.users += 1
+        return entry
+
+    def get(self, name: str, loader: Callable[[], Any],
+            release: Optional[Callable[[Any], None]] = None,
+            size_hint_mb: float = 0) -> Any:
+        return self._acquire(name, loader, release, size_hint_mb, lease=False).model
+
+    @contextmanager
+    def lease(self, name: str, loader: Callable[[], Any],
+              release: Optional[Callable[[Any], None]] = None,
+              size_hint_mb: float = 0) -> Iterator[Any]:
+        """``get`` the model and keep it resident until the ``with`` block exits."""
+        entry = self._acquire(name, loader, release, size_hint_mb, lease=True)
+        try:
+            yield entry.model
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.retired and entry.users == 0:
+                    self._dispose(name, entry)
+                elif entry.users == 0:
+                    # Evictions skipped while this model was leased can happen now
+                    self._evict_until(0)
+
+    def release(self, name: str):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is None:
+                return
+            if entry.users:
+                # Dropped from the cache now; the last lease runs the release hook
+                entry.retired = True
+                print(f"[Models] Releasing {name} once its {entry.users} active job(s) finish")
+                return
+            self._dispose(name, entry)
+
+    def _dispose(self, name: str, entry: _ModelEntry):
+        with self._lock:
+            if entry.release:
+                try:
+                    entry.release(entry.model)
+                except Exception as e:
+                    print(f"[Models] Release hook for {name} failed: {e}")
+            # Leases may still hold the entry; drop the model reference itself
+            entry.model = None
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            print(f"[Models] Released {name} (resident {self._resident_bytes() / 1024 / 1024:.0f} MB)")
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                name: {"footprint_mb": round(entry.footprint / 1024 / 1024, 1), "last_used": entry.last_used,
+                       "users": entry.users}
+                for name, entry in self._entries.items()
+            }
+
+
+model_registry = ModelRegistry()
@@ -1,6 +1,7 @@
 import json
 import time
 import pika
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Dict, Any
 from src.config import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS, QUEUE_NAMES
 
@@ -60,20 +61,30 @@ class RabbitMQService:
             ),
         )
 
-    def consume(self, queue: str, callback: Callable[[Dict[str, Any]], None]):
+    def consume(self, queue: str, callback: Callable[[Dict[str, Any]], None], concurrency: int = 1):
         if not self.channel or self.channel.is_closed:
             self._connect()
 
-        def on_message(ch, method, properties, body):
+        executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+        connection = self.connection
+
+        def handle(ch, method, body, run_on_connection):
             try:
                 message = json.loads(body)
                 callback(message)
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+                run_on_connection(lambda: ch.basic_ack(delivery_tag=method.delivery_tag))
             except Exception as e:
                 print(f"Error processing message: {e}")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                run_on_connection(lambda: ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False))
+
+        def on_message(ch, method, properties, body):
+            if executor is None:
+                handle(ch, method, body, lambda action: action())
+            else:
+                # pika channels are not thread-safe; acks go back through the connection's loop
+                executor.submit(handle, ch, method, body, connection.add_callback_threadsafe)
 
-        self.channel.basic_qos(prefetch_count=1)
+        self.channel.basic_qos(prefetch_count=concurrency)
         self.channel.basic_consume(queue=queue, on_message_callback=on_message)
         print(f"Waiting for messages on {queue}...")
         self.channel.start_consuming()
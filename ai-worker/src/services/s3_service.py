@@ -36,11 +36,38 @@ class S3Service:
                 s3_key,
                 ExtraArgs={"ContentType": self._get_content_type(local_path)},
             )
-            return f"https://{self.bucket}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+            return self.get_url(s3_key)
         except ClientError as e:
             print(f"Error uploading {local_path}: {e}")
             raise
 
+    def exists(self, s3_key: str) -> bool:
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=s3_key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def copy_prefix(self, source_prefix: str, dest_prefix: str) -> int:
+        """Server-side copy of every object under ``source_prefix``; returns the object count."""
+        copied = 0
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        try:
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=source_prefix):
+                for obj in page.get("Contents", []):
+                    dest_key = dest_prefix + obj["Key"][len(source_prefix):]
+                    self.s3_client.copy({"Bucket": self.bucket, "Key": obj["Key"]}, self.bucket, dest_key)
+                    copied += 1
+        except ClientError as e:
+            print(f"Error copying {source_prefix} to {dest_prefix}: {e}")
+            raise
+        return copied
+
+    def get_url(self, s3_key: str) -> str:
+        return f"https://{self.bucket}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+
     def _get_content_type(self, filepath: str) -> str:
         ext = os.path.splitext(filepath)[1].lower()
         content_types = {
@@ -49,6 +76,10 @@ class S3Service:
             ".wav": "audio/wav",
             ".flac": "audio/flac",
             ".json": "application/json",
+            ".gz": "application/gzip",
+            ".m3u8": "application/vnd.apple.mpegurl",
+            ".m4s": "audio/mp4",
+            ".mp4": "audio/mp4",
         }
         return content_types.get(ext, "application/octet-stream")
 
@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+import numpy as np
+from src.config import (
+    SEPARATION_BATCH_MAX_SIZE,
+    SEPARATION_BATCH_MAX_WAIT_MS,
+    SEPARATION_BATCH_LATENCY_BUDGET_MS,
+)
+
+
+class SeparationBatcher:
+    """Packs fixed-length segments from concurrent jobs into shared model batches.
+
+    Each ``run`` call submits one job's segments and blocks until its own
+    outputs come back. A single dispatcher thread drains the queue, waiting at
+    most ``max_wait_ms`` for other jobs to contribute segments, runs one model
+    call per batch and routes the output rows back to their callers.
+
+    The batch size adapts to the latency budget: a batch that takes longer
+    than ``latency_budget_ms`` halves the size, one well under budget grows
+    it by one, bounded by ``max_batch``.
+    """
+
+    def __init__(self, run_batch: Callable[[np.ndarray], np.ndarray],
+                 max_batch: int = SEPARATION_BATCH_MAX_SIZE,
+                 max_wait_ms: float = SEPARATION_BATCH_MAX_WAIT_MS,
+                 latency_budget_ms: float = SEPARATION_BATCH_LATENCY_BUDGET_MS):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.latency_budget = latency_budget_ms / 1000
+        self.batch_size = self.max_batch
+        self._queue: "queue.Queue[Tuple[np.ndarray, int, list, list, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="separation-batcher", daemon=True)
+        self._thread.start()
+
+    def run(self, segments: np.ndarray) -> np.ndarray:
+        """``(n, channels, samples)`` -> ``(n, stems, channels, samples)`` via shared batches."""
+        future: Future = Future()
+        outputs: list = [None] * len(segments)
+        remaining = [len(segments)]
+        for i in range(len(segments)):
+            self._queue.put((segments[i], i, outputs, remaining, future))
+        return future.result()
+
+    def _collect(self) -> List[Tuple[np.ndarray, int, list, list, Future]]:
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _adapt(self, elapsed: float):
+        if elapsed > self.latency_budget and self.batch_size > 1:
+            self.batch_size = max(1, self.batch_size // 2)
+            print(f"[Batcher] Batch took {elapsed * 1000:.0f}ms, shrinking to {self.batch_size}")
+        elif elapsed < self.latency_budget / 2 and self.batch_size < self.max_batch:
+            self.batch_size += 1
+
+    def _dispatch_loop(self):
+        while True:
+            items = self._collect()
+            started = time.monotonic()
+            try:
+                results = self.run_batch(np.stack([item[0] for item in items]))
+            except Exception as e:
+                for *_, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._adapt(time.monotonic() - started)
+
+            for (_, index, outputs, remaining, future), result in zip(items, results):
+                if future.done():
+                    continue
+                outputs[index] = result
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    future.set_result(np.stack(outputs))
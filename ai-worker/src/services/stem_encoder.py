@@ -0,0 +1,139 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import soundfile as sf
+from src.config import (
+    TEMP_DIR,
+    STEM_ENCODER_WORKERS,
+    STEM_DELIVERY_FORMAT,
+    STEM_DELIVERY_BITRATE,
+    STEM_HLS_ENABLED,
+    STEM_HLS_BITRATE,
+    STEM_HLS_SEGMENT_SEC,
+    STEM_PEAKS_ENABLED,
+    STEM_PEAKS_LEVELS,
+)
+from src.services.s3_service import s3_service
+from src.utils.audio import AudioBuffer, AudioSource, load_mono
+from src.utils.peaks import encode_peaks
+from src.utils.flac_index import FlacFrameTable, read_frame_table
+
+
+class StemEncoder:
+    """Encodes stems and uploads them on a background thread pool.
+
+    Each stem is written as FLAC (archival) and, when ``STEM_DELIVERY_FORMAT``
+    is set, as a compressed delivery rendition. With ``STEM_HLS_ENABLED`` a
+    low-bitrate Opus rendition is also packaged as short fMP4 segments with
+    a VOD HLS playlist, so players can start after the first segment, and
+    ``STEM_PEAKS_ENABLED`` adds a small waveform peaks file for the player.
+    Object URLs are known up front, so callers can hand them out immediately
+    and only wait on the returned futures before reporting the job as
+    complete. Stems are in-memory ``AudioBuffer`` objects or FLAC files
+    (whole-file and file-streaming separation), so every separation path
+    delivers the same renditions.
+    """
+
+    def __init__(self, max_workers: int = STEM_ENCODER_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stem-encoder")
+
+    def _encode_flac(self, source: AudioSource, output_path: str) -> FlacFrameTable:
+        if isinstance(source, AudioBuffer):
+            sf.write(output_path, source.interleaved(), source.sample_rate, format="FLAC")
+        else:
+            shutil.copyfile(source, output_path)
+        # Frame offsets feed the lyric-line seek index once lyrics are known
+        return read_frame_table(output_path)
+
+    def _encode_peaks(self, source: AudioSource, output_path: str):
+        if isinstance(source, AudioBuffer):
+            samples, sample_rate = source.samples, source.sample_rate
+        else:
+            sample_rate = sf.info(source).samplerate
+            samples = load_mono(source, sample_rate)
+        with open(output_path, "wb") as f:
+            f.write(encode_peaks(samples, sample_rate, STEM_PEAKS_LEVELS))
+
+    def _encode_ffmpeg(self, source: AudioSource, output_path: str, codec_args: List[str]):
+        if isinstance(source, AudioBuffer):
+            input_args = ["-f", "f32le", "-ar", str(source.sample_rate), "-ac", str(source.channels), "-i", "pipe:0"]
+            stdin = source.interleaved().tobytes()
+        else:
+            input_args, stdin = ["-i", source], None
+        cmd = ["ffmpeg", "-y", "-loglevel", "error", *input_args, *codec_args, output_path]
+        result = subprocess.run(cmd, input=stdin, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed for {output_path}: {result.stderr.decode(errors='replace')}")
+
+    def _encode_and_upload(self, encode, source: AudioSource, local_path: str, s3_key: str):
+        try:
+            encoded = encode(source, local_path)
+            s3_service.upload_file(local_path, s3_key)
+            return encoded
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    def _package_hls(self, source: AudioSource, song_id: str, stem: str, s3_prefix: str):
+        output_dir = os.path.join(TEMP_DIR, f"{song_id}_{stem}_hls")
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            self._encode_ffmpeg(source, os.path.join(output_dir, "playlist.m3u8"), [
+                "-c:a", "libopus", "-b:a", STEM_HLS_BITRATE,
+                "-f", "hls",
+                "-hls_time", str(STEM_HLS_SEGMENT_SEC),
+                "-hls_playlist_type", "vod",
+                "-hls_segment_type", "fmp4",
+                "-hls_fmp4_init_filename", "init.mp4",
+                "-hls_segment_filename", os.path.join(output_dir, "segment_%04d.m4s"),
+            ])
+            # Playlist last, so it never references a segment that is not uploaded yet
+            for file_name in sorted(os.listdir(output_dir), key=lambda name: name.endswith(".m3u8")):
+                s3_service.upload_file(os.path.join(output_dir, file_name), f"{s3_prefix}/{file_name}")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def submit(self, source: AudioSource, song_id: str, folder_name: str, stem: str) -> Tuple[Dict[str, str], List[Future]]:
+        """Queue encodes for one stem; returns ``({format: url}, futures)``.
+
+        ``source`` is an ``AudioBuffer`` or a FLAC file, which must exist
+        until the futures finish. ``format`` is the file extension, or
+        ``"hls"`` for the playlist URL. The first future is the FLAC encode;
+        it resolves to the file's ``FlacFrameTable``.
+        """
+        jobs = [("flac", self._encode_flac)]
+        if STEM_DELIVERY_FORMAT == "opus":
+            jobs.append(("opus", lambda source, path: self._encode_ffmpeg(
+                source, path, ["-c:a", "libopus", "-b:a", STEM_DELIVERY_BITRATE, "-vbr", "on"])))
+        if STEM_PEAKS_ENABLED:
+            jobs.append(("peaks", self._encode_peaks))
+
+        urls: Dict[str, str] = {}
+        futures: List[Future] = []
+        for ext, encode in jobs:
+            s3_key = f"songs/{folder_name}/{stem}.{ext}"
+            local_path = os.path.join(TEMP_DIR, f"{song_id}_{stem}_encoded.{ext}")
+            urls[ext] = s3_service.get_url(s3_key)
+            futures.append(self.executor.submit(self._encode_and_upload, encode, source, local_path, s3_key))
+
+        if STEM_HLS_ENABLED:
+            s3_prefix = f"songs/{folder_name}/hls/{stem}"
+            urls["hls"] = s3_service.get_url(f"{s3_prefix}/playlist.m3u8")
+            futures.append(self.executor.submit(self._package_hls, source, song_id, stem, s3_prefix))
+        return urls, futures
+
+    def wait(self, futures: List[Future]):
+        """Block until all futures finish; re-raises the first failure."""
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+
+stem_encoder = StemEncoder()
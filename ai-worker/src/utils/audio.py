@@ -0,0 +1,287 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+
+# Native-rate frames decoded per read when streaming a file
+STREAM_BLOCK_FRAMES = 65536
+
+
+class AudioBuffer:
+    """Decoded float32 audio held in memory, shaped ``(channels, samples)``.
+
+    Stages that need a mono view at their own sample rate share one resampled
+    copy per rate, so e.g. the 16 kHz vocals used by pitch, energy and onset
+    refinement are only resampled once per job. Analyses derived from the
+    audio (e.g. the FCPE pitch track) are shared the same way via ``memo``.
+    """
+
+    def __init__(self, samples: np.ndarray, sample_rate: int):
+        self.samples = np.atleast_2d(samples).astype(np.float32, copy=False)
+        self.sample_rate = sample_rate
+        self._mono_cache: Dict[int, np.ndarray] = {}
+        self._memo: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "AudioBuffer":
+        try:
+            samples, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+        except RuntimeError:
+            return _decode_fully(path, None, mono=False)
+        return cls(samples.T, sample_rate)
+
+    def __repr__(self) -> str:
+        return f"AudioBuffer({self.channels}ch, {self.sample_rate} Hz, {self.duration:.1f}s)"
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def duration(self) -> float:
+        return self.samples.shape[1] / self.sample_rate
+
+    def mono(self, sample_rate: int) -> np.ndarray:
+        with self._lock:
+            cached = self._mono_cache.get(sample_rate)
+            if cached is None:
+                cached = self.samples.mean(axis=0)
+                if sample_rate != self.sample_rate:
+                    cached = librosa.resample(cached, orig_sr=self.sample_rate, target_sr=sample_rate)
+                cached = cached.astype(np.float32, copy=False)
+                self._mono_cache[sample_rate] = cached
+            return cached
+
+    def memo(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Compute ``key`` once for this buffer; later callers get the cached value."""
+        with self._memo_lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return self._memo[key]
+
+    def has_memo(self, key: str) -> bool:
+        return key in self._memo
+
+    def interleaved(self) -> np.ndarray:
+        """Samples as ``(samples, channels)``, the layout encoders expect."""
+        return np.ascontiguousarray(self.samples.T)
+
+
+AudioSource = Union[str, AudioBuffer]
+
+
+class StreamResampler:
+    """Stateful resampler for audio that arrives in blocks.
+
+    Wraps libsoxr's streaming resampler at librosa's default quality
+    (``soxr_hq``), so block-wise output matches ``librosa.resample`` of the
+    whole signal while only the filter state is kept between ``process``
+    calls. ``flush`` pads or trims the tail so a stream of ``n`` samples
+    yields exactly ``ceil(n * out_rate / in_rate)`` samples.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, channels: int = 1):
+        self.in_rate, self.out_rate = in_rate, out_rate
+        self._stream = soxr.ResampleStream(in_rate, out_rate, channels, dtype="float32", quality="HQ")
+        self._empty = np.zeros((0, channels) if channels > 1 else 0, dtype=np.float32)
+        self._consumed = 0  # input samples seen
+        self._emitted = 0  # output samples produced
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Resample the next block (``(samples,)`` or ``(samples, channels)``); may lag until ``flush``."""
+        out = self._stream.resample_chunk(np.ascontiguousarray(block, dtype=np.float32))
+        self._consumed += len(block)
+        self._emitted += len(out)
+        return out
+
+    def flush(self) -> np.ndarray:
+        """Remaining output for the end of the stream."""
+        out = self._stream.resample_chunk(self._empty, last=True)
+        remaining = -(-self._consumed * self.out_rate // self.in_rate) - self._emitted
+        if len(out) < remaining:
+            out = np.concatenate([out, np.zeros((remaining - len(out),) + out.shape[1:], dtype=np.float32)])
+        out = out[:max(0, remaining)]
+        self._emitted += len(out)
+        return out
+
+
+def stream_mono(source: AudioSource, sample_rate: int, block_size: int) -> Iterator[np.ndarray]:
+    """Mono float32 blocks of ``block_size`` samples at ``sample_rate`` (the last may be shorter).
+
+    Files are decoded and resampled block by block, so memory stays
+    constant regardless of track length.
+    """
+    if isinstance(source, AudioBuffer):
+        mono = source.mono(sample_rate)
+        for start in range(0, len(mono), block_size):
+            yield mono[start:start + block_size]
+        return
+
+    try:
+        f = sf.SoundFile(source)
+    except RuntimeError:
+        yield from stream_mono(_decode_fully(source, sample_rate), sample_rate, block_size)
+        return
+
+    with f:
+        resampler = StreamResampler(f.samplerate, sample_rate) if f.samplerate != sample_rate else None
+        pending = []
+        pending_len = 0
+
+        def resampled():
+            for block in f.blocks(blocksize=STREAM_BLOCK_FRAMES, dtype="float32", always_2d=True):
+                mono = block.mean(axis=1)
+                yield resampler.process(mono) if resampler else mono
+            if resampler:
+                yield resampler.flush()
+
+        for chunk in resampled():
+            pending.append(chunk)
+            pending_len += len(chunk)
+            if pending_len < block_size:
+                continue
+            joined = np.concatenate(pending)
+            full = len(joined) // block_size * block_size
+            for start in range(0, full, block_size):
+                yield joined[start:start + block_size]
+            pending, pending_len = [joined[full:]], len(joined) - full
+        if pending_len:
+            yield np.concatenate(pending)
+
+
+def stream_channels(path: str, sample_rate: int, block_frames: int = STREAM_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """``(channels, samples)`` float32 blocks of a file at ``sample_rate``.
+
+    The multichannel counterpart of ``stream_mono``: blocks run through a
+    multichannel ``StreamResampler``, so memory stays constant regardless
+    of track length and input sample rate.
+    """
+    try:
+        f = sf.SoundFile(path)
+    except RuntimeError:
+        audio = np.atleast_2d(_decode_fully(path, sample_rate, mono=False).samples)
+        for start in range(0, audio.shape[1], block_frames):
+            yield audio[:, start:start + block_frames]
+        return
+
+    with f:
+        blocks = f.blocks(blocksize=block_frames, dtype="float32", always_2d=True)
+        if f.samplerate == sample_rate:
+            for block in blocks:
+                yield block.T
+            return
+
+        resampler = StreamResampler(f.samplerate, sample_rate, f.channels)
+        for block in blocks:
+            out = resampler.process(block if f.channels > 1 else block[:, 0])
+            if len(out):
+                yield np.atleast_2d(out.T)
+        tail = resampler.flush()
+        if len(tail):
+            yield np.atleast_2d(tail.T)
+
+
+def _decode_fully(path: str, sample_rate: Optional[int], mono: bool = True) -> AudioBuffer:
+    # Containers libsndfile cannot read (e.g. m4a uploads) go through librosa in one piece
+    audio, sample_rate = librosa.load(path, sr=sample_rate, mono=mono)
+    return AudioBuffer(audio, sample_rate)
+
+
+def ensure_soundfile(path: str, output_dir: str) -> str:
+    """``path`` if libsndfile can stream it, else a FLAC transcode of it in ``output_dir``.
+
+    Streaming readers (``stream_channels``, ``stream_length``, ``sf.info``)
+    need a libsndfile format; uploads in e.g. m4a are decoded once here.
+    """
+    try:
+        sf.info(path)
+        return path
+    except RuntimeError:
+        pass
+    buffer = _decode_fully(path, None, mono=False)
+    output_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(path))[0]}_decoded.flac")
+    sf.write(output_path, buffer.interleaved(), buffer.sample_rate, format="FLAC")
+    return output_path
+
+
+def stream_length(source: AudioSource, sample_rate: int) -> int:
+    """Number of samples ``stream_mono(source, sample_rate, ...)`` yields in total."""
+    if isinstance(source, AudioBuffer):
+        return len(source.mono(sample_rate))
+    info = sf.info(source)
+    return -(-info.frames * sample_rate // info.samplerate)
+
+
+class MonoStream:
+    """Forward-only random access over ``stream_mono``.
+
+    Reads must not start before the last ``release`` point; released
+    samples are dropped, so chunked consumers that walk a track in order
+    hold only their current window in memory.
+    """
+
+    def __init__(self, source: AudioSource, sample_rate: int, block_size: int = 1 << 18):
+        try:
+            self.total = stream_length(source, sample_rate)
+        except RuntimeError:
+            source = _decode_fully(source, sample_rate)
+            self.total = stream_length(source, sample_rate)
+        self._blocks = stream_mono(source, sample_rate, block_size)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._start = 0  # stream index of _buffer[0]
+
+    def read(self, start: int, length: int) -> np.ndarray:
+        """Samples ``[start, start + length)``, zero-padded past the end of the stream."""
+        if start < self._start:
+            raise ValueError(f"MonoStream is forward-only: {start} < {self._start}")
+        needed = start + length - self._start
+        parts = [self._buffer]
+        available = len(self._buffer)
+        while available < needed:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            parts.append(block)
+            available += len(block)
+        if len(parts) > 1:
+            self._buffer = np.concatenate(parts)
+        out = self._buffer[start - self._start:needed]
+        if len(out) < length:
+            out = np.pad(out, (0, length - len(out)))
+        return out
+
+    def release(self, before: int):
+        """Drop samples before ``before``; later reads must start at or after it."""
+        drop = min(max(0, before - self._start), len(self._buffer))
+        self._buffer = self._buffer[drop:].copy()  # a view would pin the whole old buffer
+        self._start += drop
+
+
+def load_mono(source: AudioSource, sample_rate: int) -> np.ndarray:
+    """Mono float32 audio at ``sample_rate`` from a file path or an ``AudioBuffer``."""
+    if isinstance(source, AudioBuffer):
+        return source.mono(sample_rate)
+    try:
+        total = stream_length(source, sample_rate)
+    except RuntimeError:
+        return _decode_fully(source, sample_rate).mono(sample_rate)
+    # Decoded and resampled block-wise into the output: peak memory is the output plus one block
+    audio = np.zeros(total, dtype=np.float32)
+    filled = 0
+    for block in stream_mono(source, sample_rate, 1 << 20):
+        block = block[:total - filled]
+        audio[filled:filled + len(block)] = block
+        filled += len(block)
+    return audio
+
+
+def audio_duration(source: AudioSource) -> float:
+    if isinstance(source, AudioBuffer):
+        return source.duration
+    return sf.info(source).duration
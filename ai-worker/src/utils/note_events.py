@@ -0,0 +1,119 @@
+"""Note events segmented from a frame-level pitch track (``notes.json``).
+
+Scoring compares a singer against notes instead of every 10 ms frame.
+Segmentation uses hysteresis on the (median-smoothed) MIDI pitch: a note
+only ends when the pitch leaves its band by more than ``exit_semitones``
+for ``change_frames`` consecutive frames, so vibrato and scoops stay one
+note, and unvoiced gaps up to ``max_gap_frames`` are bridged.
+
+Each event::
+
+    {"start": 1.23, "end": 1.57, "midi": 60, "cents": -12, "stability": 0.93,
+     "line": 0, "word": 2}
+
+``cents`` is the median deviation from ``midi``; ``stability`` is the share
+of frames within 50 cents of the note's median pitch. ``line``/``word``
+index the lyric word the note overlaps most and are omitted without one.
+"""
+
+import warnings
+from typing import Dict, List, Optional
+import numpy as np
+
+NOTES_VERSION = 1
+
+
+def _median_smooth(midi: np.ndarray, voiced: np.ndarray, width: int) -> np.ndarray:
+    """Median over ``width`` frames, using voiced neighbours only."""
+    half = width // 2
+    padded = np.pad(np.where(voiced, midi, np.nan), half, constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)
+    with warnings.catch_warnings():
+        # All-NaN windows (unvoiced stretches) are masked out below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        smoothed = np.nanmedian(windows, axis=1)
+    return np.where(voiced, smoothed, np.nan)
+
+
+def segment_notes(
+    f0: np.ndarray,
+    frame_period: float,
+    exit_semitones: float = 0.7,
+    change_frames: int = 5,
+    max_gap_frames: int = 3,
+    min_frames: int = 6,
+    smooth_frames: int = 5,
+) -> List[Dict]:
+    """Note events of an f0 track (Hz, 0 or NaN = unvoiced)."""
+    f0 = np.nan_to_num(np.asarray(f0, dtype=np.float64), nan=0.0)
+    voiced = f0 > 0
+    midi = np.zeros_like(f0)
+    midi[voiced] = 69 + 12 * np.log2(f0[voiced] / 440.0)
+    smoothed = _median_smooth(midi, voiced, smooth_frames)
+
+    segments = []  # (first, last) frame, inclusive
+    start = center = None
+    last_voiced = departed = 0
+    for i in np.flatnonzero(voiced):
+        pitch = smoothed[i]
+        if start is not None and i - last_voiced - 1 > max_gap_frames:
+            segments.append((start, last_voiced))
+            start = None
+        if start is None:
+            start, center, departed = i, pitch, 0
+        elif abs(pitch - center) > exit_semitones:
+            departed += 1
+            if departed >= change_frames:
+                # The new note began where the pitch first left the band
+                boundary = i - departed + 1
+                segments.append((start, boundary - 1))
+                start, center, departed = boundary, float(np.median(smoothed[boundary:i + 1][voiced[boundary:i + 1]])), 0
+        else:
+            departed = 0
+            # Follow slow drift within the note without letting vibrato move the band
+            center += 0.05 * (pitch - center)
+        last_voiced = i
+    if start is not None:
+        segments.append((start, last_voiced))
+
+    events = []
+    for first, last in segments:
+        frames = voiced[first:last + 1]
+        if frames.sum() < min_frames:
+            continue
+        pitches = midi[first:last + 1][frames]
+        median = float(np.median(pitches))
+        note = int(round(median))
+        events.append({
+            "start": round(first * frame_period, 3),
+            "end": round((last + 1) * frame_period, 3),
+            "midi": note,
+            "cents": int(round((median - note) * 100)),
+            "stability": round(float(np.mean(np.abs(pitches - median) <= 0.5)), 3),
+        })
+    return events
+
+
+def align_to_words(events: List[Dict], lines: Optional[List[Dict]]) -> List[Dict]:
+    """Tag each event with the lyric ``line``/``word`` it overlaps most (in place)."""
+    words = [
+        (line_index, word_index, word.get("start_time", 0), word.get("end_time", 0))
+        for line_index, line in enumerate(lines or [])
+        for word_index, word in enumerate(line.get("words", []))
+        if word.get("end_time", 0) > word.get("start_time", 0)
+    ]
+    if not words:
+        return events
+
+    starts = np.array([w[2] for w in words])
+    ends = np.array([w[3] for w in words])
+    for event in events:
+        overlap = np.minimum(ends, event["end"]) - np.maximum(starts, event["start"])
+        best = int(np.argmax(overlap))
+        if overlap[best] > 0:
+            event["line"], event["word"] = words[best][0], words[best][1]
+    return events
+
+
+def notes_document(events: List[Dict], frame_period: float) -> Dict:
+    return {"version": NOTES_VERSION, "frame_period": frame_period, "notes": events}
@@ -0,0 +1,62 @@
+"""Multi-resolution min/max waveform peaks for the player UI.
+
+Binary layout (little-endian)::
+
+    header   4s   magic b"KPKS"
+             B    version (1)
+             B    level count N
+             H    reserved (0)
+             I    sample rate of the source audio
+             I    source length in samples
+    levels   N x (I samples_per_pixel, I pixel_count), finest first
+    data     per level, pixel_count x (b min, b max), int8 scaled to +-127
+
+A 3-minute stem at the default levels is roughly 10 KB.
+"""
+
+import struct
+from typing import Sequence
+import numpy as np
+
+PEAKS_MAGIC = b"KPKS"
+PEAKS_VERSION = 1
+
+
+def compute_peaks(samples: np.ndarray, samples_per_pixel: int) -> np.ndarray:
+    """``(pixels, 2)`` min/max of mono ``samples`` per ``samples_per_pixel`` block."""
+    pixels = -(-len(samples) // samples_per_pixel)
+    padded = np.zeros(pixels * samples_per_pixel, dtype=np.float32)
+    padded[:len(samples)] = samples
+    blocks = padded.reshape(pixels, samples_per_pixel)
+    return np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1)
+
+
+def _coarsen(peaks: np.ndarray, factor: int) -> np.ndarray:
+    pixels = -(-len(peaks) // factor)
+    padded = np.zeros((pixels * factor, 2), dtype=peaks.dtype)
+    padded[:len(peaks)] = peaks
+    blocks = padded.reshape(pixels, factor, 2)
+    return np.stack([blocks[:, :, 0].min(axis=1), blocks[:, :, 1].max(axis=1)], axis=1)
+
+
+def encode_peaks(samples: np.ndarray, sample_rate: int, levels: Sequence[int]) -> bytes:
+    """Serialize peaks of ``samples`` (mono, or ``(channels, samples)`` mixed down)."""
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=0)
+    levels = sorted(levels)
+
+    # Coarser levels are reduced from the finest one when they divide evenly
+    finest = compute_peaks(samples, levels[0])
+    tables = []
+    for samples_per_pixel in levels:
+        if samples_per_pixel % levels[0] == 0:
+            tables.append(_coarsen(finest, samples_per_pixel // levels[0]))
+        else:
+            tables.append(compute_peaks(samples, samples_per_pixel))
+
+    parts = [struct.pack("<4sBBHII", PEAKS_MAGIC, PEAKS_VERSION, len(levels), 0, sample_rate, len(samples))]
+    parts.extend(struct.pack("<II", spp, len(table)) for spp, table in zip(levels, tables))
+    for table in tables:
+        parts.append(np.clip(np.round(table * 127), -127, 127).astype(np.int8).tobytes())
+    return b"".join(parts)
@@ -0,0 +1,62 @@
+"""Chunk layout and stitching for frame-level pitch inference.
+
+Long audio is inferred in equal-length, overlapping chunks. A chunk of
+``length`` samples yields ``length // hop + 1`` frames (frame ``i`` centred
+on sample ``i * hop``); ``fit_frames`` enforces that count so chunk offsets
+and frame indices stay in step. ``stitch`` cuts each overlap at its
+midpoint, so every frame comes from the chunk where it has the most
+context. ``voiced_regions`` turns VAD spans into the sample ranges worth
+inferring at all.
+"""
+
+from typing import List, Tuple
+import numpy as np
+
+
+def chunk_starts(total: int, chunk: int, overlap: int) -> List[int]:
+    """Equal-length chunk offsets; the last chunk ends at ``total``.
+
+    ``chunk`` and ``overlap`` should be multiples of the hop so every offset is.
+    """
+    if total <= chunk:
+        return [0]
+    step = chunk - overlap
+    return list(range(0, total - chunk, step)) + [total - chunk]
+
+
+def fit_frames(f0: np.ndarray, frames: int) -> np.ndarray:
+    """``f0`` trimmed or zero-padded (unvoiced) to ``frames`` along its last axis."""
+    missing = frames - f0.shape[-1]
+    if missing < 0:
+        return f0[..., :frames]
+    if missing > 0:
+        return np.pad(f0, [(0, 0)] * (f0.ndim - 1) + [(0, missing)])
+    return f0
+
+
+def stitch(starts: List[int], outputs: List[np.ndarray], hop: int) -> np.ndarray:
+    """Join chunk outputs (frames from ``starts[0]``), cutting each overlap at its midpoint."""
+    offsets = [(start - starts[0]) // hop for start in starts]
+    ends = [offset + len(f0) for offset, f0 in zip(offsets, outputs)]
+    f0 = np.zeros(max(ends), dtype=np.float32)
+    for i, (offset, chunk_f0) in enumerate(zip(offsets, outputs)):
+        # Each side keeps the half of the overlap that is farther from its own edge
+        lo = offset if i == 0 else (offset + ends[i - 1]) // 2
+        hi = ends[i] if i == len(offsets) - 1 else (offsets[i + 1] + ends[i]) // 2
+        f0[lo:hi] = chunk_f0[lo - offset:hi - offset]
+    return f0
+
+
+def voiced_regions(spans: List[Tuple[float, float]], total: int, hop: int, sample_rate: int,
+                   pad_sec: float, min_gap_sec: float) -> List[Tuple[int, int]]:
+    """Padded, merged voice spans (seconds) as hop-aligned ``(start, end)`` sample ranges in ``[0, total]``."""
+    regions: List[List[int]] = []
+    for start_sec, end_sec in spans:
+        start = max(0, int((start_sec - pad_sec) * sample_rate) // hop * hop)
+        end = min(total, -(-int((end_sec + pad_sec) * sample_rate) // hop) * hop)
+        # Short gaps cost less to infer through than an extra chunk edge
+        if regions and start - regions[-1][1] < min_gap_sec * sample_rate:
+            regions[-1][1] = max(regions[-1][1], end)
+        elif end > start:
+            regions.append([start, end])
+    return [(start, end) for start, end in regions]
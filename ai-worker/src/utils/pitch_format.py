@@ -0,0 +1,99 @@
+"""Compact columnar pitch track (``pitch.bin.gz``).
+
+The whole file is gzip-compressed. Decompressed layout (little-endian)::
+
+    header   4s   magic b"KPCH"
+             B    version (1)
+             B    flags (0)
+             H    reserved (0)
+             f    frame period in seconds (0.01 for FCPE)
+             I    voiced frame count N
+    columns  N x uint32   frame index delta (first entry: absolute index)
+             N x int16    frequency in cents relative to A4 = 440 Hz
+             N x uint8    confidence scaled to 0-255
+
+Frame ``i`` starts at ``frame_index * frame_period``. Cents quantization
+keeps frequencies within 0.5 cent; MIDI numbers and note names are derived
+by the reader instead of being stored per frame.
+
+Coarser levels of detail (``pitch/{ms}ms.bin.gz``) use the same layout
+with a longer frame period; see ``reduce_pitch``.
+"""
+
+import gzip
+import struct
+import warnings
+from typing import Dict, Tuple
+import numpy as np
+
+PITCH_MAGIC = b"KPCH"
+PITCH_VERSION = 1
+_HEADER = struct.Struct("<4sBBHfI")
+
+
+def encode_pitch_track(frames: np.ndarray, frequency: np.ndarray, confidence: np.ndarray,
+                       frame_period: float) -> bytes:
+    """Serialize voiced frames (``frames`` ascending, ``frequency`` > 0 Hz)."""
+    frames = np.asarray(frames, dtype=np.int64)
+    deltas = np.diff(frames, prepend=0).astype("<u4")
+    cents = np.clip(np.round(1200 * np.log2(np.asarray(frequency, dtype=np.float64) / 440.0)), -32768, 32767)
+    scaled_confidence = np.clip(np.round(np.asarray(confidence) * 255), 0, 255)
+
+    payload = b"".join([
+        _HEADER.pack(PITCH_MAGIC, PITCH_VERSION, 0, 0, frame_period, len(frames)),
+        deltas.tobytes(),
+        cents.astype("<i2").tobytes(),
+        scaled_confidence.astype(np.uint8).tobytes(),
+    ])
+    return gzip.compress(payload, compresslevel=9)
+
+
+def decode_pitch_track(data: bytes) -> Dict[str, np.ndarray]:
+    """Columns ``time``, ``frequency``, ``confidence`` and ``midi`` of a pitch track."""
+    payload = gzip.decompress(data)
+    magic, version, _, _, frame_period, count = _HEADER.unpack_from(payload)
+    if magic != PITCH_MAGIC or version != PITCH_VERSION:
+        raise ValueError(f"Unsupported pitch track: {magic!r} v{version}")
+
+    offset = _HEADER.size
+    deltas = np.frombuffer(payload, dtype="<u4", count=count, offset=offset)
+    offset += 4 * count
+    cents = np.frombuffer(payload, dtype="<i2", count=count, offset=offset)
+    offset += 2 * count
+    confidence = np.frombuffer(payload, dtype=np.uint8, count=count, offset=offset)
+
+    frames = np.cumsum(deltas, dtype=np.int64)
+    return {
+        "time": frames * np.float64(frame_period),
+        "frequency": 440.0 * 2 ** (cents / 1200.0),
+        "confidence": confidence / 255.0,
+        "midi": np.round(69 + cents / 100.0).astype(np.int32),
+    }
+
+
+def transpose_pitch_track(data: bytes, semitones: int) -> bytes:
+    """Shift every frequency of an encoded track by ``semitones``."""
+    payload = bytearray(gzip.decompress(data))
+    count = _HEADER.unpack_from(payload)[5]
+    offset = _HEADER.size + 4 * count
+    cents = np.frombuffer(payload, dtype="<i2", count=count, offset=offset).astype(np.int32) + 100 * semitones
+    payload[offset:offset + 2 * count] = np.clip(cents, -32768, 32767).astype("<i2").tobytes()
+    return gzip.compress(bytes(payload), compresslevel=9)
+
+
+def reduce_pitch(f0: np.ndarray, factor: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Downsample an f0 track by ``factor`` frames per output frame.
+
+    A block is voiced when most of its frames are; its frequency is the
+    median of its voiced frames and its confidence the voiced share.
+    """
+    f0 = np.nan_to_num(np.asarray(f0, dtype=np.float64), nan=0.0)
+    blocks = np.pad(f0, (0, -len(f0) % factor)).reshape(-1, factor)
+    voiced = blocks > 0
+    share = voiced.mean(axis=1)
+    with warnings.catch_warnings():
+        # Fully unvoiced blocks give NaN and are zeroed below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(np.where(voiced, blocks, np.nan), axis=1)
+    majority = voiced.sum(axis=1) * 2 > factor
+    return np.where(majority, median, 0.0), np.where(majority, share, 0.0)
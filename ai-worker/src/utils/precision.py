@@ -0,0 +1,112 @@
+"""Reduced-precision (bf16/fp16) inference, gated by a float32 calibration check.
+
+``apply_precision`` wraps a module's ``forward`` in ``torch.autocast`` and
+casts its outputs back to float32, so callers keep feeding and receiving
+float32 tensors. Before the wrapper is kept, the model runs a small
+synthetic calibration set in float32 and again in reduced precision; if
+the caller's acceptance check fails, the module is restored and stays in
+float32.
+"""
+
+import functools
+from typing import Any, Callable, List, Optional, Tuple
+import numpy as np
+import torch
+from src.config import INFERENCE_PRECISION
+
+PRECISION_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def _cpu_has_fast_bf16() -> bool:
+    # AVX512-BF16 / AMX; without them bf16 on CPU is emulated and slower than fp32
+    for probe in ("_is_amx_tile_supported", "_is_avx512_bf16_supported"):
+        check = getattr(torch.cpu, probe, None)
+        if check is not None and check():
+            return True
+    return False
+
+
+def resolve_dtype(device: str, setting: str = INFERENCE_PRECISION) -> Optional[torch.dtype]:
+    """Autocast dtype for ``device``, or None for plain float32."""
+    if setting == "fp32":
+        return None
+    if setting == "auto":
+        if device == "cuda":
+            return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        return torch.bfloat16 if _cpu_has_fast_bf16() else None
+    if setting not in PRECISION_DTYPES:
+        raise ValueError(f"Unknown inference precision: {setting}")
+    return PRECISION_DTYPES[setting]
+
+
+def _to_float32(output: Any) -> Any:
+    if isinstance(output, torch.Tensor):
+        return output.float() if output.is_floating_point() else output
+    if isinstance(output, (tuple, list)):
+        return type(output)(_to_float32(item) for item in output)
+    return output
+
+
+def _wrap_forward(module: torch.nn.Module, device_type: str, dtype: torch.dtype) -> Callable:
+    original = module.forward
+
+    @functools.wraps(original)
+    def forward(*args, **kwargs):
+        with torch.autocast(device_type=device_type, dtype=dtype):
+            output = original(*args, **kwargs)
+        return _to_float32(output)
+
+    module.forward = forward
+    return original
+
+
+def apply_precision(
+    name: str,
+    module: torch.nn.Module,
+    device: str,
+    run: Callable[[np.ndarray], np.ndarray],
+    calibration: List[np.ndarray],
+    accept: Callable[[List[np.ndarray], List[np.ndarray]], Tuple[bool, str]],
+) -> Optional[torch.dtype]:
+    """Switch ``module`` to reduced precision if ``accept`` passes on ``calibration``.
+
+    ``run`` performs one full inference (through ``module``) on a calibration
+    input; ``accept(references, outputs)`` compares float32 and reduced
+    precision results and returns ``(ok, summary)``.
+    """
+    dtype = resolve_dtype(device)
+    if dtype is None:
+        return None
+
+    with torch.no_grad():
+        references = [run(x) for x in calibration]
+        original = _wrap_forward(module, device, dtype)
+        try:
+            outputs = [run(x) for x in calibration]
+            ok, summary = accept(references, outputs)
+        except Exception as e:
+            ok, summary = False, f"calibration failed: {e}"
+
+    label = str(dtype).replace("torch.", "")
+    if not ok:
+        module.forward = original
+        print(f"[Precision] {name}: keeping float32, {label} rejected ({summary})")
+        return None
+    print(f"[Precision] {name}: running in {label} ({summary})")
+    return dtype
+
+
+def snr_db(reference: np.ndarray, output: np.ndarray) -> float:
+    noise = np.sum((reference - output) ** 2)
+    return float(10 * np.log10(np.sum(reference ** 2) / max(noise, 1e-20)))
+
+
+def synthetic_voice(sample_rate: int, seconds: float, seed: int) -> np.ndarray:
+    """Harmonic glide with vibrato and a gap, for calibration inputs."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    f0 = rng.uniform(150, 400) * 2 ** (t / seconds * rng.uniform(-1, 1)) * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    voice[(t > seconds * 0.45) & (t < seconds * 0.55)] = 0
+    return (0.3 * voice / np.abs(voice).max() + 0.005 * rng.standard_normal(len(t))).astype(np.float32)
@@ -3,13 +3,30 @@ import json
 import re
 import subprocess
 import requests
+from concurrent.futures import wait
 from typing import Dict, Any, Optional
-from src.config import REDIS_HOST, REDIS_PORT, QUEUE_NAMES, TEMP_DIR, BACKEND_API_URL
+from src.config import (
+    REDIS_HOST,
+    REDIS_PORT,
+    QUEUE_NAMES,
+    TEMP_DIR,
+    BACKEND_API_URL,
+    WORKER_CONCURRENCY,
+    FINGERPRINT_ENABLED,
+    HIGHLIGHT_ENABLED,
+    HIGHLIGHT_SOURCE,
+)
 from src.services.rabbitmq_service import rabbitmq_service
 from src.services.s3_service import s3_service
+from src.services.stem_encoder import stem_encoder
+from src.services.fingerprint_index import fingerprint_index
+from src.utils.flac_index import line_seek_index
+from src.utils.audio import AudioBuffer
 from src.processors.separator_processor import separator_processor
 from src.processors.lyrics_processor import lyrics_processor
 from src.processors.fcpe_processor import fcpe_processor
+from src.processors.transpose_processor import transpose_processor
+from src.processors.highlight_processor import highlight_processor
 
 # Validate required environment variables at module load time
 PROCESSING_SECRET = os.environ.get('PROCESSING_SECRET')
@@ -23,6 +40,16 @@ def sanitize_folder_name(name: str) -> str:
     name = name.strip('._')
     return name[:100] if len(name) > 100 else name
 
+def _rebase_urls(value: Any, old_prefix: str, new_prefix: str) -> Any:
+    """``value`` with every string starting with ``old_prefix`` moved to ``new_prefix``."""
+    if isinstance(value, dict):
+        return {key: _rebase_urls(item, old_prefix, new_prefix) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rebase_urls(item, old_prefix, new_prefix) for item in value]
+    if isinstance(value, str) and value.startswith(old_prefix):
+        return new_prefix + value[len(old_prefix):]
+    return value
+
 try:
     import redis as redis_lib
 except ImportError:
@@ -92,6 +119,11 @@ class AIWorker:
 
         print(f"Processing song {song_id} ({folder_name}): {tasks}, source: {source}")
 
+        if set(tasks) == {"transpose"}:
+            # Key renditions only need the stored stems and pitch; no download
+            self._process_transpose(song_id, folder_name, message.get("semitones"))
+            return
+
         self._update_status(song_id, "processing", "Downloading audio...", step="download")
 
         local_audio_path = None
@@ -115,32 +147,63 @@ class AIWorker:
             return
 
         results = {"song_id": song_id}
+        mixture_path = local_audio_path
+        stem_buffers = {}
+        vocals_buffer = None
+        frame_tables = {}
+        pending_uploads = []
 
         try:
-            if "separate" in tasks:
+            fingerprint, match = self._match_fingerprint(song_id, local_audio_path)
+            reused = self._adopt_reused(match, folder_name, self._reusable_results(match, tasks))
+            if reused:
+                results["fingerprint_match"] = {k: match[k] for k in ("song_id", "offset_sec", "ber")}
+
+            stems = self._requested_stems(tasks)
+            if "separation" in reused:
+                print(f"Reusing stems of {match['song_id']}, copied into songs/{folder_name}/")
+                results["separation"] = reused["separation"]
+            elif stems:
                 self._update_status(song_id, "processing", "음원 분리 중...", step="separation", progress=0)
                 separation_result = separator_processor.separate(
                     local_audio_path, song_id, folder_name,
-                    progress_callback=lambda p: self._update_status(song_id, "processing", f"음원 분리 중... {p}%", step="separation", progress=p)
+                    progress_callback=lambda p: self._update_status(song_id, "processing", f"음원 분리 중... {p}%", step="separation", progress=p),
+                    stems=stems,
                 )
+                # In-memory stems feed the next stages directly; encodes finish in the background
+                stem_buffers = separation_result.pop("stems", {})
+                vocals_buffer = stem_buffers.get("vocals")
+                frame_tables = separation_result.pop("frame_tables", {})
+                pending_uploads.extend(separation_result.pop("pending", []))
                 results["separation"] = separation_result
 
                 vocals_path = os.path.join(TEMP_DIR, song_id, "vocals.flac")
                 if os.path.exists(vocals_path):
                     local_audio_path = vocals_path
 
-            if "lyrics" in tasks:
-                self._update_status(song_id, "processing", "가사 추출 중...", step="lyrics", progress=0)
-                vocals_path = results.get("separation", {}).get("vocals_url")
-                audio_for_lyrics = local_audio_path
+            if "instrumental" in tasks and "instrumental" not in stems and "separation" not in reused:
+                self._update_status(song_id, "processing", "반주 생성 중...", step="separation")
+                separation_result = results.setdefault("separation", {})
+                if vocals_buffer is None:
+                    # The stored vocals are downloaded; their background upload must be complete
+                    stem_encoder.wait(pending_uploads)
+                separation_result["instrumental_url"] = separator_processor.materialize_instrumental(
+                    mixture_path, song_id, folder_name, vocals=vocals_buffer
+                )
+
+            # Lyrics and pitch share one decoded buffer, so the pitch stage reuses
+            # the pitch track memoized on it by the lyrics stage
+            analysis_audio = vocals_buffer
 
-                if vocals_path and "vocals.flac" in vocals_path:
-                    temp_vocals = os.path.join(TEMP_DIR, f"{song_id}_vocals.flac")
-                    s3_service.download_file(f"songs/{folder_name}/vocals.flac", temp_vocals)
-                    audio_for_lyrics = temp_vocals
+            if "lyrics" in reused:
+                results["lyrics"] = reused["lyrics"]
+            elif "lyrics" in tasks:
+                self._update_status(song_id, "processing", "가사 추출 중...", step="lyrics", progress=0)
+                if analysis_audio is None:
+                    analysis_audio = self._analysis_audio(song_id, folder_name, results, local_audio_path)
 
                 lyrics_result = lyrics_processor.extract_lyrics(
-                    audio_for_lyrics,
+                    analysis_audio,
                     song_id,
                     language=message.get("language"),  # None = auto-detect
                     folder_name=folder_name,
@@ -150,23 +213,39 @@ class AIWorker:
                 )
                 results["lyrics"] = lyrics_result
 
-            if "pitch" in tasks:
+            if "pitch" in reused:
+                results["pitch"] = reused["pitch"]
+            elif "pitch" in tasks:
                 self._update_status(song_id, "processing", "음정 분석 중...", step="fcpe", progress=0)
-                vocals_path = results.get("separation", {}).get("vocals_url")
-                audio_for_pitch = local_audio_path
-
-                if vocals_path and "vocals.flac" in vocals_path:
-                    temp_vocals = os.path.join(TEMP_DIR, f"{song_id}_vocals.flac")
-                    if not os.path.exists(temp_vocals):
-                        s3_service.download_file(f"songs/{folder_name}/vocals.flac", temp_vocals)
-                    audio_for_pitch = temp_vocals
+                if analysis_audio is None:
+                    analysis_audio = self._analysis_audio(song_id, folder_name, results, local_audio_path)
 
                 pitch_result = fcpe_processor.analyze_pitch(
-                    audio_for_pitch, song_id, folder_name,
-                    progress_callback=lambda p: self._update_status(song_id, "processing", f"음정 분석 중... {p}%", step="fcpe", progress=p)
+                    analysis_audio, song_id, folder_name,
+                    progress_callback=lambda p: self._update_status(song_id, "processing", f"음정 분석 중... {p}%", step="fcpe", progress=p),
+                    lyrics_lines=results.get("lyrics", {}).get("lyrics"),
                 )
                 results["pitch"] = pitch_result
 
+            if "highlight" in tasks or (HIGHLIGHT_ENABLED and "lyrics" in results):
+                self._update_status(song_id, "processing", "미리듣기 생성 중...", step="highlight")
+                results["highlight"] = self._extract_highlight(
+                    song_id, folder_name, mixture_path, stem_buffers, results.get("lyrics", {}).get("lyrics")
+                )
+
+            stem_encoder.wait(pending_uploads)
+            lyric_lines = results.get("lyrics", {}).get("lyrics")
+            if frame_tables and lyric_lines:
+                results["separation"]["seek_index_urls"] = self._upload_seek_indexes(
+                    song_id, folder_name, frame_tables, lyric_lines
+                )
+
+            if "transpose" in tasks:
+                self._update_status(song_id, "processing", "키 변경 반주 생성 중...", step="transpose")
+                results["transpose"] = self._render_keys(song_id, folder_name, message.get("semitones"))
+
+            if fingerprint is not None:
+                self._index_fingerprint(song_id, folder_name, fingerprint, results)
             self._update_status(song_id, "completed", "Processing complete", results)
             self._send_callback_to_backend(song_id, results)
             print(f"Song {song_id} processing complete")
@@ -176,9 +255,136 @@ class AIWorker:
             print(f"Error processing song {song_id}: {error_msg}")
             self._update_status(song_id, "failed", error_msg)
 
+        finally:
+            # Encoders read from the temp directory; never clean up under them
+            wait(pending_uploads)
+            self._cleanup_temp_files(song_id)
+
+    def _analysis_audio(self, song_id: str, folder_name: str, results: Dict[str, Any], audio_path: str) -> AudioBuffer:
+        """The stored vocals when this song has them, else ``audio_path``, decoded once."""
+        vocals_url = results.get("separation", {}).get("vocals_url")
+        if vocals_url and "vocals.flac" in vocals_url:
+            audio_path = os.path.join(TEMP_DIR, f"{song_id}_vocals.flac")
+            s3_service.download_file(f"songs/{folder_name}/vocals.flac", audio_path)
+        return AudioBuffer.from_file(audio_path)
+
+    def _upload_seek_indexes(self, song_id: str, folder_name: str, frame_tables: Dict, lines: list) -> Dict[str, str]:
+        """Upload ``{stem}.seek.json`` mapping each lyric line to a FLAC byte range."""
+        urls = {}
+        for stem, frame_table in frame_tables.items():
+            local_path = os.path.join(TEMP_DIR, f"{song_id}_{stem}.seek.json")
+            try:
+                with open(local_path, "w", encoding="utf-8") as f:
+                    json.dump(line_seek_index(frame_table.result(), lines), f)
+                urls[stem] = s3_service.upload_file(local_path, f"songs/{folder_name}/{stem}.seek.json")
+            finally:
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+        return urls
+
+    def _extract_highlight(self, song_id: str, folder_name: str, mixture_path: str, stem_buffers: Dict, lines) -> Dict:
+        """Preview clip from the mixture (or the in-memory instrumental); never fails the job."""
+        source = mixture_path
+        if HIGHLIGHT_SOURCE == "instrumental" and stem_buffers.get("instrumental") is not None:
+            source = stem_buffers["instrumental"]
+        try:
+            return highlight_processor.extract(source, song_id, folder_name, lines)
+        except Exception as e:
+            print(f"Highlight extraction failed for {song_id}: {e}")
+            return {}
+
+    def _render_keys(self, song_id: str, folder_name: str, semitones) -> list:
+        if semitones is None:
+            return []
+        offsets = semitones if isinstance(semitones, list) else [semitones]
+        return [transpose_processor.render(song_id, folder_name, int(offset)) for offset in offsets]
+
+    def _process_transpose(self, song_id: str, folder_name: str, semitones):
+        """Render (or look up) key-shifted renditions; reported via Redis status only.
+
+        The processing callback is not sent: it would overwrite the song's
+        lyrics with the empty list of this partial job.
+        """
+        try:
+            self._update_status(song_id, "processing", "키 변경 반주 생성 중...", step="transpose")
+            renditions = self._render_keys(song_id, folder_name, semitones)
+            self._update_status(song_id, "completed", "Transposition complete", {"song_id": song_id, "transpose": renditions})
+        except Exception as e:
+            print(f"Error transposing song {song_id}: {e}")
+            self._update_status(song_id, "failed", str(e))
         finally:
             self._cleanup_temp_files(song_id)
 
+    def _match_fingerprint(self, song_id: str, audio_path: str):
+        """Fingerprint the downloaded mixture and look it up; never fails the job.
+
+        The song's own entry is excluded, so reprocessing a song recomputes it.
+        """
+        if not FINGERPRINT_ENABLED:
+            return None, None
+        try:
+            fingerprint = fingerprint_index.fingerprint(audio_path)
+            return fingerprint, fingerprint_index.lookup(fingerprint, exclude=song_id)
+        except Exception as e:
+            print(f"Fingerprint lookup failed: {e}")
+            return None, None
+
+    def _index_fingerprint(self, song_id: str, folder_name: str, fingerprint, results: Dict[str, Any]):
+        """Record this job's results in the fingerprint index; never fails the job."""
+        try:
+            if results.get("separation"):
+                fingerprint_index.add(song_id, folder_name, fingerprint, results)
+        except Exception as e:
+            print(f"Fingerprint indexing failed: {e}")
+
+    def _reusable_results(self, match: Optional[Dict], tasks: list) -> Dict[str, Any]:
+        """Stages of a matched song this job can take over instead of recomputing.
+
+        Stems are reused when they cover the requested ones. Stems, lyrics and
+        pitch timings all follow the matched upload's timeline, so nothing is
+        reused unless the uploads are aligned (offset under 50 ms).
+        """
+        if not match or abs(match["offset_sec"]) >= 0.05:
+            return {}
+        previous = match["results"]
+        reused = {}
+        separation = previous.get("separation") or {}
+        wanted_stems = set(self._requested_stems(tasks))
+        if "instrumental" in tasks:
+            wanted_stems.add("instrumental")
+        if wanted_stems and all(separation.get(f"{stem}_url") for stem in wanted_stems):
+            reused["separation"] = separation
+
+        for stage in ("lyrics", "pitch"):
+            if stage in tasks and previous.get(stage):
+                reused[stage] = previous[stage]
+        return reused
+
+    def _adopt_reused(self, match: Optional[Dict], folder_name: str, reused: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy the matched song's objects into ``folder_name`` and point ``reused`` at the copies.
+
+        Each song owns its folder, so deleting or reprocessing the matched
+        song never breaks this one. A failed copy drops the reuse instead.
+        """
+        if not reused or match["folder_name"] == folder_name:
+            return reused
+        source_prefix, dest_prefix = f"songs/{match['folder_name']}/", f"songs/{folder_name}/"
+        try:
+            copied = s3_service.copy_prefix(source_prefix, dest_prefix)
+        except Exception as e:
+            print(f"Copying reused objects of {match['song_id']} failed, recomputing: {e}")
+            return {}
+        print(f"Copied {copied} objects from {source_prefix} to {dest_prefix}")
+        return _rebase_urls(reused, s3_service.get_url(source_prefix), s3_service.get_url(dest_prefix))
+
+    def _requested_stems(self, tasks: list) -> tuple:
+        """Stems to materialize: "separate" wants both, "separate_vocals" only vocals."""
+        if "separate" in tasks:
+            return ("vocals", "instrumental")
+        if "separate_vocals" in tasks:
+            return ("vocals",)
+        return ()
+
     def _update_status(self, song_id: str, status: str, message: str, results: Dict = None, step: str = None, progress: int = None):
         status_data = {
             "song_id": song_id,
@@ -206,9 +412,21 @@ class AIWorker:
                 "status": "completed",
                 "vocalsUrl": separation.get("vocals_url"),
                 "instrumentalUrl": separation.get("instrumental_url"),
+                "deliveryUrls": separation.get("delivery_urls"),
+                "streamingUrls": separation.get("streaming_urls"),
+                "peaksUrls": separation.get("peaks_urls"),
+                "seekIndexUrls": separation.get("seek_index_urls"),
+                "previewUrl": results.get("highlight", {}).get("preview_url"),
+                "previewStartTime": results.get("highlight", {}).get("start_time"),
                 "lyrics": lyrics_result.get("lyrics", []),
                 "duration": lyrics_result.get("duration"),
             }
+            # Partial jobs must not clear stems produced by an earlier run
+            for key in ("vocalsUrl", "instrumentalUrl", "deliveryUrls", "streamingUrls", "peaksUrls", "seekIndexUrls", "previewUrl"):
+                if not callback_data[key]:
+                    del callback_data[key]
+            if "previewUrl" not in callback_data:
+                del callback_data["previewStartTime"]
             
             url = f"{BACKEND_API_URL}/api/songs/{song_id}/processing-callback"
             headers = {
@@ -240,7 +458,7 @@ class AIWorker:
 
     def start(self):
         print("AI Worker started. Waiting for messages...")
-        rabbitmq_service.consume(QUEUE_NAMES["audio_process"], self.process_audio)
+        rabbitmq_service.consume(QUEUE_NAMES["audio_process"], self.process_audio, concurrency=WORKER_CONCURRENCY)
 
 
 def main():
@@ -0,0 +1,84 @@
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+
+from src.utils.audio import (
+    AudioBuffer,
+    MonoStream,
+    StreamResampler,
+    load_mono,
+    stream_channels,
+    stream_length,
+    stream_mono,
+)
+
+
+def _signal(seconds: float, sample_rate: int, channels: int = 1, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tones = [np.sin(2 * np.pi * (220 + 110 * c) * t) * 0.3 + rng.normal(0, 0.05, len(t)) for c in range(channels)]
+    return np.stack(tones, axis=1).astype(np.float32)
+
+
+@pytest.mark.parametrize("in_rate,out_rate", [(44100, 16000), (48000, 16000), (48000, 44100), (22050, 44100)])
+@pytest.mark.parametrize("count", [1, 999, 44100 * 3 + 17])
+def test_stream_resampler_length_and_accuracy(in_rate, out_rate, count):
+    x = _signal(count / in_rate + 1, in_rate)[:count, 0]
+    resampler = StreamResampler(in_rate, out_rate)
+    blocks = [resampler.process(x[i:i + 4000]) for i in range(0, count, 4000)]
+    out = np.concatenate(blocks + [resampler.flush()])
+
+    assert len(out) == -(-count * out_rate // in_rate)
+    reference = librosa.resample(x, orig_sr=in_rate, target_sr=out_rate)
+    # Block-wise output matches the whole-signal librosa resample away from the last filter length
+    body = min(len(out), len(reference)) - 64
+    if body > 0:
+        np.testing.assert_allclose(out[:body], reference[:body], atol=1e-4)
+
+
+@pytest.fixture
+def stereo_file(tmp_path):
+    path = tmp_path / "mix.wav"
+    sf.write(path, _signal(5.3, 48000, channels=2), 48000, subtype="FLOAT")
+    return str(path)
+
+
+def test_stream_mono_matches_buffer_mono(stereo_file):
+    blocks = list(stream_mono(stereo_file, 16000, 5000))
+    streamed = np.concatenate(blocks)
+
+    assert all(len(block) == 5000 for block in blocks[:-1])
+    assert len(streamed) == stream_length(stereo_file, 16000)
+    expected = AudioBuffer.from_file(stereo_file).mono(16000)
+    np.testing.assert_allclose(streamed[:len(expected) - 64], expected[:len(expected) - 64], atol=1e-4)
+
+
+def test_load_mono_fills_stream_length(stereo_file):
+    audio = load_mono(stereo_file, 16000)
+    assert audio.dtype == np.float32
+    assert len(audio) == stream_length(stereo_file, 16000)
+    np.testing.assert_array_equal(audio, np.concatenate(list(stream_mono(stereo_file, 16000, 1 << 20))))
+
+
+def test_stream_channels_resamples_each_channel(stereo_file):
+    audio = np.concatenate(list(stream_channels(stereo_file, 44100, block_frames=7000)), axis=1)
+    original = sf.read(stereo_file, dtype="float32")[0].T
+
+    assert audio.shape == (2, -(-original.shape[1] * 44100 // 48000))
+    for channel in range(2):
+        reference = librosa.resample(original[channel], orig_sr=48000, target_sr=44100)
+        np.testing.assert_allclose(audio[channel, :-64], reference[:audio.shape[1] - 64], atol=1e-4)
+
+
+def test_mono_stream_reads_forward_and_pads(stereo_file):
+    stream = MonoStream(stereo_file, 16000, block_size=3000)
+    full = load_mono(stereo_file, 16000)
+
+    np.testing.assert_array_equal(stream.read(100, 5000), full[100:5100])
+    stream.release(4000)
+    tail = stream.read(stream.total - 10, 50)
+    np.testing.assert_array_equal(tail[:10], full[-10:])
+    assert not tail[10:].any()
+    with pytest.raises(ValueError):
+        stream.read(0, 10)
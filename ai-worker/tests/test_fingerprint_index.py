@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from src.services.fingerprint_index import FingerprintIndex
+from src.utils.audio import AudioBuffer
+
+SAMPLE_RATE = 22050
+
+
+def _music(seconds: float, seed: int) -> np.ndarray:
+    """Random note sequence: stable band energies per note, like a real recording."""
+    rng = np.random.default_rng(seed)
+    notes = []
+    for _ in range(int(seconds * 4)):
+        t = np.arange(SAMPLE_RATE // 4) / SAMPLE_RATE
+        freqs = rng.uniform(300, 2000, size=3)
+        notes.append(sum(np.sin(2 * np.pi * f * t) for f in freqs) * np.hanning(len(t)))
+    return np.concatenate(notes).astype(np.float32) * 0.2
+
+
+@pytest.fixture
+def index(tmp_path):
+    return FingerprintIndex(backend="local", index_path=str(tmp_path / "index.json"))
+
+
+def test_self_match_recovers_offset(index):
+    song = _music(20, seed=1)
+    index.add("song-a", "folder-a", index.fingerprint(AudioBuffer(song[None], SAMPLE_RATE)), {"lyrics": {"x": 1}})
+    index.add("song-b", "folder-b", index.fingerprint(AudioBuffer(_music(20, seed=2)[None], SAMPLE_RATE)), {})
+
+    lead = np.random.default_rng(3).normal(0, 0.05, SAMPLE_RATE).astype(np.float32)
+    query = AudioBuffer(np.concatenate([lead, song])[None], SAMPLE_RATE)
+    match = index.lookup(index.fingerprint(query))
+
+    assert match is not None
+    assert match["song_id"] == "song-a"
+    assert match["folder_name"] == "folder-a"
+    assert match["offset_sec"] == pytest.approx(1.0, abs=2 * index.frame_seconds)
+    assert match["results"] == {"lyrics": {"x": 1}}
+
+
+def test_lookup_excludes_the_querying_song(index):
+    song = _music(20, seed=1)
+    fingerprint = index.fingerprint(AudioBuffer(song[None], SAMPLE_RATE))
+    index.add("song-a", "folder-a", fingerprint, {})
+
+    assert index.lookup(fingerprint)["song_id"] == "song-a"
+    assert index.lookup(fingerprint, exclude="song-a") is None
+
+
+def test_unrelated_audio_does_not_match(index):
+    index.add("song-a", "folder-a", index.fingerprint(AudioBuffer(_music(20, seed=1)[None], SAMPLE_RATE)), {})
+
+    assert index.lookup(index.fingerprint(AudioBuffer(_music(20, seed=4)[None], SAMPLE_RATE))) is None
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from src.utils.flac_index import line_seek_index, read_frame_table
+
+SAMPLE_RATE = 44100
+
+
+@pytest.fixture
+def stem(tmp_path):
+    rng = np.random.default_rng(0)
+    t = np.arange(SAMPLE_RATE * 12) / SAMPLE_RATE
+    audio = np.stack([np.sin(2 * np.pi * 220 * t), rng.normal(0, 0.3, len(t))], axis=1) * 0.5
+    path = tmp_path / "vocals.flac"
+    sf.write(path, audio, SAMPLE_RATE, format="FLAC", subtype="PCM_16")
+    return str(path)
+
+
+def test_frame_table_matches_stream_info(stem):
+    info = sf.info(stem)
+    table = read_frame_table(stem)
+
+    assert table.sample_rate == info.samplerate
+    assert table.total_samples == info.frames
+    assert table.frame_samples[0] == 0
+    assert table.frame_offsets[0] == table.audio_offset
+    block_sizes = np.diff(np.append(table.frame_samples, info.frames))
+    # Fixed-blocksize stream: every frame but the last is full, none is missed or doubled
+    assert (block_sizes[:-1] == block_sizes[0]).all()
+    assert 0 < block_sizes[-1] <= block_sizes[0]
+    assert np.all(np.diff(table.frame_offsets) > 0)
+
+
+def test_line_byte_range_covers_the_line(stem):
+    table = read_frame_table(stem)
+    line = {"start_time": 4.25, "end_time": 6.5}
+    entry = line_seek_index(table, [line])["lines"][0]
+
+    first = int(np.searchsorted(table.frame_offsets, entry["byte_start"]))
+    assert table.frame_offsets[first] == entry["byte_start"]
+    assert table.frame_samples[first] == entry["frame_sample"] <= entry["start_sample"]
+    assert first + 1 == len(table.frame_samples) or table.frame_samples[first + 1] > entry["start_sample"]
+    # The range ends right before the first frame starting at or after the line end
+    after = int(np.searchsorted(table.frame_offsets, entry["byte_end"] + 1))
+    assert table.frame_offsets[after] == entry["byte_end"] + 1
+    assert table.frame_samples[after] >= int(line["end_time"] * SAMPLE_RATE) > table.frame_samples[after - 1]
+
+    with open(stem, "rb") as f:
+        data = f.read()
+    # Every indexed offset is a frame sync code
+    assert all(data[offset] == 0xFF and data[offset + 1] & 0xFE == 0xF8 for offset in table.frame_offsets)
+
+
+def test_rejects_non_flac(tmp_path):
+    path = tmp_path / "not.flac"
+    path.write_bytes(b"RIFF" + bytes(64))
+    with pytest.raises(ValueError):
+        read_frame_table(str(path))
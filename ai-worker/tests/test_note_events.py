@@ -0,0 +1,64 @@
+import numpy as np
+
+from src.utils.note_events import align_to_words, notes_document, segment_notes
+
+FRAME = 0.01
+
+
+def _hz(midi, cents=0.0):
+    return 440.0 * 2 ** ((np.asarray(midi, dtype=np.float64) - 69 + cents / 100) / 12)
+
+
+def _contour():
+    """C4 with vibrato, a short unvoiced gap, E4 with a scoop, silence, then G4."""
+    t = np.arange(50)
+    c4 = _hz(60 + 0.3 * np.sin(2 * np.pi * t / 18))  # +-30 cent vibrato
+    gap = np.zeros(2)
+    scoop = _hz(np.linspace(63, 64, 8))
+    e4 = _hz(np.full(40, 64), cents=-10)
+    silence = np.zeros(30)
+    g4 = _hz(np.full(30, 67))
+    return np.concatenate([c4, gap, scoop, e4, silence, g4])
+
+
+def test_segments_synthetic_contour():
+    events = segment_notes(_contour(), FRAME)
+
+    assert [event["midi"] for event in events] == [60, 64, 67]
+    c4, e4, g4 = events
+    assert c4["start"] == 0.0
+    assert c4["stability"] == 1.0
+    # The scoop belongs to E4; its onset is where the pitch left C4's band
+    assert 0.5 <= e4["start"] <= 0.53
+    assert e4["end"] == 1.0
+    assert -15 <= e4["cents"] <= -5
+    assert g4["start"] == 1.3 and g4["end"] == 1.6
+
+
+def test_vibrato_and_short_gaps_stay_one_note():
+    t = np.arange(120)
+    f0 = _hz(62 + 0.5 * np.sin(2 * np.pi * t / 20))
+    f0[40:43] = 0
+    events = segment_notes(f0, FRAME)
+    assert len(events) == 1
+    assert events[0]["midi"] == 62
+    assert events[0]["end"] == 1.2
+
+
+def test_short_blips_and_unvoiced_tracks_yield_nothing():
+    assert segment_notes(np.zeros(100), FRAME) == []
+    blip = np.zeros(100)
+    blip[50:54] = 440.0
+    assert segment_notes(blip, FRAME) == []
+    assert segment_notes(np.full(100, np.nan), FRAME) == []
+
+
+def test_align_to_words_and_document():
+    events = segment_notes(_contour(), FRAME)
+    lines = [{"words": [{"start_time": 0.0, "end_time": 0.45}, {"start_time": 0.5, "end_time": 1.0}]},
+             {"words": [{"start_time": 1.3, "end_time": 1.6}]}]
+
+    aligned = align_to_words(events, lines)
+
+    assert [(event["line"], event["word"]) for event in aligned] == [(0, 0), (0, 1), (1, 0)]
+    assert notes_document(aligned, FRAME) == {"version": 1, "frame_period": FRAME, "notes": aligned}
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from src.utils.pitch_chunks import chunk_starts, fit_frames, stitch, voiced_regions
+
+HOP = 160
+
+
+def _contour(frames: int) -> np.ndarray:
+    """Known f0 (Hz) with unvoiced gaps, one value per 10 ms frame."""
+    f0 = (220 * 2 ** (np.sin(np.arange(frames) / 37.0) / 2)).astype(np.float32)
+    f0[(np.arange(frames) // 90) % 4 == 3] = 0
+    return f0
+
+
+def _infer(f0: np.ndarray, start: int, length: int) -> np.ndarray:
+    """Chunk output as the model would give it: ``length // HOP + 1`` frames, edges corrupted."""
+    out = f0[start // HOP:start // HOP + length // HOP + 1].copy()
+    edge = 20
+    out[:edge] = -1
+    out[-edge:] = -1
+    return out
+
+
+@pytest.mark.parametrize("total", [80 * HOP, 1000 * HOP, 2345 * HOP])
+def test_stitch_reconstructs_contour(total):
+    length, overlap = 300 * HOP, 60 * HOP
+    truth = _contour(total // HOP + 1)
+    starts = chunk_starts(total, length, overlap)
+    length = min(length, total)
+    outputs = [_infer(truth, start, length) for start in starts]
+    # The first and last edges have no neighbour; everything else must come from a chunk interior
+    outputs[0][:20] = truth[:20]
+    outputs[-1][-20:] = truth[-20:]
+
+    f0 = stitch(starts, outputs, HOP)
+
+    np.testing.assert_array_equal(f0, truth)
+
+
+def test_chunk_starts_cover_total_with_equal_chunks():
+    starts = chunk_starts(1000, 300, 60)
+    assert starts[0] == 0
+    assert starts[-1] + 300 == 1000
+    assert all(b - a <= 240 for a, b in zip(starts, starts[1:]))
+    assert chunk_starts(200, 300, 60) == [0]
+
+
+def test_fit_frames_trims_and_pads_along_last_axis():
+    batch = np.ones((2, 10), dtype=np.float32)
+    assert fit_frames(batch, 8).shape == (2, 8)
+    padded = fit_frames(batch, 12)
+    assert padded.shape == (2, 12)
+    assert not padded[:, 10:].any()
+    assert fit_frames(batch, 10) is batch
+
+
+def test_voiced_regions_pad_align_and_merge():
+    spans = [(1.0, 2.0), (2.3, 3.0), (5.0, 6.0), (9.95, 12.0)]
+    total = 10 * 16000
+    regions = voiced_regions(spans, total, HOP, 16000, pad_sec=0.1, min_gap_sec=0.5)
+
+    # The first two spans are closer than min_gap after padding; the last is clamped to total
+    assert regions == [(14400, 49600), (78400, 97600), (157600, total)]
+    assert all(start % HOP == 0 and end % HOP == 0 for start, end in regions)
+
+
+def test_voiced_regions_covers_unaligned_spans():
+    regions = voiced_regions([(0.01234, 0.05678)], 16000, HOP, 16000, pad_sec=0.0, min_gap_sec=0.0)
+    ((start, end),) = regions
+    assert start <= 0.01234 * 16000 and end >= 0.05678 * 16000
+    assert end - start < 0.05678 * 16000 - 0.01234 * 16000 + 2 * HOP
+
+
+def test_voiced_regions_drops_spans_past_the_end():
+    assert voiced_regions([(3.0, 4.0)], 16000, HOP, 16000, pad_sec=0.1, min_gap_sec=0.5) == []
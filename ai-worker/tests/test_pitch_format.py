@@ -0,0 +1,64 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from src.utils.pitch_format import (
+    PITCH_MAGIC,
+    decode_pitch_track,
+    encode_pitch_track,
+    reduce_pitch,
+    transpose_pitch_track,
+)
+
+
+def _track(count: int = 2000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    frames = np.cumsum(rng.integers(1, 4, size=count))
+    frequency = rng.uniform(65, 988, size=count)
+    confidence = rng.uniform(0, 1, size=count)
+    return frames, frequency, confidence
+
+
+def test_round_trip_within_quantization():
+    frames, frequency, confidence = _track()
+    decoded = decode_pitch_track(encode_pitch_track(frames, frequency, confidence, 0.01))
+
+    np.testing.assert_allclose(decoded["time"], frames * 0.01)
+    cents_error = 1200 * np.abs(np.log2(decoded["frequency"] / frequency))
+    assert cents_error.max() <= 0.5 + 1e-9
+    assert np.abs(decoded["confidence"] - confidence).max() <= 0.5 / 255 + 1e-9
+    np.testing.assert_array_equal(decoded["midi"], np.round(69 + 12 * np.log2(decoded["frequency"] / 440)))
+
+
+def test_payload_is_gzipped_columns():
+    frames, frequency, confidence = _track(100)
+    payload = gzip.decompress(encode_pitch_track(frames, frequency, confidence, 0.01))
+    assert payload[:4] == PITCH_MAGIC
+    assert len(payload) == 16 + 100 * (4 + 2 + 1)
+
+
+def test_empty_track_round_trips():
+    decoded = decode_pitch_track(encode_pitch_track(np.zeros(0), np.zeros(0), np.zeros(0), 0.01))
+    assert all(len(column) == 0 for column in decoded.values())
+
+
+def test_decode_rejects_unknown_magic():
+    with pytest.raises(ValueError):
+        decode_pitch_track(gzip.compress(b"XXXX" + bytes(12)))
+
+
+def test_transpose_shifts_by_semitones():
+    frames, frequency, confidence = _track(50)
+    data = encode_pitch_track(frames, frequency, confidence, 0.01)
+    original, shifted = decode_pitch_track(data), decode_pitch_track(transpose_pitch_track(data, 3))
+    np.testing.assert_allclose(shifted["frequency"], original["frequency"] * 2 ** 0.25)
+    np.testing.assert_array_equal(shifted["midi"], original["midi"] + 3)
+    np.testing.assert_array_equal(shifted["time"], original["time"])
+
+
+def test_reduce_pitch_uses_majority_voicing():
+    f0 = np.array([100, 110, 0, 0, 0, 200, 0, 0, 300, 300], dtype=np.float64)
+    frequency, confidence = reduce_pitch(f0, 3)
+    np.testing.assert_allclose(frequency, [105, 0, 0, 0])
+    np.testing.assert_allclose(confidence, [2 / 3, 0, 0, 0])